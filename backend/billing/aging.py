@@ -0,0 +1,87 @@
+"""
+أعمار الذمم المدينة
+
+يُجمَّع الرصيد المستحق لكل عميل (Invoice.balance_due: الإجمالي ناقص المدفوعات
+المكتملة) موزعاً على فترات التأخير حسب تاريخ الاستحقاق، في استعلام مجمّع واحد
+يعيد صفاً لكل (عميل، فترة) ثم يُعاد ترتيبه في الذاكرة.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Q, Sum, Value, When
+
+from .models import Invoice
+
+# (المفتاح، أقل عدد أيام تأخير، أكثر عدد أيام تأخير)؛ None تعني بلا حد
+AGING_BUCKETS = [
+    ('current', None, -1),
+    ('days_0_30', 0, 30),
+    ('days_31_60', 31, 60),
+    ('days_61_90', 61, 90),
+    ('days_90_plus', 91, None),
+]
+
+OPEN_STATUSES = [
+    Invoice.InvoiceStatus.SENT,
+    Invoice.InvoiceStatus.VIEWED,
+    Invoice.InvoiceStatus.OVERDUE,
+]
+
+
+def _bucket_expression(as_of):
+    """اسم فترة التأخير لكل فاتورة (أيام التأخير = تاريخ اليوم - الاستحقاق)"""
+    whens = []
+    for key, min_days, max_days in AGING_BUCKETS:
+        condition = Q()
+        if min_days is not None:
+            condition &= Q(due_date__lte=as_of - timedelta(days=min_days))
+        if max_days is not None:
+            condition &= Q(due_date__gte=as_of - timedelta(days=max_days))
+        whens.append(When(condition, then=Value(key)))
+    return Case(*whens, output_field=CharField())
+
+
+def ar_aging(as_of, client_id=None):
+    """تقرير أعمار الذمم: صف لكل عميل له رصيد مستحق مع الإجماليات"""
+    invoices = Invoice.objects.order_by().filter(status__in=OPEN_STATUSES)
+    if client_id:
+        invoices = invoices.filter(client_id=client_id)
+
+    # صف لكل (عميل، فترة) من عمود الرصيد المستحق مباشرة
+    rows = (
+        invoices.annotate(bucket=_bucket_expression(as_of))
+        .values('client', 'client__company_name', 'bucket')
+        .annotate(amount=Sum('balance_due'))
+        .order_by()
+    )
+
+    bucket_keys = [key for key, _, _ in AGING_BUCKETS]
+    by_client = {}
+    for row in rows:
+        client = by_client.setdefault(row['client'], {
+            'client': row['client'],
+            'client_name': row['client__company_name'],
+            **{key: Decimal('0') for key in bucket_keys + ['total']},
+        })
+        client[row['bucket']] += row['amount'] or 0
+        client['total'] += row['amount'] or 0
+
+    clients = sorted(
+        (client for client in by_client.values() if client['total'] > 0),
+        key=lambda client: client['total'], reverse=True
+    )
+    totals = {
+        key: sum((client[key] for client in clients), Decimal('0'))
+        for key in bucket_keys + ['total']
+    }
+
+    return {
+        'as_of': as_of.isoformat(),
+        'buckets': bucket_keys,
+        'totals': {key: float(value) for key, value in totals.items()},
+        'clients': [
+            {key: float(value) if isinstance(value, Decimal) else value for key, value in client.items()}
+            for client in clients
+        ],
+    }
@@ -0,0 +1,61 @@
+"""
+المبالغ المدفوعة والأرصدة المستحقة للفواتير
+
+يُحدَّث الحقلان amount_paid و balance_due بزيادات ذرية F() عند معالجة الدفعات
+واستردادها، ويُصلحان من مجموع المدفوعات المكتملة عبر أمر reconcile_invoice_balances.
+"""
+
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Invoice, Payment
+
+RECONCILE_CHUNK_SIZE = 1000
+
+_MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def apply_payment(invoice_id, amount):
+    """إضافة مبلغ إلى المدفوع (أو طرحه إذا كان سالباً) وإرجاع الرصيد الجديد"""
+    Invoice.objects.filter(pk=invoice_id).update(
+        amount_paid=F('amount_paid') + amount,
+        balance_due=F('balance_due') - amount,
+    )
+    return Invoice.objects.filter(pk=invoice_id).values_list('balance_due', flat=True).first()
+
+
+def completed_payments_total():
+    """مجموع المدفوعات المكتملة للفاتورة (للاستخدام داخل استعلام الفواتير)"""
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk'), status=Payment.PaymentStatus.COMPLETED)
+        .order_by()
+        .values('invoice')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    return Coalesce(Subquery(paid, output_field=_MONEY), Value(Decimal('0')), output_field=_MONEY)
+
+
+def reconcile(invoices=None):
+    """إصلاح الفواتير التي لا يطابق مدفوعها ورصيدها المدفوعات الفعلية؛ يُرجع عددها"""
+    invoices = (invoices if invoices is not None else Invoice.objects.all()).order_by()
+    mismatched = (
+        invoices.annotate(expected_paid=completed_payments_total())
+        .filter(
+            ~Q(amount_paid=F('expected_paid')) |
+            ~Q(balance_due=F('total_amount') - F('expected_paid'))
+        )
+        .values_list('pk', flat=True)
+    )
+
+    repaired = 0
+    ids = list(mismatched)
+    for start in range(0, len(ids), RECONCILE_CHUNK_SIZE):
+        chunk = ids[start:start + RECONCILE_CHUNK_SIZE]
+        repaired += Invoice.objects.filter(pk__in=chunk).update(
+            amount_paid=completed_payments_total(),
+            balance_due=F('total_amount') - completed_payments_total(),
+        )
+    return repaired
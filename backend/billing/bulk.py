@@ -0,0 +1,139 @@
+"""
+توليد الفواتير جماعياً
+
+تُحسب إجماليات القالب مرة واحدة، ثم تُنشأ الفواتير وعناصرها عبر bulk_create على
+دفعات، كل دفعة في معاملة مستقلة تحجز أرقامها أيضاً، فإذا فشلت دفعة تراجع حجز
+أرقامها معها ولا تبقى فجوات في الترقيم.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from crm.models import Client
+from projects.models import Project
+from .models import Invoice, InvoiceItem, InvoiceBatch
+from . import numbering
+from .signals import billing_data_changed
+
+CHUNK_SIZE = 200
+
+
+def _template_items(template):
+    """عناصر القالب مع مبالغها المحسوبة مرة واحدة"""
+    items = []
+    for order, item in enumerate(template.get('items', [])):
+        quantity = Decimal(str(item.get('quantity', '1')))
+        unit_price = Decimal(str(item['unit_price']))
+        items.append({
+            'description': item['description'],
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'total_amount': quantity * unit_price,
+            'order': item.get('order', order),
+        })
+    return items
+
+
+def generate_batch(batch, progress=lambda percent: None):
+    """إنشاء فواتير الدفعة وإرجاع عددها"""
+    template = batch.template
+    items = _template_items(template)
+    targets = batch.targets
+
+    # التحقق من العملاء والمشاريع باستعلامين بدلاً من استعلام لكل فاتورة
+    client_ids = {target['client'] for target in targets}
+    project_ids = {target['project'] for target in targets if target.get('project')}
+    missing = client_ids - set(Client.objects.filter(pk__in=client_ids).values_list('pk', flat=True))
+    missing_projects = project_ids - set(Project.objects.filter(pk__in=project_ids).values_list('pk', flat=True))
+    errors = []
+    if missing:
+        errors.append(f"عملاء غير موجودين: {sorted(missing)}")
+    if missing_projects:
+        errors.append(f"مشاريع غير موجودة: {sorted(missing_projects)}")
+    if errors:
+        raise ValueError('؛ '.join(errors))
+
+    # الإجماليات متطابقة لجميع فواتير القالب
+    prototype = Invoice(
+        tax_rate=Decimal(str(template.get('tax_rate', '15.00'))),
+        discount_amount=Decimal(str(template.get('discount_amount', '0.00'))),
+    )
+    prototype.apply_totals(item['total_amount'] for item in items)
+
+    status = template.get('status', Invoice.InvoiceStatus.DRAFT)
+    sent_at = timezone.now() if status == Invoice.InvoiceStatus.SENT else None
+
+    created = 0
+    try:
+        for start in range(0, len(targets), CHUNK_SIZE):
+            chunk = targets[start:start + CHUNK_SIZE]
+
+            with transaction.atomic():
+                # قفل العداد يبقى حتى نهاية معاملة الدفعة
+                numbers = numbering.allocate(numbering.INVOICE_PREFIX, count=len(chunk))
+                invoices = [
+                    Invoice(
+                        invoice_number=number,
+                        client_id=target['client'],
+                        project_id=target.get('project'),
+                        issue_date=template['issue_date'],
+                        due_date=template['due_date'],
+                        subtotal=prototype.subtotal,
+                        tax_rate=prototype.tax_rate,
+                        tax_amount=prototype.tax_amount,
+                        discount_amount=prototype.discount_amount,
+                        total_amount=prototype.total_amount,
+                        balance_due=prototype.balance_due,
+                        status=status,
+                        sent_at=sent_at,
+                        notes=template.get('notes', ''),
+                        terms_and_conditions=template.get('terms_and_conditions', ''),
+                        created_by_id=batch.created_by_id,
+                    )
+                    for number, target in zip(numbers, chunk)
+                ]
+                Invoice.objects.bulk_create(invoices)
+                InvoiceItem.objects.bulk_create(
+                    [InvoiceItem(invoice=invoice, **item) for invoice in invoices for item in items],
+                    batch_size=1000
+                )
+                range_update = {'last_number': numbers[-1]}
+                if not created:
+                    range_update['first_number'] = numbers[0]
+                InvoiceBatch.objects.filter(pk=batch.pk).update(**range_update)
+
+            created += len(invoices)
+            InvoiceBatch.objects.filter(pk=batch.pk).update(created_count=created)
+            progress(int(created * 100 / len(targets)))
+    finally:
+        # bulk_create لا يرسل post_save: إبلاغ مستمعي التخزين المؤقت مرة واحدة
+        if created:
+            billing_data_changed.send(sender=Invoice, models=[Invoice])
+    return created
+
+
+def run_batch(batch):
+    """تشغيل الدفعة مع تسجيل الحالة والتقدم والتوقيت"""
+    def progress(percent):
+        InvoiceBatch.objects.filter(pk=batch.pk).update(progress=percent)
+
+    batch.job_status = InvoiceBatch.JobStatus.RUNNING
+    batch.started_at = timezone.now()
+    batch.save(update_fields=['job_status', 'started_at'])
+
+    try:
+        batch.created_count = generate_batch(batch, progress)
+    except Exception as exc:
+        batch.job_status = InvoiceBatch.JobStatus.FAILED
+        batch.error_message = str(exc)
+        batch.finished_at = timezone.now()
+        batch.save(update_fields=['job_status', 'error_message', 'finished_at'])
+        raise
+
+    batch.job_status = InvoiceBatch.JobStatus.COMPLETED
+    batch.progress = 100
+    batch.finished_at = timezone.now()
+    batch.save(update_fields=['job_status', 'progress', 'created_count', 'finished_at'])
+    return batch.created_count
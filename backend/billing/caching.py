@@ -0,0 +1,18 @@
+"""
+التخزين المؤقت لتقارير الفوترة
+
+يزداد إصدار بيانات الفوترة عند أي تعديل على الفواتير أو المدفوعات، فتصبح
+النتائج القديمة غير قابلة للوصول فوراً (انظر idea_platform.caching).
+"""
+
+from idea_platform.caching import VersionedCache
+
+# الإحصائيات تعتمد على تاريخ اليوم (المتأخرات) فتُخزَّن لمدة قصيرة
+STATISTICS_TIMEOUT = 60
+
+_cache = VersionedCache('billing')
+
+data_version = _cache.data_version
+bump = _cache.bump
+cache_key = _cache.cache_key
+get_or_compute = _cache.get_or_compute
@@ -0,0 +1,125 @@
+"""
+الحقول المختارة في قوائم الفوترة (?fields= و ?expand=)
+
+?fields=id,invoice_number,client_name,total_amount,status يحدد حقول الاستجابة،
+و ?expand=items يضيف العلاقات المتداخلة إليها مع ?fields= أو بدونه. القائمة
+الافتراضية لا تتضمن العلاقات المتداخلة (مفاتيح sparse_prefetch_related) إلا عند
+طلبها بـ ?expand=. لا تُجلب إلا العلاقات المطلوبة، وإذا كانت جميع الحقول المطلوبة
+أعمدة بسيطة تُبنى القائمة من values() دون إنشاء كائنات النماذج.
+"""
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+# الإجراءات التي يُطبق عليها اختيار الحقول
+READ_ACTIONS = ('list', 'retrieve')
+
+
+def _split(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+class SparseFieldsetMixin:
+    """
+    مزيج لـ ViewSet يقلص الحقول والاستعلامات حسب ?fields= و ?expand=
+    """
+    # الحقل -> العلاقة التي يحتاجها عبر select_related
+    sparse_select_related = {}
+    # الحقل المتداخل -> العلاقة التي يحتاجها عبر prefetch_related
+    sparse_prefetch_related = {}
+    # الحقل -> المسار في values() للحقول المحسوبة من علاقة؛ الأعمدة المباشرة لا تحتاج تعريفاً
+    sparse_values = {}
+
+    def requested_fields(self):
+        """الحقول المطلوبة، أو None لجميع الحقول (عرض العنصر دون ?fields=)"""
+        if hasattr(self, '_requested_fields'):
+            return self._requested_fields
+
+        requested = None
+        action = getattr(self, 'action', None)
+        if action in READ_ACTIONS:
+            params = self.request.query_params
+            available = set(self.get_serializer_class()().fields)
+            expand = _split(params.get('expand'))
+            unknown = expand - set(self.sparse_prefetch_related)
+            if unknown:
+                raise ValidationError({'expand': f"علاقات غير قابلة للتوسيع: {', '.join(sorted(unknown))}"})
+
+            if 'fields' in params:
+                requested = _split(params.get('fields')) | expand
+                unknown = requested - available
+                if unknown:
+                    raise ValidationError({'fields': f"حقول غير معروفة: {', '.join(sorted(unknown))}"})
+                if not requested:
+                    raise ValidationError({'fields': 'يجب تحديد حقل واحد على الأقل'})
+            elif action == 'list':
+                # القائمة الافتراضية دون العلاقات المتداخلة إلا المطلوبة بـ ?expand=
+                requested = (available - set(self.sparse_prefetch_related)) | expand
+        self._requested_fields = requested
+        return requested
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.requested_fields()
+        if requested is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in requested:
+                    target.fields.pop(name)
+        return serializer
+
+    def apply_sparse_relations(self, queryset):
+        """جلب العلاقات التي تحتاجها الحقول المطلوبة فقط"""
+        requested = self.requested_fields()
+        if requested is None:
+            return queryset.select_related(*set(self.sparse_select_related.values())).prefetch_related(
+                *set(self.sparse_prefetch_related.values())
+            )
+        select = {self.sparse_select_related[name] for name in requested if name in self.sparse_select_related}
+        prefetch = {self.sparse_prefetch_related[name] for name in requested if name in self.sparse_prefetch_related}
+        return queryset.select_related(*select).prefetch_related(*prefetch)
+
+    def _values_lookups(self, fields):
+        """مسار values() لكل حقل مطلوب، أو None إذا احتاج أحدها كائن النموذج"""
+        model = self.get_serializer_class().Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        lookups = {}
+        for name, field in fields.items():
+            if name in self.sparse_values:
+                lookups[name] = self.sparse_values[name]
+            elif field.source in concrete or field.source == 'id':
+                lookups[name] = field.source
+            else:
+                return None
+        return lookups
+
+    def list(self, request, *args, **kwargs):
+        if self.requested_fields() is None:
+            return super().list(request, *args, **kwargs)
+
+        serializer = self.get_serializer(many=True)
+        fields = serializer.child.fields
+        lookups = self._values_lookups(fields)
+        if lookups is None:
+            return super().list(request, *args, **kwargs)
+
+        # حقول بسيطة فقط: صفوف values() بدلاً من كائنات النماذج والعلاقات
+        queryset = self.filter_queryset(self.get_queryset()).values(*set(lookups.values()))
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [self._represent(fields, lookups, row) for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @staticmethod
+    def _represent(fields, lookups, row):
+        data = {}
+        for name, field in fields.items():
+            value = row[lookups[name]]
+            if value is None or isinstance(field, serializers.RelatedField):
+                data[name] = value
+            else:
+                data[name] = field.to_representation(value)
+        return data
@@ -0,0 +1,162 @@
+"""
+كشف حساب العميل
+
+يُبنى الكشف باستعلام واحد: اتحاد (UNION ALL) الفواتير الصادرة كمدين والمدفوعات
+المكتملة كدائن، مع رصيد تراكمي عبر SUM() OVER. التصفح بالمؤشر (keyset): يحمل
+المؤشر موضع آخر قيد ورصيده، فيُقرأ من كل جدول عدد صفحة واحدة فقط بعد المؤشر
+عبر الفهرس، ويبقى زمن الصفحة ثابتاً مهما طال تاريخ العميل.
+"""
+
+from datetime import date
+from decimal import Decimal
+
+from django.core import signing
+from django.db import connection
+from django.db.models import Sum
+
+from .models import Invoice, Payment
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# القيود في اليوم نفسه: الفواتير قبل المدفوعات
+INVOICE_ENTRY, PAYMENT_ENTRY = 0, 1
+
+# الفواتير التي لا تظهر في الكشف
+EXCLUDED_INVOICE_STATUSES = (Invoice.InvoiceStatus.DRAFT, Invoice.InvoiceStatus.CANCELLED)
+
+CURSOR_SALT = 'billing.ledger'
+
+
+class InvalidCursor(ValueError):
+    """مؤشر تصفح غير صالح"""
+
+
+def encode_cursor(entry):
+    return signing.dumps(
+        [entry['date'].isoformat(), entry['kind_order'], entry['source_id'], str(entry['balance'])],
+        salt=CURSOR_SALT, compress=True
+    )
+
+
+def decode_cursor(value):
+    """(التاريخ، نوع القيد، المعرف، الرصيد) لآخر قيد في الصفحة السابقة"""
+    try:
+        entry_date, kind_order, source_id, balance = signing.loads(value, salt=CURSOR_SALT)
+        return date.fromisoformat(entry_date), int(kind_order), int(source_id), Decimal(balance)
+    except (signing.BadSignature, ValueError, TypeError):
+        raise InvalidCursor('مؤشر التصفح غير صالح')
+
+
+def opening_balance(client_id, before):
+    """الرصيد قبل تاريخ معين (بداية فترة الكشف)"""
+    debits = (
+        Invoice.objects.filter(client_id=client_id, issue_date__lt=before)
+        .exclude(status__in=EXCLUDED_INVOICE_STATUSES)
+        .aggregate(total=Sum('total_amount'))['total'] or Decimal('0')
+    )
+    credits = (
+        Payment.objects.filter(
+            client_id=client_id, payment_date__lt=before, status=Payment.PaymentStatus.COMPLETED
+        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+    )
+    return debits - credits
+
+
+def _after_cursor(date_column, kind_order, cursor):
+    """شرط (التاريخ، النوع، المعرف) > المؤشر لجدول ثابت النوع"""
+    if cursor is None:
+        return '', []
+    cursor_date, cursor_kind, cursor_id, _ = cursor
+    if kind_order < cursor_kind:
+        return f"AND {date_column} > %s", [cursor_date]
+    if kind_order > cursor_kind:
+        return f"AND {date_column} >= %s", [cursor_date]
+    return f"AND ({date_column} > %s OR ({date_column} = %s AND id > %s))", [cursor_date, cursor_date, cursor_id]
+
+
+def client_ledger(client_id, cursor=None, limit=DEFAULT_PAGE_SIZE, date_from=None, date_to=None):
+    """صفحة من كشف حساب العميل مرتبة زمنياً مع الرصيد بعد كل قيد"""
+    if cursor is not None:
+        opening = cursor[3]
+    elif date_from is not None:
+        opening = opening_balance(client_id, date_from)
+    else:
+        opening = Decimal('0')
+
+    invoice_table = connection.ops.quote_name(Invoice._meta.db_table)
+    payment_table = connection.ops.quote_name(Payment._meta.db_table)
+    invoice_after, invoice_after_params = _after_cursor('issue_date', INVOICE_ENTRY, cursor)
+    payment_after, payment_after_params = _after_cursor('payment_date', PAYMENT_ENTRY, cursor)
+
+    range_sql, range_params = '', []
+    if date_from is not None and cursor is None:
+        range_sql += ' AND {column} >= %s'
+        range_params.append(date_from)
+    if date_to is not None:
+        range_sql += ' AND {column} <= %s'
+        range_params.append(date_to)
+
+    # يُقرأ من كل جدول limit + 1 صف على الأكثر ثم يُدمجان ويُحسب الرصيد التراكمي
+    sql = f"""
+        SELECT kind_order, source_id, entry_date, reference, debit, credit,
+               %s + SUM(debit - credit) OVER (
+                   ORDER BY entry_date, kind_order, source_id ROWS UNBOUNDED PRECEDING
+               ) AS balance
+        FROM (
+            SELECT * FROM (
+                SELECT {INVOICE_ENTRY} AS kind_order, id AS source_id, issue_date AS entry_date,
+                       invoice_number AS reference, total_amount AS debit, 0 AS credit
+                FROM {invoice_table}
+                WHERE client_id = %s AND status NOT IN (%s, %s) {invoice_after}
+                      {range_sql.format(column='issue_date')}
+                ORDER BY issue_date, id
+                LIMIT %s
+            ) invoices
+            UNION ALL
+            SELECT * FROM (
+                SELECT {PAYMENT_ENTRY} AS kind_order, id AS source_id, payment_date AS entry_date,
+                       payment_number AS reference, 0 AS debit, amount AS credit
+                FROM {payment_table}
+                WHERE client_id = %s AND status = %s {payment_after}
+                      {range_sql.format(column='payment_date')}
+                ORDER BY payment_date, id
+                LIMIT %s
+            ) payments
+        ) entries
+        ORDER BY entry_date, kind_order, source_id
+        LIMIT %s
+    """
+    params = [
+        opening,
+        client_id, *EXCLUDED_INVOICE_STATUSES, *invoice_after_params, *range_params, limit + 1,
+        client_id, Payment.PaymentStatus.COMPLETED, *payment_after_params, *range_params, limit + 1,
+        limit + 1,
+    ]
+
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+
+    money = Decimal('0.01')
+    entries = []
+    for kind_order, source_id, entry_date, reference, debit, credit, balance in rows[:limit]:
+        if isinstance(entry_date, str):
+            entry_date = date.fromisoformat(entry_date)
+        entries.append({
+            'type': 'invoice' if kind_order == INVOICE_ENTRY else 'payment',
+            'kind_order': kind_order,
+            'source_id': source_id,
+            'date': entry_date,
+            'reference': reference,
+            'debit': Decimal(str(debit)).quantize(money),
+            'credit': Decimal(str(credit)).quantize(money),
+            'balance': Decimal(str(balance)).quantize(money),
+        })
+
+    return {
+        'opening_balance': opening,
+        'entries': entries,
+        'closing_balance': entries[-1]['balance'] if entries else opening,
+        'next_cursor': encode_cursor(entries[-1]) if len(rows) > limit else None,
+    }
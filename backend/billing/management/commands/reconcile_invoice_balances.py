@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from billing import balances, caching
+
+
+class Command(BaseCommand):
+    help = 'إصلاح المبالغ المدفوعة والأرصدة المستحقة للفواتير من المدفوعات المكتملة'
+    
+    def handle(self, *args, **options):
+        repaired = balances.reconcile()
+        if repaired:
+            caching.bump()
+        self.stdout.write(self.style.SUCCESS(f'تم إصلاح {repaired} فاتورة'))
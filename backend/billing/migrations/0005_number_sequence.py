@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0004_financial_report_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, verbose_name='البادئة')),
+                ('year', models.PositiveIntegerField(verbose_name='السنة')),
+                ('last_value', models.PositiveBigIntegerField(default=0, verbose_name='آخر رقم')),
+            ],
+            options={
+                'verbose_name': 'تسلسل أرقام',
+                'verbose_name_plural': 'تسلسلات الأرقام',
+                'unique_together': {('prefix', 'year')},
+            },
+        ),
+    ]
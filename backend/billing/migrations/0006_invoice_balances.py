@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:15
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_balances(apps, schema_editor):
+    Invoice = apps.get_model('billing', 'Invoice')
+    Payment = apps.get_model('billing', 'Payment')
+    paid = (
+        Payment.objects.filter(invoice=OuterRef('pk'), status='completed')
+        .order_by()
+        .values('invoice')
+        .annotate(total=Sum('amount'))
+        .values('total')
+    )
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid_total = Coalesce(Subquery(paid, output_field=money), Value(Decimal('0')), output_field=money)
+    Invoice.objects.update(amount_paid=paid_total, balance_due=F('total_amount') - paid_total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0005_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='المبلغ المدفوع'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='balance_due',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='الرصيد المستحق'),
+        ),
+        migrations.RunPython(populate_balances, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['balance_due'], name='invoice_balance_due_idx'),
+        ),
+    ]
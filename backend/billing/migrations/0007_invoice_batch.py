@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0006_invoice_balances'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('template', models.JSONField(default=dict, verbose_name='قالب الفاتورة')),
+                ('targets', models.JSONField(default=list, verbose_name='العملاء والمشاريع')),
+                ('job_status', models.CharField(choices=[('pending', 'في الانتظار'), ('running', 'قيد التنفيذ'), ('completed', 'مكتملة'), ('failed', 'فشلت')], default='pending', max_length=20, verbose_name='حالة التنفيذ')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='نسبة التقدم')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='عدد الفواتير')),
+                ('created_count', models.PositiveIntegerField(default=0, verbose_name='الفواتير المنشأة')),
+                ('first_number', models.CharField(blank=True, max_length=50, verbose_name='أول رقم')),
+                ('last_number', models.CharField(blank=True, max_length=50, verbose_name='آخر رقم')),
+                ('task_id', models.CharField(blank=True, max_length=255, verbose_name='معرف المهمة')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='بداية التنفيذ')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='نهاية التنفيذ')),
+                ('error_message', models.TextField(blank=True, verbose_name='رسالة الخطأ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invoice_batches', to=settings.AUTH_USER_MODEL, verbose_name='أنشئت بواسطة')),
+            ],
+            options={
+                'verbose_name': 'دفعة فواتير',
+                'verbose_name_plural': 'دفعات الفواتير',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
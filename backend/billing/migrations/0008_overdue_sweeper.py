@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0007_invoice_batch'),
+        ('crm', '0002_initial'),
+        ('projects', '0004_task_updated_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceStatusChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('draft', 'مسودة'), ('sent', 'مرسلة'), ('viewed', 'تم عرضها'), ('paid', 'مدفوعة'), ('overdue', 'متأخرة'), ('cancelled', 'ملغية')], max_length=20, verbose_name='الحالة السابقة')),
+                ('to_status', models.CharField(choices=[('draft', 'مسودة'), ('sent', 'مرسلة'), ('viewed', 'تم عرضها'), ('paid', 'مدفوعة'), ('overdue', 'متأخرة'), ('cancelled', 'ملغية')], max_length=20, verbose_name='الحالة الجديدة')),
+                ('reason', models.CharField(blank=True, max_length=100, verbose_name='السبب')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ التغيير')),
+            ],
+            options={
+                'verbose_name': 'تغيير حالة فاتورة',
+                'verbose_name_plural': 'تغييرات حالات الفواتير',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+        migrations.AddField(
+            model_name='invoicestatuschange',
+            name='invoice',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_changes', to='billing.invoice', verbose_name='الفاتورة'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0008_overdue_sweeper'),
+        ('crm', '0002_initial'),
+        ('projects', '0004_task_updated_at_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['client', 'issue_date', 'id'], name='invoice_client_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['client', 'payment_date', 'id'], name='payment_client_date_idx'),
+        ),
+    ]
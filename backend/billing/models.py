@@ -34,6 +34,8 @@ class Invoice(models.Model):
     tax_amount = models.DecimalField(_('مبلغ الضريبة'), max_digits=12, decimal_places=2, default=Decimal('0.00'))
     discount_amount = models.DecimalField(_('مبلغ الخصم'), max_digits=12, decimal_places=2, default=Decimal('0.00'))
     total_amount = models.DecimalField(_('المبلغ الإجمالي'), max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    amount_paid = models.DecimalField(_('المبلغ المدفوع'), max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    balance_due = models.DecimalField(_('الرصيد المستحق'), max_digits=12, decimal_places=2, default=Decimal('0.00'))
     
     # الحالة والملاحظات
     status = models.CharField(_('الحالة'), max_length=20, choices=InvoiceStatus.choices, default=InvoiceStatus.DRAFT)
@@ -54,15 +56,26 @@ class Invoice(models.Model):
         verbose_name = _('فاتورة')
         verbose_name_plural = _('الفواتير')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['issue_date'], name='invoice_issue_date_idx'),
+            models.Index(fields=['balance_due'], name='invoice_balance_due_idx'),
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+            models.Index(fields=['client', 'issue_date', 'id'], name='invoice_client_issue_idx'),
+        ]
     
     def __str__(self):
         return f"فاتورة {self.invoice_number} - {self.client.company_name}"
     
-    def calculate_totals(self):
-        """حساب إجماليات الفاتورة"""
-        self.subtotal = sum(item.total_amount for item in self.items.all())
+    def apply_totals(self, item_totals):
+        """تعيين الإجماليات من مبالغ العناصر في الذاكرة دون حفظ"""
+        self.subtotal = sum(item_totals, Decimal('0'))
         self.tax_amount = (self.subtotal * self.tax_rate) / 100
         self.total_amount = self.subtotal + self.tax_amount - self.discount_amount
+        self.balance_due = self.total_amount - self.amount_paid
+    
+    def calculate_totals(self):
+        """حساب إجماليات الفاتورة"""
+        self.apply_totals(item.total_amount for item in self.items.all())
         self.save()
     
     def is_overdue(self):
@@ -71,6 +84,25 @@ class Invoice(models.Model):
         return self.due_date < timezone.now().date() and self.status not in [self.InvoiceStatus.PAID, self.InvoiceStatus.CANCELLED]
 
 
+class InvoiceStatusChange(models.Model):
+    """
+    سجل انتقالات حالة الفاتورة التي تتم آلياً
+    """
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='status_changes', verbose_name=_('الفاتورة'))
+    from_status = models.CharField(_('الحالة السابقة'), max_length=20, choices=Invoice.InvoiceStatus.choices)
+    to_status = models.CharField(_('الحالة الجديدة'), max_length=20, choices=Invoice.InvoiceStatus.choices)
+    reason = models.CharField(_('السبب'), max_length=100, blank=True)
+    created_at = models.DateTimeField(_('تاريخ التغيير'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('تغيير حالة فاتورة')
+        verbose_name_plural = _('تغييرات حالات الفواتير')
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.invoice_id}: {self.from_status} → {self.to_status}"
+
+
 class InvoiceItem(models.Model):
     """
     نموذج عنصر الفاتورة
@@ -150,6 +182,65 @@ class Payment(models.Model):
         verbose_name = _('دفعة')
         verbose_name_plural = _('الدفعات')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'payment_date'], name='payment_status_date_idx'),
+            models.Index(fields=['client', 'payment_date', 'id'], name='payment_client_date_idx'),
+        ]
     
     def __str__(self):
         return f"دفعة {self.payment_number} - {self.amount}"
+
+
+class NumberSequence(models.Model):
+    """
+    عداد أرقام المستندات لكل (بادئة، سنة)
+    """
+    prefix = models.CharField(_('البادئة'), max_length=10)
+    year = models.PositiveIntegerField(_('السنة'))
+    last_value = models.PositiveBigIntegerField(_('آخر رقم'), default=0)
+    
+    class Meta:
+        verbose_name = _('تسلسل أرقام')
+        verbose_name_plural = _('تسلسلات الأرقام')
+        unique_together = ['prefix', 'year']
+    
+    def __str__(self):
+        return f"{self.prefix}-{self.year}: {self.last_value}"
+
+
+class InvoiceBatch(models.Model):
+    """
+    دفعة توليد فواتير جماعية من قالب واحد لعدة عملاء
+    """
+    
+    class JobStatus(models.TextChoices):
+        PENDING = 'pending', _('في الانتظار')
+        RUNNING = 'running', _('قيد التنفيذ')
+        COMPLETED = 'completed', _('مكتملة')
+        FAILED = 'failed', _('فشلت')
+    
+    template = models.JSONField(_('قالب الفاتورة'), default=dict)
+    targets = models.JSONField(_('العملاء والمشاريع'), default=list)
+    
+    # حالة المهمة
+    job_status = models.CharField(_('حالة التنفيذ'), max_length=20, choices=JobStatus.choices, default=JobStatus.PENDING)
+    progress = models.PositiveSmallIntegerField(_('نسبة التقدم'), default=0)
+    total_count = models.PositiveIntegerField(_('عدد الفواتير'), default=0)
+    created_count = models.PositiveIntegerField(_('الفواتير المنشأة'), default=0)
+    first_number = models.CharField(_('أول رقم'), max_length=50, blank=True)
+    last_number = models.CharField(_('آخر رقم'), max_length=50, blank=True)
+    task_id = models.CharField(_('معرف المهمة'), max_length=255, blank=True)
+    started_at = models.DateTimeField(_('بداية التنفيذ'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('نهاية التنفيذ'), null=True, blank=True)
+    error_message = models.TextField(_('رسالة الخطأ'), blank=True)
+    
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='invoice_batches', verbose_name=_('أنشئت بواسطة'))
+    created_at = models.DateTimeField(_('تاريخ الإنشاء'), auto_now_add=True)
+    
+    class Meta:
+        verbose_name = _('دفعة فواتير')
+        verbose_name_plural = _('دفعات الفواتير')
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"دفعة فواتير {self.pk} - {self.created_count}/{self.total_count}"
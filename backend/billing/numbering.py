@@ -0,0 +1,72 @@
+"""
+توليد أرقام الفواتير والدفعات
+
+يُحجز الرقم التالي من صف عداد لكل (بادئة، سنة) مقفل بـ select_for_update في
+معاملة قصيرة، فلا يتصادم إنشاءان متزامنان ولا يتطلب الحجز مسح الجدول. يمكن
+حجز كتلة أرقام دفعة واحدة للمهام الجماعية.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from .models import Invoice, NumberSequence, Payment
+
+INVOICE_PREFIX = 'INV'
+PAYMENT_PREFIX = 'PAY'
+
+# النموذج والحقل اللذان تُستخرج منهما آخر قيمة عند إنشاء العداد لأول مرة
+NUMBERED_FIELDS = {
+    INVOICE_PREFIX: (Invoice, 'invoice_number'),
+    PAYMENT_PREFIX: (Payment, 'payment_number'),
+}
+
+
+def format_number(prefix, year, value):
+    """الصيغة PREFIX-YYYY-NNNNN (تتسع تلقائياً بعد 99999)"""
+    return f'{prefix}-{year}-{value:05d}'
+
+
+def _existing_max(prefix, year):
+    """أعلى رقم مستخدم مسبقاً (مقارنة رقمية لا نصية)"""
+    model, field = NUMBERED_FIELDS[prefix]
+    start = f'{prefix}-{year}-'
+    result = (
+        model.objects.filter(**{f'{field}__regex': rf'^{start}[0-9]+$'})
+        .annotate(sequence=Cast(Substr(field, len(start) + 1), BigIntegerField()))
+        .aggregate(latest=Max('sequence'))
+    )
+    return result['latest'] or 0
+
+
+def _locked_sequence(prefix, year):
+    sequence = NumberSequence.objects.select_for_update().filter(prefix=prefix, year=year).first()
+    if sequence is not None:
+        return sequence
+    try:
+        with transaction.atomic():
+            NumberSequence.objects.create(prefix=prefix, year=year, last_value=_existing_max(prefix, year))
+    except IntegrityError:
+        # أنشأته عملية أخرى في الوقت نفسه
+        pass
+    return NumberSequence.objects.select_for_update().get(prefix=prefix, year=year)
+
+
+def allocate(prefix, count=1, year=None):
+    """حجز count رقماً متتالياً وإرجاعها كقائمة نصوص منسقة"""
+    year = year or timezone.now().year
+    with transaction.atomic():
+        sequence = _locked_sequence(prefix, year)
+        first = sequence.last_value + 1
+        sequence.last_value += count
+        sequence.save(update_fields=['last_value'])
+    return [format_number(prefix, year, value) for value in range(first, first + count)]
+
+
+def next_invoice_number():
+    return allocate(INVOICE_PREFIX)[0]
+
+
+def next_payment_number():
+    return allocate(PAYMENT_PREFIX)[0]
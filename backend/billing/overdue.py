@@ -0,0 +1,56 @@
+"""
+تحويل الفواتير المتأخرة
+
+تُنقل الفواتير المرسلة أو المعروضة التي تجاوزت تاريخ الاستحقاق إلى الحالة
+OVERDUE عبر ORM على الفهرس (status, due_date): تُقفل الصفوف المستحقة وتُقرأ
+حالتها السابقة، ثم يُسجل كل انتقال بـ bulk_create ويُحدَّث كل دفعة من الفواتير
+بعبارة UPDATE واحدة، فيصبح عرض المتأخرات وعدّها استعلاماً مباشراً على عمود الحالة.
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Invoice, InvoiceStatusChange
+from .signals import billing_data_changed
+
+SWEEPABLE_STATUSES = [Invoice.InvoiceStatus.SENT, Invoice.InvoiceStatus.VIEWED]
+
+SWEEP_REASON = 'تجاوز تاريخ الاستحقاق'
+
+# حجم دفعة التحديث والإدراج حتى لا يتجاوز عدد المعاملات حدود قاعدة البيانات
+BATCH_SIZE = 500
+
+
+def sweep(today=None):
+    """نقل الفواتير المتأخرة إلى OVERDUE وإرجاع عددها"""
+    today = today or timezone.now().date()
+    now = timezone.now()
+
+    with transaction.atomic():
+        # القفل يمنع تغيّر الحالة بين قراءتها وتسجيل الانتقال
+        due = list(
+            Invoice.objects.select_for_update()
+            .filter(status__in=SWEEPABLE_STATUSES, due_date__lt=today)
+            .order_by('pk')
+            .values_list('pk', 'status')
+        )
+        if not due:
+            return 0
+
+        InvoiceStatusChange.objects.bulk_create([
+            InvoiceStatusChange(
+                invoice_id=invoice_id, from_status=status,
+                to_status=Invoice.InvoiceStatus.OVERDUE, reason=SWEEP_REASON,
+            )
+            for invoice_id, status in due
+        ], batch_size=BATCH_SIZE)
+
+        for start in range(0, len(due), BATCH_SIZE):
+            ids = [invoice_id for invoice_id, _ in due[start:start + BATCH_SIZE]]
+            Invoice.objects.filter(pk__in=ids).update(
+                status=Invoice.InvoiceStatus.OVERDUE, updated_at=now
+            )
+
+        # الإبطال بتغيير إصدار البيانات فلا حاجة إلى معرفات الفواتير
+        billing_data_changed.send(sender=Invoice, models=[Invoice])
+    return len(due)
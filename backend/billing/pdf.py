@@ -0,0 +1,248 @@
+"""
+ملفات PDF للفواتير
+
+تُرسم الفاتورة في عامل Celery وتُحفظ تحت MEDIA_ROOT باسم يتضمن بصمة محتواها
+(الفاتورة وعناصرها وبيانات الشركة)، فيُخدم الملف نفسه حتى تتغير الفاتورة ولا
+يُرسم أي ملف داخل عامل الويب.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import arabic_reshaper
+from bidi.algorithm import get_display
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .models import Invoice, InvoiceItem
+
+# يُرفع عند تغيير تصميم الملف حتى تُعاد جميع الملفات المخزنة
+LAYOUT_VERSION = 1
+
+PDF_DIRECTORY = 'invoices/pdf'
+
+# مدة منع تكرار جدولة رسم الملف نفسه
+RENDER_LOCK_TIMEOUT = 300
+
+FONT_NAME = 'InvoiceFont'
+
+# الحقول المرسومة في الملف وحدها تدخل في البصمة، فلا يُعاد الرسم عند تغيير
+# حقل لا يظهر فيه (كالحالة)
+RENDERED_FIELDS = (
+    'invoice_number', 'issue_date', 'due_date',
+    'subtotal', 'tax_rate', 'tax_amount', 'discount_amount', 'total_amount',
+    'amount_paid', 'balance_due', 'notes', 'terms_and_conditions',
+    'client__company_name', 'client__first_name', 'client__last_name',
+    'client__email', 'client__address', 'client__city',
+    'client__tax_number', 'project__title',
+)
+
+INVOICE_FIELDS = ('pk',) + RENDERED_FIELDS
+
+ITEM_FIELDS = ('description', 'quantity', 'unit_price', 'total_amount')
+
+
+def load_document(invoice_id):
+    """بيانات الفاتورة وعناصرها باستعلامين، أو None إذا لم توجد"""
+    invoice = Invoice.objects.filter(pk=invoice_id).values(*INVOICE_FIELDS).first()
+    if invoice is None:
+        return None
+    invoice['items'] = list(
+        InvoiceItem.objects.filter(invoice_id=invoice_id).order_by('order', 'pk').values(*ITEM_FIELDS)
+    )
+    return invoice
+
+
+def _company():
+    return {
+        'name': settings.COMPANY_NAME,
+        'email': settings.COMPANY_EMAIL,
+        'phone': settings.COMPANY_PHONE,
+        'address': settings.COMPANY_ADDRESS,
+    }
+
+
+def content_hash(document):
+    """بصمة SHA-256 لكل ما يظهر في الملف"""
+    invoice = {field: document[field] for field in RENDERED_FIELDS}
+    payload = json.dumps(
+        {'layout': LAYOUT_VERSION, 'company': _company(), 'invoice': invoice, 'items': document['items']},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def pdf_name(invoice_id, digest):
+    """مسار الملف نسبةً إلى MEDIA_ROOT"""
+    return f"{PDF_DIRECTORY}/{invoice_id}/{digest}.pdf"
+
+
+def pdf_path(invoice_id, digest):
+    return os.path.join(settings.MEDIA_ROOT, pdf_name(invoice_id, digest))
+
+
+def _ar(text):
+    """تشكيل الحروف العربية وترتيبها من اليمين لليسار"""
+    return get_display(arabic_reshaper.reshape(str(text)))
+
+
+def _register_font():
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, settings.INVOICE_PDF_FONT))
+
+
+def render(document):
+    """رسم الفاتورة وإرجاع محتوى الملف"""
+    _register_font()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(document['invoice_number'])
+    width, height = A4
+    right = width - 20 * mm
+    left = 20 * mm
+    company = _company()
+
+    def line(text, y, size=10, x=right):
+        pdf.setFont(FONT_NAME, size)
+        pdf.drawRightString(x, y, _ar(text))
+
+    def amount(value):
+        return f"{value:,.2f}"
+
+    # ترويسة الشركة
+    y = height - 25 * mm
+    line(company['name'], y, size=16)
+    for text in (company['address'], company['phone'], company['email']):
+        y -= 6 * mm
+        line(text, y, size=9)
+
+    # بيانات الفاتورة والعميل
+    y -= 12 * mm
+    line(f"فاتورة رقم {document['invoice_number']}", y, size=14)
+    y -= 7 * mm
+    line(f"تاريخ الإصدار: {document['issue_date']}", y)
+    line(f"تاريخ الاستحقاق: {document['due_date']}", y, x=width / 2)
+    y -= 10 * mm
+    client_name = document['client__company_name'] or (
+        f"{document['client__first_name']} {document['client__last_name']}"
+    )
+    line(f"العميل: {client_name}", y, size=11)
+    for text in (
+        document['client__address'] and f"{document['client__address']} {document['client__city']}".strip(),
+        document['client__email'],
+        document['client__tax_number'] and f"الرقم الضريبي: {document['client__tax_number']}",
+        document['project__title'] and f"المشروع: {document['project__title']}",
+    ):
+        if text:
+            y -= 6 * mm
+            line(text, y, size=9)
+
+    # جدول العناصر: الوصف يميناً ثم الكمية وسعر الوحدة والمبلغ
+    columns = (right, right - 90 * mm, right - 115 * mm, right - 145 * mm)
+
+    def header(y):
+        for x, text in zip(columns, ('الوصف', 'الكمية', 'سعر الوحدة', 'المبلغ')):
+            line(text, y, size=10, x=x)
+        pdf.line(left, y - 2 * mm, right, y - 2 * mm)
+        return y - 8 * mm
+
+    y = header(y - 12 * mm)
+    for item in document['items']:
+        if y < 40 * mm:
+            pdf.showPage()
+            y = header(height - 25 * mm)
+        line(item['description'][:70], y, size=9, x=columns[0])
+        line(amount(item['quantity']), y, size=9, x=columns[1])
+        line(amount(item['unit_price']), y, size=9, x=columns[2])
+        line(amount(item['total_amount']), y, size=9, x=columns[3])
+        y -= 6 * mm
+
+    # الإجماليات
+    pdf.line(left, y + 2 * mm, right, y + 2 * mm)
+    totals = [
+        ('المجموع الفرعي', document['subtotal']),
+        (f"الضريبة ({document['tax_rate']}%)", document['tax_amount']),
+        ('الخصم', document['discount_amount']),
+        ('الإجمالي', document['total_amount']),
+        ('المدفوع', document['amount_paid']),
+        ('الرصيد المستحق', document['balance_due']),
+    ]
+    for label, value in totals:
+        y -= 6 * mm
+        line(label, y, size=10, x=columns[2])
+        line(amount(value), y, size=10, x=columns[3])
+
+    for title, text in (('ملاحظات', document['notes']), ('الشروط والأحكام', document['terms_and_conditions'])):
+        if text:
+            y -= 10 * mm
+            line(title, y, size=10)
+            for paragraph in text.splitlines():
+                y -= 5 * mm
+                line(paragraph[:110], y, size=8)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _write_atomic(path, content):
+    """كتابة الملف عبر ملف مؤقت ثم إعادة التسمية حتى لا يُخدم ملف ناقص"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as temp:
+            temp.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _remove_stale(invoice_id, keep):
+    directory = os.path.dirname(pdf_path(invoice_id, keep))
+    for name in os.listdir(directory):
+        if name.endswith('.pdf') and name != f"{keep}.pdf":
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def ensure_pdf(invoice_id):
+    """رسم ملف الفاتورة إن لم يكن مخزناً لمحتواها الحالي؛ يُرجع مساره النسبي"""
+    document = load_document(invoice_id)
+    if document is None:
+        return None
+    digest = content_hash(document)
+    path = pdf_path(invoice_id, digest)
+    if not os.path.exists(path):
+        _write_atomic(path, render(document))
+        _remove_stale(invoice_id, digest)
+    return pdf_name(invoice_id, digest)
+
+
+def cached_pdf(document):
+    """البصمة ومسار الملف المخزن للمحتوى الحالي (المسار None إن لم يُرسم بعد)"""
+    digest = content_hash(document)
+    path = pdf_path(document['pk'], digest)
+    return digest, (path if os.path.exists(path) else None)
+
+
+def enqueue_render(invoice_id, digest=None):
+    """جدولة رسم الملف مرة واحدة لكل بصمة مهما تكررت الطلبات"""
+    from .tasks import render_invoice_pdf
+
+    if digest is not None and not cache.add(
+        f"billing:pdf-render:{invoice_id}:{digest}", True, RENDER_LOCK_TIMEOUT
+    ):
+        return
+    render_invoice_pdf.delay(invoice_id)
@@ -1,13 +1,30 @@
+from decimal import Decimal
+
+from django.db import transaction
 from rest_framework import serializers
-from .models import Invoice, InvoiceItem, Payment
+from .models import Invoice, InvoiceItem, InvoiceBatch, Payment
+from . import balances, ledger, numbering
 from crm.models import Client
 from projects.models import Project
 
 
+# الحقول التي تُكتب عند تحديث العناصر جماعياً
+ITEM_WRITE_FIELDS = ['description', 'quantity', 'unit_price', 'total_amount', 'order']
+
+# الإجماليات التي يعيد apply_totals حسابها
+INVOICE_TOTAL_FIELDS = ['subtotal', 'tax_amount', 'total_amount', 'balance_due']
+
+# حقول الدفعة التي لا تُعدَّل بعد إنشائها إلا عبر process و refund حتى لا ينحرف رصيد الفاتورة
+PAYMENT_IMMUTABLE_FIELDS = ['invoice', 'amount', 'status']
+
+
 class InvoiceItemSerializer(serializers.ModelSerializer):
     """
     Serializer لعناصر الفاتورة
     """
+    # معرف اختياري عند التحديث: العناصر بمعرف تُحدَّث وبدونه تُنشأ
+    id = serializers.IntegerField(required=False)
+    
     class Meta:
         model = InvoiceItem
         fields = ['id', 'description', 'quantity', 'unit_price', 'total_amount', 'order']
@@ -20,7 +37,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
     """
     items = InvoiceItemSerializer(many=True, read_only=True)
     client_name = serializers.CharField(source='client.company_name', read_only=True)
-    project_name = serializers.CharField(source='project.name', read_only=True, allow_null=True)
+    project_name = serializers.CharField(source='project.title', read_only=True, allow_null=True)
     created_by_name = serializers.SerializerMethodField()
     is_overdue = serializers.BooleanField(read_only=True)
     
@@ -29,30 +46,20 @@ class InvoiceSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'invoice_number', 'client', 'client_name', 'project', 'project_name',
             'issue_date', 'due_date', 'subtotal', 'tax_rate', 'tax_amount',
-            'discount_amount', 'total_amount', 'status', 'notes', 'terms_and_conditions',
+            'discount_amount', 'total_amount', 'amount_paid', 'balance_due', 'status', 'notes', 'terms_and_conditions',
             'created_by', 'created_by_name', 'sent_at', 'viewed_at', 'paid_at',
             'created_at', 'updated_at', 'items', 'is_overdue'
         ]
         read_only_fields = ['invoice_number', 'created_by', 'created_at', 'updated_at', 
                            'sent_at', 'viewed_at', 'paid_at', 'subtotal', 'tax_amount', 
-                           'total_amount']
+                           'total_amount', 'amount_paid', 'balance_due']
     
     def get_created_by_name(self, obj):
         return f"{obj.created_by.first_name} {obj.created_by.last_name}"
     
     def create(self, validated_data):
         # توليد رقم فاتورة تلقائي
-        from django.utils import timezone
-        year = timezone.now().year
-        last_invoice = Invoice.objects.filter(invoice_number__startswith=f'INV-{year}').order_by('-invoice_number').first()
-        
-        if last_invoice:
-            last_number = int(last_invoice.invoice_number.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        validated_data['invoice_number'] = f'INV-{year}-{new_number:05d}'
+        validated_data['invoice_number'] = numbering.next_invoice_number()
         validated_data['created_by'] = self.context['request'].user
         
         return super().create(validated_data)
@@ -71,50 +78,75 @@ class InvoiceCreateUpdateSerializer(serializers.ModelSerializer):
             'discount_amount', 'status', 'notes', 'terms_and_conditions', 'items'
         ]
     
-    def create(self, validated_data):
-        items_data = validated_data.pop('items', [])
+    @staticmethod
+    def _build_item(invoice, item_data):
+        item_data.pop('id', None)
+        item = InvoiceItem(invoice=invoice, **item_data)
+        item.total_amount = item.quantity * item.unit_price
+        return item
+    
+    def _sync_items(self, invoice, items_data):
+        """مزامنة العناصر: إنشاء الجديد وتحديث المتغير فقط وحذف المحذوف، بعمليات جماعية"""
+        existing = {item.id: item for item in invoice.items.all()}
+        items, to_create, to_update = [], [], []
         
-        # توليد رقم فاتورة تلقائي
-        from django.utils import timezone
-        year = timezone.now().year
-        last_invoice = Invoice.objects.filter(invoice_number__startswith=f'INV-{year}').order_by('-invoice_number').first()
+        for item_data in items_data:
+            item = existing.pop(item_data.pop('id', None), None)
+            if item is None:
+                item = self._build_item(invoice, item_data)
+                to_create.append(item)
+            else:
+                changed = [attr for attr, value in item_data.items() if getattr(item, attr) != value]
+                if changed:
+                    for attr in changed:
+                        setattr(item, attr, item_data[attr])
+                    item.total_amount = item.quantity * item.unit_price
+                    to_update.append(item)
+            items.append(item)
         
-        if last_invoice:
-            last_number = int(last_invoice.invoice_number.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
+        if existing:
+            InvoiceItem.objects.filter(pk__in=existing).delete()
+        InvoiceItem.objects.bulk_create(to_create)
+        InvoiceItem.objects.bulk_update(to_update, ITEM_WRITE_FIELDS)
+        return items
+    
+    def create(self, validated_data):
+        items_data = validated_data.pop('items', [])
         
-        validated_data['invoice_number'] = f'INV-{year}-{new_number:05d}'
+        # توليد رقم فاتورة تلقائي (خارج المعاملة حتى لا يبقى عداد الأرقام مقفلاً)
+        validated_data['invoice_number'] = numbering.next_invoice_number()
         validated_data['created_by'] = self.context['request'].user
         
-        invoice = Invoice.objects.create(**validated_data)
-        
-        # إنشاء عناصر الفاتورة
-        for item_data in items_data:
-            InvoiceItem.objects.create(invoice=invoice, **item_data)
-        
-        invoice.calculate_totals()
+        with transaction.atomic():
+            invoice = Invoice(**validated_data)
+            items = [self._build_item(invoice, item_data) for item_data in items_data]
+            
+            # الإجماليات تُحسب في الذاكرة قبل الإدراج فلا حاجة لإعادة حفظ الفاتورة
+            invoice.apply_totals(item.total_amount for item in items)
+            invoice.save()
+            InvoiceItem.objects.bulk_create(items)
         return invoice
     
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
         
-        # تحديث الفاتورة
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
-        instance.save()
-        
-        # تحديث العناصر إذا تم توفيرها
-        if items_data is not None:
-            # حذف العناصر القديمة
-            instance.items.all().delete()
+        with transaction.atomic():
+            # قفل الصف وقراءة المدفوع الحالي حتى لا تضيع دفعة طُبقت بعد تحميل الفاتورة
+            instance.amount_paid = (
+                Invoice.objects.select_for_update().filter(pk=instance.pk)
+                .values_list('amount_paid', flat=True).get()
+            )
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
             
-            # إنشاء العناصر الجديدة
-            for item_data in items_data:
-                InvoiceItem.objects.create(invoice=instance, **item_data)
-        
-        instance.calculate_totals()
+            # تحديث العناصر إذا تم توفيرها
+            if items_data is not None:
+                items = self._sync_items(instance, items_data)
+            else:
+                items = instance.items.all()
+            
+            instance.apply_totals(item.total_amount for item in items)
+            instance.save(update_fields=[*validated_data, *INVOICE_TOTAL_FIELDS, 'updated_at'])
         return instance
 
 
@@ -137,6 +169,13 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['payment_number', 'processed_by', 'processed_at', 
                            'created_at', 'updated_at']
     
+    def get_extra_kwargs(self):
+        extra_kwargs = super().get_extra_kwargs()
+        if self.instance is not None:
+            for field in PAYMENT_IMMUTABLE_FIELDS:
+                extra_kwargs.setdefault(field, {})['read_only'] = True
+        return extra_kwargs
+    
     def get_processed_by_name(self, obj):
         if obj.processed_by:
             return f"{obj.processed_by.first_name} {obj.processed_by.last_name}"
@@ -144,21 +183,85 @@ class PaymentSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         # توليد رقم دفعة تلقائي
-        from django.utils import timezone
-        year = timezone.now().year
-        last_payment = Payment.objects.filter(payment_number__startswith=f'PAY-{year}').order_by('-payment_number').first()
-        
-        if last_payment:
-            last_number = int(last_payment.payment_number.split('-')[-1])
-            new_number = last_number + 1
-        else:
-            new_number = 1
-        
-        validated_data['payment_number'] = f'PAY-{year}-{new_number:05d}'
+        validated_data['payment_number'] = numbering.next_payment_number()
         
         # تعيين العميل من الفاتورة إذا لم يتم توفيره
         if 'client' not in validated_data:
             validated_data['client'] = validated_data['invoice'].client
         
-        return super().create(validated_data)
+        with transaction.atomic():
+            payment = super().create(validated_data)
+            # الدفعة المسجلة كمكتملة مباشرة تُحتسب في رصيد الفاتورة
+            if payment.status == Payment.PaymentStatus.COMPLETED:
+                balances.apply_payment(payment.invoice_id, payment.amount)
+        return payment
+
+
+
+class BulkInvoiceTemplateSerializer(serializers.Serializer):
+    """
+    Serializer لقالب الفواتير الجماعية
+    """
+    items = InvoiceItemSerializer(many=True, allow_empty=False)
+    issue_date = serializers.DateField()
+    due_date = serializers.DateField()
+    tax_rate = serializers.DecimalField(max_digits=5, decimal_places=2, default=Decimal('15.00'))
+    discount_amount = serializers.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    status = serializers.ChoiceField(
+        choices=[Invoice.InvoiceStatus.DRAFT, Invoice.InvoiceStatus.SENT], default=Invoice.InvoiceStatus.DRAFT
+    )
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+    terms_and_conditions = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class BulkInvoiceTargetSerializer(serializers.Serializer):
+    """
+    عميل (ومشروع اختياري) تُنشأ له فاتورة من القالب
+    """
+    client = serializers.IntegerField()
+    project = serializers.IntegerField(required=False, allow_null=True)
+
+
+class BulkInvoiceSerializer(serializers.Serializer):
+    """
+    Serializer لطلب توليد الفواتير جماعياً
+    """
+    template = BulkInvoiceTemplateSerializer()
+    targets = BulkInvoiceTargetSerializer(many=True, allow_empty=False, max_length=5000)
+
 
+class InvoiceBatchSerializer(serializers.ModelSerializer):
+    """
+    Serializer لحالة دفعة الفواتير الجماعية
+    """
+    class Meta:
+        model = InvoiceBatch
+        fields = [
+            'id', 'job_status', 'progress', 'total_count', 'created_count',
+            'first_number', 'last_number', 'started_at', 'finished_at',
+            'error_message', 'created_by', 'created_at'
+        ]
+        read_only_fields = fields
+
+
+class ClientStatementQuerySerializer(serializers.Serializer):
+    """
+    معاملات كشف حساب العميل
+    """
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(
+        required=False, min_value=1, max_value=ledger.MAX_PAGE_SIZE, default=ledger.DEFAULT_PAGE_SIZE
+    )
+    
+    def validate_cursor(self, value):
+        try:
+            return ledger.decode_cursor(value)
+        except ledger.InvalidCursor as exc:
+            raise serializers.ValidationError(str(exc))
+    
+    def validate(self, data):
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise serializers.ValidationError('تاريخ البداية يجب أن يكون قبل تاريخ النهاية')
+        return data
@@ -0,0 +1,26 @@
+"""
+إبطال التخزين المؤقت للفوترة عند تعديل الفواتير والمدفوعات
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Invoice, InvoiceItem, Payment
+from . import caching
+
+# يُرسل بعد العمليات الجماعية (bulk_create / update) التي لا ترسل post_save؛
+# الوسيط models قائمة النماذج التي تغيرت
+billing_data_changed = Signal()
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(billing_data_changed)
+def invalidate_billing_cache(sender, **kwargs):
+    # بعد الالتزام حتى لا تُخزَّن نتيجة محسوبة من بيانات لم تُلتزم بعد
+    transaction.on_commit(caching.bump)
@@ -0,0 +1,425 @@
+"""
+تسوية كشوف الحساب البنكية
+
+يُقرأ الكشف (CSV أو MT940) سطراً بسطر، وتُطابق الإيداعات مع الفواتير المفتوحة
+عبر فهرس في الذاكرة يُبنى مرة واحدة لكل تشغيل (رقم الفاتورة، ثم المبلغ المستحق
+إذا كان فريداً). السطر الذي يطابق مرجعه دفعة معلقة يؤكدها بدلاً من إنشاء دفعة
+جديدة. تُنشأ الدفعات عبر bulk_create، وتُحدَّث أرصدة الفواتير وحالاتها دفعة
+واحدة في النهاية. الأسطر التي تعذرت قراءتها تُعاد كأخطاء على مستوى السطر.
+"""
+
+import codecs
+import csv
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .models import Invoice, InvoiceStatusChange, Payment
+from . import numbering
+from .signals import billing_data_changed
+
+CHUNK_SIZE = 1000
+
+# أقصى عدد للأسطر غير المطابقة في نتيجة الاستيراد
+MAX_REPORTED_UNMATCHED = 500
+
+OPEN_STATUSES = [
+    Invoice.InvoiceStatus.SENT,
+    Invoice.InvoiceStatus.VIEWED,
+    Invoice.InvoiceStatus.OVERDUE,
+]
+
+RECONCILE_REASON = 'تسوية كشف بنكي'
+
+# المراجع تُخزَّن مقتطعة إلى طول الحقل فتُقارن مقتطعة أيضاً
+REFERENCE_MAX_LENGTH = Payment._meta.get_field('reference_number').max_length
+
+# الدفعات التي تعني وصول المبلغ فعلاً: تكرار مرجعها في الكشف سطر مكرر
+RECEIVED_STATUSES = [Payment.PaymentStatus.COMPLETED, Payment.PaymentStatus.REFUNDED]
+
+INVOICE_NUMBER_PATTERN = re.compile(r'INV-\d{4}-\d+', re.IGNORECASE)
+
+# أسماء الأعمدة المقبولة في ملفات CSV
+CSV_COLUMNS = {
+    'date': ('date', 'value_date', 'transaction_date', 'التاريخ'),
+    'amount': ('amount', 'credit', 'المبلغ'),
+    'reference': ('reference', 'ref', 'bank_reference', 'المرجع'),
+    'description': ('description', 'narrative', 'details', 'البيان'),
+}
+
+
+@dataclass
+class StatementLine:
+    """سطر إيداع من كشف الحساب"""
+    line_number: int
+    date: date
+    amount: Decimal
+    reference: str
+    description: str
+
+
+@dataclass
+class StatementRowError:
+    """سطر تعذرت قراءته (تاريخ أو مبلغ مفقود أو غير صالح)"""
+    line_number: int
+    message: str
+
+
+class StatementError(ValueError):
+    """ملف كشف غير صالح"""
+
+
+def _parse_amount(value):
+    try:
+        amount = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        amount = None
+    if amount is None or not amount.is_finite():
+        raise StatementError(f"مبلغ غير صالح: {value}")
+    return amount
+
+
+def _parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        raise StatementError('التاريخ مفقود')
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y'):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise StatementError(f"تاريخ غير صالح: {value}")
+
+
+def _reference(value):
+    return (value or '').strip()[:REFERENCE_MAX_LENGTH]
+
+
+def parse_csv(stream):
+    """أسطر الإيداع من ملف CSV (تُهمل السحوبات) أو أخطاء الأسطر التي تعذرت قراءتها"""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+    columns = {}
+    for key, aliases in CSV_COLUMNS.items():
+        columns[key] = next((fields[alias] for alias in aliases if alias in fields), None)
+    if columns['date'] is None or columns['amount'] is None:
+        raise StatementError('ملف CSV يجب أن يحتوي على عمودي التاريخ والمبلغ')
+
+    for line_number, row in enumerate(reader, start=2):
+        try:
+            amount = _parse_amount(row.get(columns['amount']) or '0')
+            if amount <= 0:
+                continue
+            line_date = _parse_date(row.get(columns['date']))
+        except StatementError as exc:
+            yield StatementRowError(line_number, str(exc))
+            continue
+        yield StatementLine(
+            line_number=line_number,
+            date=line_date,
+            amount=amount,
+            reference=_reference(row.get(columns['reference'])) if columns['reference'] else '',
+            description=(row.get(columns['description']) or '').strip() if columns['description'] else '',
+        )
+
+
+# :61:YYMMDD[MMDD](C|D|RC|RD)[funds code]amount(N|F)XXX reference[//bank reference]
+MT940_STATEMENT_LINE = re.compile(
+    r'^:61:(?P<date>\d{6})(?:\d{4})?(?P<mark>RC|RD|C|D)[A-Z]?(?P<amount>[\d,]+)'
+    r'[NF][A-Z0-9]{3}(?P<reference>[^/\n]*)(?://(?P<bank_reference>.*))?$'
+)
+
+
+def parse_mt940(stream):
+    """أسطر الإيداع من ملف MT940 (الحقل 61 مع بيانه في الحقل 86) أو أخطاء الأسطر"""
+    pending = None
+    line_number = 0
+    for line_number, raw in enumerate(codecs.iterdecode(stream, 'utf-8-sig'), start=1):
+        line = raw.rstrip('\r\n')
+        if line.startswith(':61:'):
+            if pending is not None:
+                yield pending
+            pending = None
+            match = MT940_STATEMENT_LINE.match(line)
+            if match is None:
+                yield StatementRowError(line_number, 'سطر MT940 غير صالح')
+                continue
+            if match['mark'] not in ('C', 'RD'):
+                continue
+            try:
+                line_date = datetime.strptime(match['date'], '%y%m%d').date()
+            except ValueError:
+                yield StatementRowError(line_number, f"تاريخ غير صالح: {match['date']}")
+                continue
+            pending = StatementLine(
+                line_number=line_number,
+                date=line_date,
+                amount=Decimal(match['amount'].replace(',', '.')),
+                reference=_reference(match['bank_reference'] or match['reference']),
+                description=match['reference'].strip(),
+            )
+        elif pending is not None and line.startswith(':86:'):
+            pending.description = f"{pending.description} {line[4:]}".strip()
+        elif pending is not None and line and not line.startswith(':') and not line.startswith('-'):
+            # تكملة بيان الحقل 86 على عدة أسطر
+            pending.description = f"{pending.description} {line}".strip()
+        elif line.startswith(':') or line.startswith('-'):
+            if pending is not None:
+                yield pending
+                pending = None
+    if pending is not None:
+        yield pending
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'mt940': parse_mt940,
+}
+
+
+class InvoiceIndex:
+    """فهرس الفواتير المفتوحة في الذاكرة: برقم الفاتورة وبالرصيد المستحق"""
+
+    def __init__(self):
+        self.by_pk = {}
+        self.by_number = {}
+        self.by_amount = defaultdict(list)
+        rows = (
+            Invoice.objects.order_by()
+            .filter(status__in=OPEN_STATUSES, balance_due__gt=0)
+            .values('pk', 'invoice_number', 'client_id', 'balance_due')
+        )
+        for row in rows.iterator(chunk_size=CHUNK_SIZE):
+            self.by_pk[row['pk']] = row
+            self.by_number[row['invoice_number'].upper()] = row
+            self.by_amount[row['balance_due']].append(row)
+
+    def match(self, line):
+        """الفاتورة المطابقة للسطر أو None"""
+        for text in (line.reference, line.description):
+            for number in INVOICE_NUMBER_PATTERN.findall(text or ''):
+                invoice = self.by_number.get(number.upper())
+                if invoice is not None and invoice['balance_due'] > 0:
+                    return invoice
+
+        # المطابقة بالمبلغ فقط إذا لم تشترك فيه أكثر من فاتورة
+        candidates = self.by_amount.get(line.amount, [])
+        if len(candidates) == 1:
+            return candidates[0]
+        return None
+
+    def consume(self, invoice, amount):
+        """إنقاص الرصيد في الذاكرة حتى لا تُطابق الفاتورة نفسها مرتين بالمبلغ"""
+        if invoice['balance_due'] <= 0:
+            return
+        self.by_amount[invoice['balance_due']].remove(invoice)
+        invoice['balance_due'] -= amount
+        if invoice['balance_due'] > 0:
+            self.by_amount[invoice['balance_due']].append(invoice)
+
+
+def _existing_references(references):
+    """المراجع التي سبق استلام دفعاتها من بين مراجع الكشف (لتجاهل الأسطر المكررة)"""
+    return set(
+        Payment.objects.order_by()
+        .filter(status__in=RECEIVED_STATUSES, reference_number__in=references)
+        .values_list('reference_number', flat=True)
+    )
+
+
+def _pending_payments(references):
+    """الدفعات المعلقة حسب مرجعها: السطر المطابق يؤكدها بدلاً من إنشاء دفعة جديدة"""
+    pending = {}
+    rows = (
+        Payment.objects.order_by('pk')
+        .filter(status=Payment.PaymentStatus.PENDING, reference_number__in=references)
+        .values('pk', 'invoice_id', 'amount', 'reference_number')
+    )
+    for row in rows:
+        pending.setdefault(row['reference_number'], row)
+    return pending
+
+
+def _chunks(lines):
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _create_payments(matched, user, now):
+    numbers = numbering.allocate(numbering.PAYMENT_PREFIX, count=len(matched))
+    for start in range(0, len(matched), CHUNK_SIZE):
+        Payment.objects.bulk_create([
+            Payment(
+                payment_number=numbers[start + index],
+                invoice_id=invoice['pk'],
+                client_id=invoice['client_id'],
+                amount=line.amount,
+                payment_method=Payment.PaymentMethod.BANK_TRANSFER,
+                status=Payment.PaymentStatus.COMPLETED,
+                payment_date=line.date,
+                processed_at=now,
+                processed_by=user,
+                reference_number=line.reference,
+                notes=line.description,
+            )
+            for index, (line, invoice) in enumerate(matched[start:start + CHUNK_SIZE])
+        ])
+
+
+def _confirm_payments(confirmed, user, now, paid_by_invoice):
+    """تأكيد الدفعات المعلقة المطابقة وإضافة مبالغها إلى paid_by_invoice؛ يُرجع عددها"""
+    payments = {payment['pk']: payment for _, payment in confirmed}
+    ids = list(payments)
+    count = 0
+    for start in range(0, len(ids), CHUNK_SIZE):
+        # القفل وإعادة التحقق من الحالة يمنعان احتسابها مرتين مع process المتزامن
+        still_pending = list(
+            Payment.objects.select_for_update()
+            .filter(pk__in=ids[start:start + CHUNK_SIZE], status=Payment.PaymentStatus.PENDING)
+            .values_list('pk', flat=True)
+        )
+        Payment.objects.filter(pk__in=still_pending).update(
+            status=Payment.PaymentStatus.COMPLETED, processed_at=now, processed_by=user, updated_at=now
+        )
+        for pk in still_pending:
+            paid_by_invoice[payments[pk]['invoice_id']] += payments[pk]['amount']
+        count += len(still_pending)
+    return count
+
+
+def _apply_balances(paid_by_invoice, now):
+    """تحديث المدفوع والرصيد لجميع الفواتير المتأثرة ثم تحويل المسددة إلى مدفوعة"""
+    money = DecimalField(max_digits=12, decimal_places=2)
+    invoice_ids = list(paid_by_invoice)
+    for start in range(0, len(invoice_ids), CHUNK_SIZE):
+        chunk = invoice_ids[start:start + CHUNK_SIZE]
+        amount = Case(
+            *[When(pk=pk, then=Value(paid_by_invoice[pk])) for pk in chunk],
+            output_field=money
+        )
+        Invoice.objects.filter(pk__in=chunk).update(
+            amount_paid=F('amount_paid') + amount,
+            balance_due=F('balance_due') - amount,
+        )
+
+    settled = list(
+        Invoice.objects.select_for_update()
+        .filter(pk__in=invoice_ids, balance_due__lte=0, status__in=OPEN_STATUSES)
+        .order_by()
+        .values_list('pk', 'status')
+    )
+    Invoice.objects.filter(pk__in=[pk for pk, _ in settled]).update(
+        status=Invoice.InvoiceStatus.PAID, paid_at=now, updated_at=now
+    )
+    InvoiceStatusChange.objects.bulk_create([
+        InvoiceStatusChange(
+            invoice_id=pk, from_status=status,
+            to_status=Invoice.InvoiceStatus.PAID, reason=RECONCILE_REASON
+        )
+        for pk, status in settled
+    ], batch_size=CHUNK_SIZE)
+    return len(settled)
+
+
+def _lines_with_lookups(lines, looked_up, seen_references, pending_payments):
+    """
+    أسطر الكشف على دفعات؛ قبل كل دفعة تُقرأ الدفعات المسجلة بمراجعها فقط، فيتناسب
+    الاستعلام مع حجم الملف لا مع جدول المدفوعات كاملاً
+    """
+    for chunk in _chunks(lines):
+        references = {
+            line.reference for line in chunk
+            if isinstance(line, StatementLine) and line.reference
+        } - looked_up
+        if references:
+            looked_up |= references
+            seen_references |= _existing_references(references)
+            pending_payments.update(_pending_payments(references))
+        yield from chunk
+
+
+def reconcile_statement(lines, user, dry_run=False):
+    """مطابقة أسطر الكشف مع الفواتير وإنشاء الدفعات؛ يُرجع ملخص التسوية"""
+    index = InvoiceIndex()
+    seen_references, looked_up, pending_payments = set(), set(), {}
+    matched, confirmed, unmatched, errors = [], [], [], []
+    duplicates = error_count = total = 0
+    matched_amount = Decimal('0')
+
+    for line in _lines_with_lookups(lines, looked_up, seen_references, pending_payments):
+        total += 1
+        if isinstance(line, StatementRowError):
+            error_count += 1
+            if len(errors) < MAX_REPORTED_UNMATCHED:
+                errors.append({'line': line.line_number, 'error': line.message})
+            continue
+        if line.reference and line.reference in seen_references:
+            duplicates += 1
+            continue
+
+        payment = pending_payments.get(line.reference) if line.reference else None
+        if payment is not None and payment['amount'] == line.amount:
+            del pending_payments[line.reference]
+            seen_references.add(line.reference)
+            invoice = index.by_pk.get(payment['invoice_id'])
+            if invoice is not None:
+                index.consume(invoice, line.amount)
+            confirmed.append((line, payment))
+            matched_amount += line.amount
+            continue
+
+        invoice = index.match(line) if payment is None else None
+        if invoice is None:
+            if len(unmatched) < MAX_REPORTED_UNMATCHED:
+                unmatched.append({
+                    'line': line.line_number,
+                    'date': line.date.isoformat(),
+                    'amount': str(line.amount),
+                    'reference': line.reference,
+                    'description': line.description,
+                })
+            continue
+        if line.reference:
+            seen_references.add(line.reference)
+        index.consume(invoice, line.amount)
+        matched.append((line, invoice))
+        matched_amount += line.amount
+
+    invoices_paid = 0
+    confirmed_count = len(confirmed)
+    if (matched or confirmed) and not dry_run:
+        now = timezone.now()
+        paid_by_invoice = defaultdict(Decimal)
+        for line, invoice in matched:
+            paid_by_invoice[invoice['pk']] += line.amount
+        with transaction.atomic():
+            confirmed_count = _confirm_payments(confirmed, user, now, paid_by_invoice)
+            if matched:
+                _create_payments(matched, user, now)
+            invoices_paid = _apply_balances(paid_by_invoice, now)
+            billing_data_changed.send(sender=Payment, models=[Invoice, Payment])
+
+    return {
+        'dry_run': dry_run,
+        'lines': total,
+        'matched': len(matched),
+        'confirmed': confirmed_count,
+        'matched_amount': float(matched_amount),
+        'duplicates': duplicates,
+        'unmatched_count': total - len(matched) - len(confirmed) - duplicates - error_count,
+        'error_count': error_count,
+        'invoices_paid': invoices_paid,
+        'unmatched': unmatched,
+        'errors': errors,
+    }
@@ -0,0 +1,28 @@
+from celery import shared_task
+
+
+@shared_task(bind=True)
+def generate_invoice_batch(self, batch_id):
+    """توليد دفعة فواتير جماعية في الخلفية وتسجيل تقدمها"""
+    from .bulk import run_batch
+    from .models import InvoiceBatch
+
+    batch = InvoiceBatch.objects.get(pk=batch_id)
+    created = run_batch(batch)
+    return {'batch_id': batch.id, 'created_count': created}
+
+
+@shared_task
+def mark_overdue_invoices():
+    """نقل الفواتير التي تجاوزت تاريخ الاستحقاق إلى الحالة متأخرة"""
+    from .overdue import sweep
+
+    return {'marked_overdue': sweep()}
+
+
+@shared_task
+def render_invoice_pdf(invoice_id):
+    """رسم ملف PDF للفاتورة وتخزينه حسب بصمة محتواها"""
+    from .pdf import ensure_pdf
+
+    return {'invoice_id': invoice_id, 'file': ensure_pdf(invoice_id)}
@@ -1,3 +1,779 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from crm.models import Client
+from . import aging, balances, bulk, numbering, overdue, pdf, statements
+from .models import Invoice, InvoiceBatch, InvoiceItem, InvoiceStatusChange, NumberSequence, Payment
+from .serializers import InvoiceCreateUpdateSerializer
+
+User = get_user_model()
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class BillingTestCase(TestCase):
+    """بيانات مشتركة: مستخدم من الفريق وعميل"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='accountant', email='accountant@example.com', password='pass',
+            first_name='محاسب', last_name='المنصة', role='admin'
+        )
+        cls.customer = Client.objects.create(
+            first_name='عميل', last_name='أول', email='client@example.com', company_name='شركة العميل'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_invoice(self, number, **fields):
+        values = {
+            'invoice_number': number, 'client': self.customer, 'created_by': self.user,
+            'issue_date': date(2024, 1, 1), 'due_date': date(2024, 1, 31),
+        }
+        values.update(fields)
+        return Invoice.objects.create(**values)
+
+
+class NumberSequenceTests(BillingTestCase):
+    """حجز أرقام الفواتير والدفعات من عداد مقفل لكل (بادئة، سنة)"""
+
+    def test_allocates_consecutive_numbers_under_row_lock(self):
+        with mock.patch.object(
+            NumberSequence.objects, 'select_for_update', wraps=NumberSequence.objects.select_for_update
+        ) as select_for_update:
+            first = numbering.allocate(numbering.INVOICE_PREFIX, year=2024)
+            block = numbering.allocate(numbering.INVOICE_PREFIX, count=3, year=2024)
+        self.assertTrue(select_for_update.called)
+        self.assertEqual(first, ['INV-2024-00001'])
+        self.assertEqual(block, ['INV-2024-00002', 'INV-2024-00003', 'INV-2024-00004'])
+        self.assertEqual(NumberSequence.objects.get(prefix='INV', year=2024).last_value, 4)
+
+    def test_sequences_are_per_prefix_and_year(self):
+        numbering.allocate(numbering.INVOICE_PREFIX, count=5, year=2024)
+        self.assertEqual(numbering.allocate(numbering.INVOICE_PREFIX, year=2025), ['INV-2025-00001'])
+        self.assertEqual(numbering.allocate(numbering.PAYMENT_PREFIX, year=2024), ['PAY-2024-00001'])
+
+    def test_new_sequence_continues_from_numeric_maximum(self):
+        # المقارنة رقمية: 100000 أكبر من 99999 رغم أنها أصغر نصياً
+        self.create_invoice('INV-2024-99999')
+        self.create_invoice('INV-2024-100000')
+        self.create_invoice('INV-2024-manual')
+        self.assertEqual(numbering.allocate(numbering.INVOICE_PREFIX, year=2024), ['INV-2024-100001'])
+
+    def test_api_numbers_do_not_collide(self):
+        numbers = set()
+        for _ in range(3):
+            response = self.client.post('/api/billing/invoices/', {
+                'client': self.customer.pk, 'issue_date': '2024-01-01', 'due_date': '2024-01-31',
+                'items': [{'description': 'خدمة', 'quantity': '1', 'unit_price': '100'}],
+            }, format='json')
+            self.assertEqual(response.status_code, 201)
+            numbers.add(Invoice.objects.get(pk=response.data['id']).invoice_number)
+        self.assertEqual(len(numbers), 3)
+
+
+class InvoiceItemSyncTests(BillingTestCase):
+    """مزامنة عناصر الفاتورة جماعياً وحساب الإجماليات مرة واحدة"""
+
+    def create_with_items(self, *items):
+        response = self.client.post('/api/billing/invoices/', {
+            'client': self.customer.pk, 'issue_date': '2024-01-01', 'due_date': '2024-01-31',
+            'tax_rate': '15.00', 'discount_amount': '10.00',
+            'items': [
+                {'description': description, 'quantity': quantity, 'unit_price': price, 'order': order}
+                for order, (description, quantity, price) in enumerate(items)
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Invoice.objects.get(pk=response.data['id'])
+
+    def test_create_computes_totals(self):
+        invoice = self.create_with_items(('تصميم', '2', '100'), ('استضافة', '1', '50'))
+        self.assertEqual(invoice.subtotal, Decimal('250'))
+        self.assertEqual(invoice.tax_amount, Decimal('37.50'))
+        self.assertEqual(invoice.total_amount, Decimal('277.50'))
+        self.assertEqual(invoice.balance_due, Decimal('277.50'))
+        self.assertEqual(
+            sorted(invoice.items.values_list('total_amount', flat=True)), [Decimal('50'), Decimal('200')]
+        )
+
+    def test_update_creates_changes_and_deletes_items(self):
+        invoice = self.create_with_items(('تصميم', '2', '100'), ('استضافة', '1', '50'), ('دعم', '1', '30'))
+        design, hosting, support = invoice.items.order_by('order')
+
+        response = self.client.patch(f'/api/billing/invoices/{invoice.pk}/', {'items': [
+            {'id': design.pk, 'description': 'تصميم', 'quantity': '3', 'unit_price': '100', 'order': 0},
+            {'id': hosting.pk, 'description': 'استضافة', 'quantity': '1', 'unit_price': '50', 'order': 1},
+            {'description': 'تدريب', 'quantity': '2', 'unit_price': '25', 'order': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        items = {item.description: item for item in InvoiceItem.objects.filter(invoice=invoice)}
+        self.assertEqual(set(items), {'تصميم', 'استضافة', 'تدريب'})
+        self.assertEqual(items['تصميم'].pk, design.pk)
+        self.assertEqual(items['تصميم'].total_amount, Decimal('300'))
+        self.assertEqual(items['استضافة'].pk, hosting.pk)
+        self.assertEqual(items['تدريب'].total_amount, Decimal('50'))
+        self.assertFalse(InvoiceItem.objects.filter(pk=support.pk).exists())
+
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.subtotal, Decimal('400'))
+        self.assertEqual(invoice.total_amount, Decimal('450'))
+        self.assertEqual(invoice.balance_due, Decimal('450'))
+
+    def test_update_without_items_keeps_them(self):
+        invoice = self.create_with_items(('تصميم', '1', '100'))
+        response = self.client.patch(
+            f'/api/billing/invoices/{invoice.pk}/', {'discount_amount': '0.00'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.items.count(), 1)
+        self.assertEqual(invoice.total_amount, Decimal('115'))
+
+
+class InvoiceBalanceTests(BillingTestCase):
+    """المدفوع والرصيد المستحق يتغيران ذرياً مع الدفعات ولا يُكتب فوقهما"""
+
+    def setUp(self):
+        super().setUp()
+        self.invoice = self.create_invoice(
+            'INV-2024-00001', status=Invoice.InvoiceStatus.SENT,
+            subtotal=Decimal('100'), tax_amount=Decimal('15'),
+            total_amount=Decimal('115'), balance_due=Decimal('115')
+        )
+        InvoiceItem.objects.bulk_create([InvoiceItem(
+            invoice=self.invoice, description='خدمة', quantity=1, unit_price=100, total_amount=100
+        )])
+
+    def create_payment(self, amount, **fields):
+        values = {
+            'invoice': self.invoice.pk, 'client': self.customer.pk, 'amount': amount,
+            'payment_method': 'bank_transfer',
+            'payment_date': '2024-01-10',
+        }
+        values.update(fields)
+        response = self.client.post('/api/billing/payments/', values, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Payment.objects.get(pk=response.data['id'])
+
+    def balance(self):
+        self.invoice.refresh_from_db()
+        return self.invoice.amount_paid, self.invoice.balance_due
+
+    def balance_filter(self, value):
+        response = self.client.get('/api/billing/invoices/', {'balance': value})
+        return [invoice['id'] for invoice in response.data['results']]
+
+    def test_apply_payment(self):
+        self.assertEqual(balances.apply_payment(self.invoice.pk, Decimal('40')), Decimal('75'))
+        self.assertEqual(balances.apply_payment(self.invoice.pk, Decimal('-10')), Decimal('85'))
+        self.assertEqual(self.balance(), (Decimal('30'), Decimal('85')))
+
+    def test_process_and_refund_move_balance(self):
+        payment = self.create_payment('115.00')
+        self.assertEqual(self.balance(), (Decimal('0'), Decimal('115')))
+        self.assertEqual(self.balance_filter('outstanding'), [self.invoice.pk])
+
+        self.client.post(f'/api/billing/payments/{payment.pk}/process/')
+        self.assertEqual(self.balance(), (Decimal('115'), Decimal('0')))
+        self.assertEqual(self.invoice.status, Invoice.InvoiceStatus.PAID)
+        self.assertEqual(self.balance_filter('settled'), [self.invoice.pk])
+        self.assertEqual(self.balance_filter('outstanding'), [])
+
+        self.client.post(f'/api/billing/payments/{payment.pk}/refund/')
+        self.assertEqual(self.balance(), (Decimal('0'), Decimal('115')))
+        self.assertEqual(self.invoice.status, Invoice.InvoiceStatus.SENT)
+
+    def test_partial_filter(self):
+        self.create_payment('40.00', status='completed')
+        self.assertEqual(self.balance(), (Decimal('40'), Decimal('75')))
+        self.assertEqual(self.balance_filter('partial'), [self.invoice.pk])
+        self.assertEqual(self.balance_filter('settled'), [])
+
+    def test_mark_as_paid_settles_balance(self):
+        self.create_payment('40.00', status='completed')
+        response = self.client.post(f'/api/billing/invoices/{self.invoice.pk}/mark_as_paid/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balance(), (Decimal('115'), Decimal('0')))
+        self.assertEqual(self.invoice.status, Invoice.InvoiceStatus.PAID)
+        settlement = self.invoice.payments.get(amount=Decimal('75'))
+        self.assertEqual(settlement.status, Payment.PaymentStatus.COMPLETED)
+        self.assertEqual(self.balance_filter('settled'), [self.invoice.pk])
+        # التسوية دفعة حقيقية فلا يغيّرها إصلاح الأرصدة
+        self.assertEqual(balances.reconcile(), 0)
+
+    def test_status_actions_keep_concurrent_payments(self):
+        stale = Invoice.objects.get(pk=self.invoice.pk)
+        balances.apply_payment(self.invoice.pk, Decimal('50'))
+
+        # الكائن المحمل قبل الدفعة لا يكتب فوق المدفوع عند تغيير الحالة
+        with mock.patch('billing.views.InvoiceViewSet.get_object', return_value=stale):
+            self.client.post(f'/api/billing/invoices/{self.invoice.pk}/cancel/')
+        self.assertEqual(self.balance(), (Decimal('50'), Decimal('65')))
+        self.assertEqual(self.invoice.status, Invoice.InvoiceStatus.CANCELLED)
+
+    def test_invoice_update_keeps_concurrent_payments(self):
+        stale = Invoice.objects.get(pk=self.invoice.pk)
+        balances.apply_payment(self.invoice.pk, Decimal('50'))
+
+        serializer = InvoiceCreateUpdateSerializer(stale, data={'discount_amount': '5.00'}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertEqual(self.balance(), (Decimal('50'), Decimal('60')))
+        self.assertEqual(self.invoice.total_amount, Decimal('110'))
+
+    def test_completed_payment_amount_and_status_are_read_only(self):
+        payment = self.create_payment('40.00', status='completed')
+        response = self.client.patch(
+            f'/api/billing/payments/{payment.pk}/',
+            {'amount': '100.00', 'status': 'pending', 'notes': 'ملاحظة'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        payment.refresh_from_db()
+        self.assertEqual((payment.amount, payment.status, payment.notes), (Decimal('40'), 'completed', 'ملاحظة'))
+        self.assertEqual(self.balance(), (Decimal('40'), Decimal('75')))
+
+
+    def test_completed_payment_must_be_refunded_before_delete(self):
+        payment = self.create_payment('40.00', status='completed')
+        response = self.client.delete(f'/api/billing/payments/{payment.pk}/')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Payment.objects.filter(pk=payment.pk).exists())
+        self.assertEqual(self.balance(), (Decimal('40'), Decimal('75')))
+
+        self.client.post(f'/api/billing/payments/{payment.pk}/refund/')
+        self.assertEqual(self.client.delete(f'/api/billing/payments/{payment.pk}/').status_code, 204)
+        self.assertEqual(self.balance(), (Decimal('0'), Decimal('115')))
+        self.assertEqual(balances.reconcile(), 0)
+
+class OverdueSweepTests(BillingTestCase):
+    """نقل الفواتير المرسلة أو المعروضة بعد الاستحقاق إلى OVERDUE وتسجيل الانتقال"""
+
+    def test_sweep_marks_past_due_and_records_transitions(self):
+        today = date(2024, 3, 1)
+        sent = self.create_invoice('INV-1', status=Invoice.InvoiceStatus.SENT, due_date=date(2024, 2, 1))
+        viewed = self.create_invoice('INV-2', status=Invoice.InvoiceStatus.VIEWED, due_date=date(2024, 2, 29))
+        due_today = self.create_invoice('INV-3', status=Invoice.InvoiceStatus.SENT, due_date=today)
+        paid = self.create_invoice('INV-4', status=Invoice.InvoiceStatus.PAID, due_date=date(2024, 1, 1))
+        draft = self.create_invoice('INV-5', due_date=date(2024, 1, 1))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(overdue.sweep(today=today), 2)
+        # قراءة الصفوف المستحقة ثم إدراج الانتقالات دفعة واحدة وتحديث واحد
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'INSERT', 'UPDATE'])
+
+        statuses = dict(Invoice.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[sent.pk], Invoice.InvoiceStatus.OVERDUE)
+        self.assertEqual(statuses[viewed.pk], Invoice.InvoiceStatus.OVERDUE)
+        self.assertEqual(statuses[due_today.pk], Invoice.InvoiceStatus.SENT)
+        self.assertEqual(statuses[paid.pk], Invoice.InvoiceStatus.PAID)
+        self.assertEqual(statuses[draft.pk], Invoice.InvoiceStatus.DRAFT)
+
+        self.assertEqual(
+            set(InvoiceStatusChange.objects.values_list('invoice_id', 'from_status', 'to_status', 'reason')),
+            {
+                (sent.pk, 'sent', 'overdue', overdue.SWEEP_REASON),
+                (viewed.pk, 'viewed', 'overdue', overdue.SWEEP_REASON),
+            }
+        )
+
+        # التشغيل التالي لا يجد ما ينقله
+        self.assertEqual(overdue.sweep(today=today), 0)
+        self.assertEqual(InvoiceStatusChange.objects.count(), 2)
+
+        response = self.client.get('/api/billing/invoices/', {'status': 'overdue'})
+        self.assertEqual({invoice['id'] for invoice in response.data['results']}, {sent.pk, viewed.pk})
+
+    def test_sweep_updates_in_batches(self):
+        today = date(2024, 3, 1)
+        for number in range(5):
+            self.create_invoice(f'INV-{number}', status=Invoice.InvoiceStatus.SENT, due_date=date(2024, 2, 1))
+
+        with mock.patch.object(overdue, 'BATCH_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(overdue.sweep(today=today), 5)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 3)
+        self.assertFalse(Invoice.objects.exclude(status=Invoice.InvoiceStatus.OVERDUE).exists())
+        self.assertEqual(InvoiceStatusChange.objects.count(), 5)
+
+
+class StatementImportTests(BillingTestCase):
+    """استيراد الكشف: تجاهل المراجع المكررة وتأكيد المعلقة والإبلاغ عن الأسطر التالفة"""
+
+    def setUp(self):
+        super().setUp()
+        self.invoice = self.create_invoice(
+            'INV-2024-00001', status=Invoice.InvoiceStatus.SENT,
+            subtotal=Decimal('100'), total_amount=Decimal('100'), balance_due=Decimal('100')
+        )
+
+    def import_csv(self, *rows, dry_run=False):
+        content = 'date,amount,reference,description\n' + ''.join(f'{row}\n' for row in rows)
+        response = self.client.post('/api/billing/payments/import_statement/', {
+            'file': SimpleUploadedFile('statement.csv', content.encode('utf-8')),
+            'format': 'csv', 'dry_run': 'true' if dry_run else 'false',
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_long_reference_is_deduplicated_on_reimport(self):
+        reference = 'TRX' + '7' * 150
+        row = f'2024-01-10,40.00,{reference},INV-2024-00001'
+
+        first = self.import_csv(row)
+        self.assertEqual((first['matched'], first['duplicates']), (1, 0))
+        payment = Payment.objects.get()
+        self.assertEqual(payment.reference_number, reference[:statements.REFERENCE_MAX_LENGTH])
+
+        second = self.import_csv(row)
+        self.assertEqual((second['matched'], second['duplicates']), (0, 1))
+        self.assertEqual(Payment.objects.count(), 1)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.balance_due, Decimal('60'))
+
+    def test_pending_payment_is_confirmed_instead_of_duplicated(self):
+        pending = Payment.objects.create(
+            payment_number='PAY-2024-00001', invoice=self.invoice, client=self.customer,
+            amount=Decimal('100'), payment_method=Payment.PaymentMethod.CREDIT_CARD,
+            payment_date=date(2024, 1, 9), reference_number='TRX-1',
+        )
+
+        preview = self.import_csv('2024-01-10,100.00,TRX-1,', dry_run=True)
+        self.assertEqual((preview['matched'], preview['confirmed']), (0, 1))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Payment.PaymentStatus.PENDING)
+
+        result = self.import_csv('2024-01-10,100.00,TRX-1,')
+        self.assertEqual((result['matched'], result['confirmed'], result['invoices_paid']), (0, 1, 1))
+        self.assertEqual(Payment.objects.count(), 1)
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, Payment.PaymentStatus.COMPLETED)
+        self.assertEqual(pending.processed_by, self.user)
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.status, Invoice.InvoiceStatus.PAID)
+        self.assertEqual(self.invoice.balance_due, Decimal('0'))
+
+        # بعد التأكيد يصبح المرجع مكرراً
+        again = self.import_csv('2024-01-10,100.00,TRX-1,')
+        self.assertEqual((again['confirmed'], again['duplicates']), (0, 1))
+
+    def test_references_are_looked_up_per_chunk(self):
+        Payment.objects.create(
+            payment_number='PAY-2024-00001', invoice=self.invoice, client=self.customer,
+            amount=Decimal('10'), payment_method=Payment.PaymentMethod.BANK_TRANSFER,
+            payment_date=date(2024, 1, 5), reference_number='TRX-OLD', status=Payment.PaymentStatus.COMPLETED,
+        )
+        with mock.patch.object(statements, 'CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+            result = self.import_csv(
+                '2024-01-10,10.00,TRX-1,INV-2024-00001',
+                '2024-01-10,10.00,TRX-OLD,INV-2024-00001',
+                '2024-01-10,10.00,TRX-2,INV-2024-00001',
+                # مكرر داخل الملف نفسه في دفعة لاحقة
+                '2024-01-10,10.00,TRX-1,INV-2024-00001',
+            )
+        self.assertEqual((result['matched'], result['duplicates']), (2, 2))
+        lookups = [
+            query['sql'] for query in queries
+            if 'reference_number' in query['sql'] and query['sql'].startswith('SELECT')
+        ]
+        # استعلامان (المستلمة والمعلقة) لكل دفعة، ومقيدان بمراجع الملف
+        self.assertEqual(len(lookups), 4)
+        self.assertTrue(all('"reference_number" IN' in sql for sql in lookups))
+
+    def test_bad_rows_are_reported_per_line(self):
+        result = self.import_csv(
+            ',25.00,TRX-1,INV-2024-00001',
+            '31/02/2024,25.00,TRX-2,INV-2024-00001',
+            '2024-01-10,abc,TRX-3,INV-2024-00001',
+            '2024-01-10,25.00,TRX-4,INV-2024-00001',
+        )
+        self.assertEqual(result['matched'], 1)
+        self.assertEqual(result['error_count'], 3)
+        self.assertEqual(result['unmatched_count'], 0)
+        self.assertEqual([error['line'] for error in result['errors']], [2, 3, 4])
+        self.assertEqual(Payment.objects.get().reference_number, 'TRX-4')
+
+
+class InvoicePdfHashTests(BillingTestCase):
+    """بصمة ملف الفاتورة تتغير بتغير ما يُرسم فقط"""
+
+    def digest(self, invoice):
+        return pdf.content_hash(pdf.load_document(invoice.pk))
+
+    def test_hash_ignores_fields_that_are_not_drawn(self):
+        invoice = self.create_invoice('INV-2024-00001', total_amount=Decimal('100'), balance_due=Decimal('100'))
+        InvoiceItem.objects.bulk_create([InvoiceItem(
+            invoice=invoice, description='خدمة', quantity=1, unit_price=100, total_amount=100
+        )])
+        original = self.digest(invoice)
+
+        Invoice.objects.filter(pk=invoice.pk).update(status=Invoice.InvoiceStatus.SENT)
+        Client.objects.filter(pk=self.customer.pk).update(phone='0500000000')
+        self.assertEqual(self.digest(invoice), original)
+
+        Invoice.objects.filter(pk=invoice.pk).update(balance_due=Decimal('40'))
+        self.assertNotEqual(self.digest(invoice), original)
+
+        Invoice.objects.filter(pk=invoice.pk).update(balance_due=Decimal('100'))
+        InvoiceItem.objects.filter(invoice=invoice).update(description='خدمة معدلة')
+        self.assertNotEqual(self.digest(invoice), original)
+
+    def test_endpoint_resolves_invoice_through_viewset(self):
+        invoice = self.create_invoice('INV-2024-00001')
+        self.assertEqual(self.client.get('/api/billing/invoices/abc/pdf/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/billing/invoices/{invoice.pk + 1}/pdf/').status_code, 404)
+        with mock.patch.object(pdf, 'enqueue_render') as enqueue_render:
+            response = self.client.get(f'/api/billing/invoices/{invoice.pk}/pdf/')
+        self.assertEqual(response.status_code, 202)
+        enqueue_render.assert_called_once_with(invoice.pk, self.digest(invoice))
+
+
+class ClientLedgerTests(BillingTestCase):
+    """كشف حساب العميل: تصفح بالمؤشر مع رصيد تراكمي متصل بين الصفحات"""
+
+    def setUp(self):
+        super().setUp()
+        sent = Invoice.InvoiceStatus.SENT
+        first = self.create_invoice('INV-1', status=sent, issue_date=date(2024, 1, 5), total_amount=Decimal('100'))
+        self.create_invoice('INV-2', status=sent, issue_date=date(2024, 1, 10), total_amount=Decimal('50'))
+        self.create_invoice('INV-3', status=sent, issue_date=date(2024, 1, 10), total_amount=Decimal('25'))
+        self.create_invoice('INV-4', status=sent, issue_date=date(2024, 2, 1), total_amount=Decimal('200'))
+        # المسودات والملغاة والدفعات غير المكتملة لا تظهر
+        self.create_invoice('INV-5', issue_date=date(2024, 1, 6), total_amount=Decimal('999'))
+        self.create_invoice(
+            'INV-6', status=Invoice.InvoiceStatus.CANCELLED, issue_date=date(2024, 1, 6), total_amount=Decimal('999')
+        )
+        for number, day, amount, payment_status in (
+            ('PAY-1', date(2024, 1, 10), '30', Payment.PaymentStatus.COMPLETED),
+            ('PAY-2', date(2024, 1, 20), '100', Payment.PaymentStatus.COMPLETED),
+            ('PAY-3', date(2024, 1, 21), '999', Payment.PaymentStatus.PENDING),
+        ):
+            Payment.objects.create(
+                payment_number=number, invoice=first, client=self.customer, amount=Decimal(amount),
+                payment_method=Payment.PaymentMethod.BANK_TRANSFER, payment_date=day, status=payment_status,
+            )
+
+    def url(self, **params):
+        return f'/api/billing/client-statements/{self.customer.pk}/', params
+
+    def test_pages_follow_keyset_order_with_running_balance(self):
+        path, params = self.url(limit=2)
+        pages = []
+        response = self.client.get(path, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 2])
+        entries = [(entry['reference'], entry['balance']) for page in pages for entry in page['results']]
+        # في اليوم نفسه: الفواتير أولاً ثم المدفوعات
+        self.assertEqual(entries, [
+            ('INV-1', 100.0), ('INV-2', 150.0), ('INV-3', 175.0),
+            ('PAY-1', 145.0), ('PAY-2', 45.0), ('INV-4', 245.0),
+        ])
+        # رصيد افتتاح كل صفحة هو رصيد إغلاق السابقة
+        for previous, page in zip(pages, pages[1:]):
+            self.assertEqual(page['opening_balance'], previous['closing_balance'])
+
+        full = self.client.get(path, {'limit': 100}).data
+        self.assertIsNone(full['next'])
+        self.assertEqual([(entry['reference'], entry['balance']) for entry in full['results']], entries)
+
+    def test_date_range_starts_from_opening_balance(self):
+        path, params = self.url(date_from='2024-01-10', date_to='2024-01-31')
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['opening_balance'], 100.0)
+        self.assertEqual(
+            [entry['reference'] for entry in response.data['results']], ['INV-2', 'INV-3', 'PAY-1', 'PAY-2']
+        )
+        self.assertEqual(response.data['closing_balance'], 45.0)
+
+    def test_tampered_cursor_is_rejected(self):
+        path, params = self.url(cursor='not-a-cursor')
+        self.assertEqual(self.client.get(path, params).status_code, 400)
+
+
+class SparseFieldsetTests(BillingTestCase):
+    """شكل استجابة القوائم وعدد استعلاماتها مع ?fields= و ?expand= وبدونهما"""
+
+    def setUp(self):
+        super().setUp()
+        for number in range(3):
+            invoice = self.create_invoice(f'INV-{number}')
+            InvoiceItem.objects.create(invoice=invoice, description='تصميم', quantity=Decimal('2'), unit_price=Decimal('10'))
+
+    def list_invoices(self, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get('/api/billing/invoices/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_default_list_leaves_out_nested_items(self):
+        results = self.list_invoices(2)
+        self.assertEqual(len(results), 3)
+        self.assertNotIn('items', results[0])
+        self.assertIn('client_name', results[0])
+        self.assertIn('created_by_name', results[0])
+
+    def test_expand_alone_adds_items_to_the_default_list(self):
+        results = self.list_invoices(3, expand='items')
+        self.assertIn('client_name', results[0])
+        self.assertEqual([item['description'] for item in results[0]['items']], ['تصميم'])
+
+    def test_fields_limit_the_response_to_plain_columns(self):
+        results = self.list_invoices(2, fields='id,invoice_number,client_name,total_amount')
+        self.assertEqual(set(results[0]), {'id', 'invoice_number', 'client_name', 'total_amount'})
+        self.assertEqual(
+            {row['invoice_number']: row['total_amount'] for row in results},
+            {'INV-0': '23.00', 'INV-1': '23.00', 'INV-2': '23.00'}
+        )
+        self.assertEqual(results[0]['client_name'], 'شركة العميل')
+
+    def test_fields_with_expand(self):
+        results = self.list_invoices(3, fields='id', expand='items')
+        self.assertEqual(set(results[0]), {'id', 'items'})
+        self.assertEqual(len(results[0]['items']), 1)
+
+    def test_retrieve_keeps_items_by_default(self):
+        invoice = Invoice.objects.get(invoice_number='INV-0')
+        response = self.client.get(f'/api/billing/invoices/{invoice.pk}/')
+        self.assertEqual(len(response.data['items']), 1)
+
+    def test_unknown_fields_and_expansions_are_rejected(self):
+        self.assertEqual(self.client.get('/api/billing/invoices/', {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/billing/invoices/', {'expand': 'client_name'}).status_code, 400)
+
+    def test_payment_list_fields(self):
+        invoice = Invoice.objects.get(invoice_number='INV-0')
+        Payment.objects.create(
+            payment_number='PAY-1', invoice=invoice, client=self.customer, amount=Decimal('5'),
+            payment_method=Payment.PaymentMethod.CREDIT_CARD, payment_date=date(2024, 1, 5),
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/billing/payments/', {'fields': 'payment_number,invoice_number,amount'})
+        self.assertEqual(response.data['results'], [
+            {'payment_number': 'PAY-1', 'invoice_number': 'INV-0', 'amount': '5.00'}
+        ])
+
+
+class BulkInvoiceGenerationTests(BillingTestCase):
+    """توليد الفواتير جماعياً: الدفعات والتحقق والترقيم المتصل"""
+
+    def create_batch(self, count, **template):
+        values = {
+            'items': [{'description': 'اشتراك شهري', 'quantity': '1', 'unit_price': '100.00'}],
+            'issue_date': '2024-01-01', 'due_date': '2024-01-31', 'tax_rate': '15.00',
+            'discount_amount': '0.00', 'status': Invoice.InvoiceStatus.DRAFT,
+        }
+        values.update(template)
+        return InvoiceBatch.objects.create(
+            template=values, targets=[{'client': self.customer.pk}] * count,
+            total_count=count, created_by=self.user,
+        )
+
+    def test_invoices_are_created_in_chunks_with_consecutive_numbers(self):
+        batch = self.create_batch(5)
+        with mock.patch.object(bulk, 'CHUNK_SIZE', 2), mock.patch.object(
+            bulk.numbering, 'allocate', wraps=numbering.allocate
+        ) as allocate:
+            self.assertEqual(bulk.run_batch(batch), 5)
+        # حجز الأرقام لكل دفعة على حدة
+        self.assertEqual([call.kwargs['count'] for call in allocate.call_args_list], [2, 2, 1])
+
+        year = timezone.now().year
+        numbers = sorted(Invoice.objects.values_list('invoice_number', flat=True))
+        self.assertEqual(numbers, [f'INV-{year}-{value:05d}' for value in range(1, 6)])
+        self.assertEqual(InvoiceItem.objects.count(), 5)
+        self.assertTrue(all(invoice.total_amount == Decimal('115.00') for invoice in Invoice.objects.all()))
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.job_status, InvoiceBatch.JobStatus.COMPLETED)
+        self.assertEqual((batch.created_count, batch.progress), (5, 100))
+        self.assertEqual((batch.first_number, batch.last_number), (numbers[0], numbers[-1]))
+
+    def test_failed_chunk_leaves_no_gap_in_numbering(self):
+        batch = self.create_batch(4)
+        bulk_create = InvoiceItem.objects.bulk_create
+        calls = []
+
+        def fail_second_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('انقطاع الاتصال')
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(bulk, 'CHUNK_SIZE', 2), \
+                mock.patch.object(InvoiceItem.objects, 'bulk_create', side_effect=fail_second_chunk):
+            with self.assertRaises(RuntimeError):
+                bulk.run_batch(batch)
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.job_status, InvoiceBatch.JobStatus.FAILED)
+        self.assertEqual(batch.created_count, 2)
+        self.assertEqual(Invoice.objects.count(), 2)
+        # أرقام الدفعة الفاشلة أُعيدت مع معاملتها
+        year = timezone.now().year
+        self.assertEqual(batch.last_number, f'INV-{year}-00002')
+        self.assertEqual(numbering.next_invoice_number(), f'INV-{year}-00003')
+
+    def test_unknown_clients_fail_before_numbers_are_allocated(self):
+        batch = self.create_batch(1)
+        batch.targets = [{'client': self.customer.pk}, {'client': 9999}]
+        batch.save(update_fields=['targets'])
+
+        with self.assertRaises(ValueError):
+            bulk.run_batch(batch)
+
+        batch.refresh_from_db()
+        self.assertEqual(batch.job_status, InvoiceBatch.JobStatus.FAILED)
+        self.assertIn('9999', batch.error_message)
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(NumberSequence.objects.exists())
+
+    def test_sent_template_records_sent_at(self):
+        bulk.run_batch(self.create_batch(2, status=Invoice.InvoiceStatus.SENT))
+        self.assertFalse(Invoice.objects.filter(sent_at__isnull=True).exists())
+        self.assertEqual(set(Invoice.objects.values_list('status', flat=True)), {Invoice.InvoiceStatus.SENT})
+
+        bulk.run_batch(self.create_batch(1))
+        self.assertIsNone(Invoice.objects.get(status=Invoice.InvoiceStatus.DRAFT).sent_at)
+
+    def test_request_without_targets_is_rejected(self):
+        response = self.client.post('/api/billing/invoices/bulk_generate/', {
+            'template': {
+                'items': [{'description': 'اشتراك', 'quantity': '1', 'unit_price': '100.00'}],
+                'issue_date': '2024-01-01', 'due_date': '2024-01-31',
+            },
+            'targets': [],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('targets', response.data)
+        self.assertFalse(InvoiceBatch.objects.exists())
+
+
+class ReceivablesAgingTests(BillingTestCase):
+    """توزيع الرصيد المستحق على فترات التأخير عند حدود كل فترة"""
+
+    as_of = date(2024, 6, 30)
+
+    def create_due(self, number, days_late, balance, status=Invoice.InvoiceStatus.SENT):
+        return self.create_invoice(
+            number, status=status, issue_date=date(2024, 1, 1),
+            due_date=self.as_of - timedelta(days=days_late), balance_due=Decimal(balance)
+        )
+
+    def test_bucket_boundaries(self):
+        self.create_due('INV-1', -1, '1')       # يستحق غداً
+        self.create_due('INV-2', 0, '2')        # يستحق اليوم
+        self.create_due('INV-3', 30, '4')
+        self.create_due('INV-4', 31, '8')
+        self.create_due('INV-5', 60, '16', status=Invoice.InvoiceStatus.VIEWED)
+        self.create_due('INV-6', 61, '32')
+        self.create_due('INV-7', 90, '64', status=Invoice.InvoiceStatus.OVERDUE)
+        self.create_due('INV-8', 91, '128')
+        # الفواتير غير المفتوحة لا تدخل في الأعمار
+        self.create_due('INV-9', 45, '1000', status=Invoice.InvoiceStatus.DRAFT)
+        self.create_due('INV-10', 45, '1000', status=Invoice.InvoiceStatus.PAID)
+
+        report = aging.ar_aging(self.as_of)
+        expected = {
+            'current': 1.0, 'days_0_30': 6.0, 'days_31_60': 24.0,
+            'days_61_90': 96.0, 'days_90_plus': 128.0, 'total': 255.0,
+        }
+        self.assertEqual(report['totals'], expected)
+        self.assertEqual(report['clients'], [
+            {'client': self.customer.pk, 'client_name': 'شركة العميل', **expected}
+        ])
+
+    def test_clients_without_balance_are_left_out(self):
+        other = Client.objects.create(first_name='عميل', last_name='ثان', email='other@example.com', company_name='أخرى')
+        self.create_due('INV-1', 10, '50')
+        self.create_invoice(
+            'INV-2', client=other, status=Invoice.InvoiceStatus.SENT,
+            due_date=self.as_of - timedelta(days=10), balance_due=Decimal('0')
+        )
+        report = aging.ar_aging(self.as_of)
+        self.assertEqual([client['client'] for client in report['clients']], [self.customer.pk])
+        self.assertEqual(aging.ar_aging(self.as_of, client_id=other.pk)['clients'], [])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class StatisticsTests(BillingTestCase):
+    """قيم إحصائيات الفواتير والمدفوعات وتحديثها بعد تغيير البيانات"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_invoice_statistics(self):
+        today = timezone.now().date()
+        status = Invoice.InvoiceStatus
+        self.create_invoice('INV-1', status=status.PAID, total_amount=Decimal('100'))
+        self.create_invoice('INV-2', status=status.SENT, due_date=today + timedelta(days=5), total_amount=Decimal('200'))
+        # تجاوزت الاستحقاق ولم تنقلها المهمة الدورية بعد
+        self.create_invoice('INV-3', status=status.VIEWED, due_date=today - timedelta(days=1), total_amount=Decimal('300'))
+        self.create_invoice('INV-4', status=status.OVERDUE, due_date=today - timedelta(days=40), total_amount=Decimal('400'))
+        self.create_invoice('INV-5', total_amount=Decimal('50'))
+
+        response = self.client.get('/api/billing/invoices/statistics/')
+        self.assertEqual(response.data, {
+            'total_invoices': 5, 'total_amount': 1050.0,
+            'paid_invoices': 1, 'paid_amount': 100.0,
+            # المتأخرة ما زالت بانتظار الدفع
+            'pending_invoices': 3, 'pending_amount': 900.0,
+            'overdue_invoices': 2, 'overdue_amount': 700.0,
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_invoice('INV-6', status=status.OVERDUE, total_amount=Decimal('25'))
+        response = self.client.get('/api/billing/invoices/statistics/')
+        self.assertEqual((response.data['pending_invoices'], response.data['pending_amount']), (4, 925.0))
+        self.assertEqual(response.data['overdue_invoices'], 3)
+
+    def test_invoice_statistics_follow_filters(self):
+        other = Client.objects.create(first_name='عميل', last_name='ثان', email='other@example.com', company_name='أخرى')
+        self.create_invoice('INV-1', status=Invoice.InvoiceStatus.PAID, total_amount=Decimal('100'))
+        self.create_invoice('INV-2', client=other, status=Invoice.InvoiceStatus.PAID, total_amount=Decimal('70'))
+
+        response = self.client.get('/api/billing/invoices/statistics/', {'client': other.pk})
+        self.assertEqual((response.data['total_invoices'], response.data['paid_amount']), (1, 70.0))
+
+    def test_payment_statistics(self):
+        invoice = self.create_invoice('INV-1', status=Invoice.InvoiceStatus.SENT)
+        for number, (amount, payment_status) in enumerate([
+            ('40', Payment.PaymentStatus.COMPLETED),
+            ('60', Payment.PaymentStatus.COMPLETED),
+            ('25', Payment.PaymentStatus.PENDING),
+            ('10', Payment.PaymentStatus.FAILED),
+        ]):
+            Payment.objects.create(
+                payment_number=f'PAY-{number}', invoice=invoice, client=self.customer, amount=Decimal(amount),
+                payment_method=Payment.PaymentMethod.CREDIT_CARD, payment_date=date(2024, 1, 5),
+                status=payment_status,
+            )
+
+        response = self.client.get('/api/billing/payments/statistics/')
+        self.assertEqual(response.data, {
+            'total_payments': 4, 'total_amount': 135.0,
+            'completed_payments': 2, 'completed_amount': 100.0,
+            'pending_payments': 1, 'pending_amount': 25.0,
+        })
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import InvoiceViewSet, PaymentViewSet
+from .views import InvoiceViewSet, PaymentViewSet, InvoiceBatchViewSet, ClientStatementViewSet
 
 router = DefaultRouter()
 router.register(r'invoices', InvoiceViewSet, basename='invoice')
 router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'invoice-batches', InvoiceBatchViewSet, basename='invoice-batch')
+router.register(r'client-statements', ClientStatementViewSet, basename='client-statement')
 
 urlpatterns = [
     path('', include(router.urls)),
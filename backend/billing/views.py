@@ -2,24 +2,42 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework import filters
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import Sum, Q
-from .models import Invoice, InvoiceItem, Payment
+from django.db.models import Count, Sum, Q
+from django.http import FileResponse, Http404
+from rest_framework.reverse import reverse
+from crm.models import Client
+from .models import Invoice, InvoiceItem, InvoiceBatch, Payment
+from . import aging, balances, caching, ledger, numbering, pdf, statements
+from .fieldsets import SparseFieldsetMixin
 from .serializers import (
     InvoiceSerializer, InvoiceCreateUpdateSerializer,
-    InvoiceItemSerializer, PaymentSerializer
+    InvoiceItemSerializer, PaymentSerializer,
+    BulkInvoiceSerializer, InvoiceBatchSerializer,
+    ClientStatementQuerySerializer
 )
+from .tasks import generate_invoice_batch
 
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet لإدارة الفواتير
     """
     permission_classes = [IsAuthenticated]
+    filter_backends = [filters.OrderingFilter]
+    ordering_fields = ['issue_date', 'due_date', 'total_amount', 'balance_due', 'created_at']
+    sparse_select_related = {'client_name': 'client', 'project_name': 'project', 'created_by_name': 'created_by'}
+    sparse_prefetch_related = {'items': 'items'}
+    sparse_values = {'client_name': 'client__company_name', 'project_name': 'project__title'}
     
     def get_queryset(self):
-        queryset = Invoice.objects.select_related('client', 'project', 'created_by').prefetch_related('items', 'payments')
-        
+        queryset = self.apply_sparse_relations(Invoice.objects.all())
+        return self.filter_by_params(queryset)
+    
+    def filter_by_params(self, queryset):
+        """تطبيق مرشحات الطلب على الاستعلام"""
         # فلترة حسب الحالة
         status_filter = self.request.query_params.get('status', None)
         if status_filter:
@@ -43,6 +61,15 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         if end_date:
             queryset = queryset.filter(issue_date__lte=end_date)
         
+        # فلترة حسب الرصيد: outstanding (عليها رصيد) أو partial (مدفوعة جزئياً) أو settled (مسددة)
+        balance = self.request.query_params.get('balance', None)
+        if balance == 'outstanding':
+            queryset = queryset.filter(balance_due__gt=0)
+        elif balance == 'partial':
+            queryset = queryset.filter(balance_due__gt=0, amount_paid__gt=0)
+        elif balance == 'settled':
+            queryset = queryset.filter(balance_due__lte=0)
+        
         return queryset
     
     def get_serializer_class(self):
@@ -58,7 +85,11 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         if invoice.status == Invoice.InvoiceStatus.DRAFT:
             invoice.status = Invoice.InvoiceStatus.SENT
             invoice.sent_at = timezone.now()
-            invoice.save()
+            # الحقول المتغيرة فقط حتى لا يُكتب فوق المدفوع والرصيد المحدثين بالتوازي
+            invoice.save(update_fields=['status', 'sent_at', 'updated_at'])
+            
+            # تجهيز ملف PDF في الخلفية ليكون جاهزاً للإرسال والتنزيل
+            transaction.on_commit(lambda: pdf.enqueue_render(invoice.pk))
             
             # هنا يمكن إضافة منطق إرسال البريد الإلكتروني
             
@@ -71,16 +102,74 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             'error': 'لا يمكن إرسال الفاتورة في هذه الحالة'
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=True, methods=['get'])
+    def pdf(self, request, pk=None):
+        """تنزيل ملف PDF للفاتورة من التخزين، أو جدولة رسمه إن تغيرت الفاتورة"""
+        invoice = self.get_object()
+        document = pdf.load_document(invoice.pk)
+        if document is None:
+            raise Http404
+        
+        digest, path = pdf.cached_pdf(document)
+        etag = f'"{digest}"'
+        if path is not None:
+            if request.headers.get('If-None-Match') == etag:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = FileResponse(
+                    open(path, 'rb'), content_type='application/pdf',
+                    filename=f"{document['invoice_number']}.pdf"
+                )
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        
+        pdf.enqueue_render(document['pk'], digest)
+        response = Response({
+            'message': 'جاري تجهيز ملف الفاتورة، يرجى المحاولة بعد قليل',
+            'retry_url': reverse('invoice-pdf', args=[document['pk']], request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+        response['Retry-After'] = '5'
+        return response
+    
     @action(detail=True, methods=['post'])
     def mark_as_paid(self, request, pk=None):
-        """تحديد الفاتورة كمدفوعة"""
+        """تحديد الفاتورة كمدفوعة مع تسوية رصيدها المتبقي بدفعة مكتملة"""
         invoice = self.get_object()
         
         if invoice.status != Invoice.InvoiceStatus.PAID:
-            invoice.status = Invoice.InvoiceStatus.PAID
-            invoice.paid_at = timezone.now()
-            invoice.save()
+            # رقم الدفعة يُحجز خارج المعاملة حتى لا يبقى عداد الأرقام مقفلاً
+            payment_number = numbering.next_payment_number() if invoice.balance_due > 0 else None
             
+            with transaction.atomic():
+                invoice = Invoice.objects.select_for_update().get(pk=invoice.pk)
+                if invoice.status == Invoice.InvoiceStatus.PAID:
+                    return Response({
+                        'error': 'الفاتورة مدفوعة بالفعل'
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                
+                # الرصيد المتبقي يُسجَّل دفعةً حتى يبقى المدفوع مطابقاً للمدفوعات المكتملة
+                if invoice.balance_due > 0:
+                    now = timezone.now()
+                    Payment.objects.create(
+                        payment_number=payment_number or numbering.next_payment_number(),
+                        invoice=invoice,
+                        client_id=invoice.client_id,
+                        amount=invoice.balance_due,
+                        payment_method=Payment.PaymentMethod.OTHER,
+                        status=Payment.PaymentStatus.COMPLETED,
+                        payment_date=now.date(),
+                        processed_at=now,
+                        processed_by=request.user,
+                        notes='تسوية الرصيد المتبقي عند تحديد الفاتورة كمدفوعة'
+                    )
+                    balances.apply_payment(invoice.pk, invoice.balance_due)
+                
+                invoice.status = Invoice.InvoiceStatus.PAID
+                invoice.paid_at = timezone.now()
+                invoice.save(update_fields=['status', 'paid_at', 'updated_at'])
+            
+            invoice.refresh_from_db()
             return Response({
                 'message': 'تم تحديد الفاتورة كمدفوعة',
                 'invoice': InvoiceSerializer(invoice).data
@@ -97,7 +186,7 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         
         if invoice.status not in [Invoice.InvoiceStatus.PAID, Invoice.InvoiceStatus.CANCELLED]:
             invoice.status = Invoice.InvoiceStatus.CANCELLED
-            invoice.save()
+            invoice.save(update_fields=['status', 'updated_at'])
             
             return Response({
                 'message': 'تم إلغاء الفاتورة',
@@ -111,48 +200,103 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """إحصائيات الفواتير"""
-        queryset = self.get_queryset()
-        
-        total_invoices = queryset.count()
-        total_amount = queryset.aggregate(total=Sum('total_amount'))['total'] or 0
+        data = caching.get_or_compute(
+            'invoice-statistics', request.query_params.dict(), self._compute_statistics,
+            timeout=caching.STATISTICS_TIMEOUT
+        )
+        return Response(data)
+    
+    def _compute_statistics(self):
+        # استعلام تجميعي واحد بدلاً من استعلام لكل رقم
+        queryset = self.filter_by_params(Invoice.objects.order_by())
         
-        paid_invoices = queryset.filter(status=Invoice.InvoiceStatus.PAID)
-        paid_amount = paid_invoices.aggregate(total=Sum('total_amount'))['total'] or 0
+        paid = Q(status=Invoice.InvoiceStatus.PAID)
+        unswept = Q(status__in=[Invoice.InvoiceStatus.SENT, Invoice.InvoiceStatus.VIEWED])
+        pending = unswept | Q(status=Invoice.InvoiceStatus.OVERDUE)
+        # المتأخرة: ما حوّلته المهمة الدورية وما تجاوز الاستحقاق منذ آخر تشغيل لها
+        overdue = Q(status=Invoice.InvoiceStatus.OVERDUE) | (unswept & Q(due_date__lt=timezone.now().date()))
         
-        pending_invoices = queryset.filter(
-            status__in=[Invoice.InvoiceStatus.SENT, Invoice.InvoiceStatus.VIEWED]
+        totals = queryset.aggregate(
+            total_invoices=Count('id'),
+            total_sum=Sum('total_amount'),
+            paid_invoices=Count('id', filter=paid),
+            paid_amount=Sum('total_amount', filter=paid),
+            pending_invoices=Count('id', filter=pending),
+            pending_amount=Sum('total_amount', filter=pending),
+            overdue_invoices=Count('id', filter=overdue),
+            overdue_amount=Sum('total_amount', filter=overdue),
         )
-        pending_amount = pending_invoices.aggregate(total=Sum('total_amount'))['total'] or 0
         
-        overdue_invoices = queryset.filter(
-            due_date__lt=timezone.now().date(),
-            status__in=[Invoice.InvoiceStatus.SENT, Invoice.InvoiceStatus.VIEWED]
+        return {
+            'total_invoices': totals['total_invoices'],
+            'total_amount': float(totals['total_sum'] or 0),
+            'paid_invoices': totals['paid_invoices'],
+            'paid_amount': float(totals['paid_amount'] or 0),
+            'pending_invoices': totals['pending_invoices'],
+            'pending_amount': float(totals['pending_amount'] or 0),
+            'overdue_invoices': totals['overdue_invoices'],
+            'overdue_amount': float(totals['overdue_amount'] or 0),
+        }
+    
+    @action(detail=False, methods=['post'])
+    def bulk_generate(self, request):
+        """توليد فواتير جماعية من قالب واحد لقائمة عملاء كمهمة في الخلفية"""
+        if not request.user.is_team_member():
+            return Response({
+                'error': 'ليس لديك صلاحية لتوليد الفواتير جماعياً'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        serializer = BulkInvoiceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        batch = InvoiceBatch.objects.create(
+            template=serializer.data['template'],
+            targets=serializer.data['targets'],
+            total_count=len(serializer.data['targets']),
+            created_by=request.user
         )
-        overdue_amount = overdue_invoices.aggregate(total=Sum('total_amount'))['total'] or 0
+        transaction.on_commit(lambda: self._enqueue_batch(batch.pk))
         
         return Response({
-            'total_invoices': total_invoices,
-            'total_amount': float(total_amount),
-            'paid_invoices': paid_invoices.count(),
-            'paid_amount': float(paid_amount),
-            'pending_invoices': pending_invoices.count(),
-            'pending_amount': float(pending_amount),
-            'overdue_invoices': overdue_invoices.count(),
-            'overdue_amount': float(overdue_amount),
-        })
+            'batch_id': batch.id,
+            'job_status': batch.job_status,
+            'status_url': reverse('invoice-batch-detail', args=[batch.id], request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @staticmethod
+    def _enqueue_batch(batch_id):
+        result = generate_invoice_batch.delay(batch_id)
+        InvoiceBatch.objects.filter(pk=batch_id).update(task_id=result.id or '')
+    
+    @action(detail=False, methods=['get'])
+    def aging(self, request):
+        """أعمار الذمم المدينة لكل عميل حسب فترات التأخير"""
+        as_of = timezone.now().date()
+        client_id = request.query_params.get('client', None)
+        
+        # النتيجة مخزنة حتى أول تعديل على الفواتير أو المدفوعات
+        data = caching.get_or_compute(
+            'aging', {'as_of': as_of, 'client': client_id},
+            lambda: aging.ar_aging(as_of, client_id=client_id)
+        )
+        return Response(data)
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet لإدارة المدفوعات
     """
-    queryset = Payment.objects.select_related('invoice', 'client', 'processed_by').all()
+    queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated]
+    sparse_select_related = {'invoice_number': 'invoice', 'client_name': 'client', 'processed_by_name': 'processed_by'}
+    sparse_values = {'invoice_number': 'invoice__invoice_number', 'client_name': 'client__company_name'}
     
     def get_queryset(self):
-        queryset = super().get_queryset()
-        
+        return self.filter_by_params(self.apply_sparse_relations(super().get_queryset()))
+    
+    def filter_by_params(self, queryset):
+        """تطبيق مرشحات الطلب على الاستعلام"""
         # فلترة حسب الحالة
         status_filter = self.request.query_params.get('status', None)
         if status_filter:
@@ -183,77 +327,204 @@ class PaymentViewSet(viewsets.ModelViewSet):
         """معالجة الدفعة"""
         payment = self.get_object()
         
-        if payment.status == Payment.PaymentStatus.PENDING:
+        with transaction.atomic():
+            # قفل الدفعة يمنع احتسابها مرتين عند المعالجة المتزامنة
+            payment = Payment.objects.select_for_update().get(pk=payment.pk)
+            if payment.status != Payment.PaymentStatus.PENDING:
+                return Response({
+                    'error': 'لا يمكن معالجة الدفعة في هذه الحالة'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             payment.status = Payment.PaymentStatus.COMPLETED
             payment.processed_at = timezone.now()
             payment.processed_by = request.user
             payment.save()
             
-            # التحقق من دفع الفاتورة بالكامل
+            # تحديث المدفوع والرصيد ذرياً ثم التحقق من دفع الفاتورة بالكامل
+            balance_due = balances.apply_payment(payment.invoice_id, payment.amount)
             invoice = payment.invoice
-            total_payments = invoice.payments.filter(
-                status=Payment.PaymentStatus.COMPLETED
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            if total_payments >= invoice.total_amount:
+            if balance_due <= 0 and invoice.status != Invoice.InvoiceStatus.PAID:
                 invoice.status = Invoice.InvoiceStatus.PAID
                 invoice.paid_at = timezone.now()
-                invoice.save()
-            
-            return Response({
-                'message': 'تمت معالجة الدفعة بنجاح',
-                'payment': PaymentSerializer(payment).data
-            })
+                invoice.save(update_fields=['status', 'paid_at', 'updated_at'])
         
         return Response({
-            'error': 'لا يمكن معالجة الدفعة في هذه الحالة'
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'message': 'تمت معالجة الدفعة بنجاح',
+            'payment': PaymentSerializer(payment).data
+        })
+    
+    def destroy(self, request, *args, **kwargs):
+        """حذف الدفعة؛ الدفعة المكتملة تُسترد أولاً حتى يبقى رصيد الفاتورة مطابقاً للمدفوعات"""
+        payment = self.get_object()
+        
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().get(pk=payment.pk)
+            if payment.status == Payment.PaymentStatus.COMPLETED:
+                return Response({
+                    'error': 'لا يمكن حذف دفعة مكتملة، يرجى استردادها أولاً'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            payment.delete()
+        
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=True, methods=['post'])
     def refund(self, request, pk=None):
         """استرداد الدفعة"""
         payment = self.get_object()
         
-        if payment.status == Payment.PaymentStatus.COMPLETED:
+        with transaction.atomic():
+            payment = Payment.objects.select_for_update().get(pk=payment.pk)
+            if payment.status != Payment.PaymentStatus.COMPLETED:
+                return Response({
+                    'error': 'لا يمكن استرداد الدفعة في هذه الحالة'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             payment.status = Payment.PaymentStatus.REFUNDED
             payment.save()
             
-            # تحديث حالة الفاتورة
+            # تحديث حالة الفاتورة إذا عاد لها رصيد مستحق
+            balance_due = balances.apply_payment(payment.invoice_id, -payment.amount)
             invoice = payment.invoice
-            if invoice.status == Invoice.InvoiceStatus.PAID:
+            if balance_due > 0 and invoice.status == Invoice.InvoiceStatus.PAID:
                 invoice.status = Invoice.InvoiceStatus.SENT
                 invoice.paid_at = None
-                invoice.save()
-            
-            return Response({
-                'message': 'تم استرداد الدفعة بنجاح',
-                'payment': PaymentSerializer(payment).data
-            })
+                invoice.save(update_fields=['status', 'paid_at', 'updated_at'])
         
         return Response({
-            'error': 'لا يمكن استرداد الدفعة في هذه الحالة'
-        }, status=status.HTTP_400_BAD_REQUEST)
+            'message': 'تم استرداد الدفعة بنجاح',
+            'payment': PaymentSerializer(payment).data
+        })
+    
+    @action(detail=False, methods=['post'])
+    def import_statement(self, request):
+        """استيراد كشف حساب بنكي (CSV أو MT940) ومطابقته مع الفواتير المفتوحة"""
+        if not request.user.is_team_member():
+            return Response({
+                'error': 'ليس لديك صلاحية لاستيراد كشوف الحساب'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        upload = request.FILES.get('file')
+        file_format = request.data.get('format', 'csv')
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('true', '1')
+        
+        if upload is None:
+            return Response({
+                'error': 'يرجى إرفاق ملف الكشف'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if file_format not in statements.PARSERS:
+            return Response({
+                'error': 'صيغة الكشف غير مدعومة'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            result = statements.reconcile_statement(
+                statements.PARSERS[file_format](upload), request.user, dry_run=dry_run
+            )
+        except statements.StatementError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(result)
     
     @action(detail=False, methods=['get'])
     def statistics(self, request):
         """إحصائيات المدفوعات"""
-        queryset = self.get_queryset()
+        data = caching.get_or_compute(
+            'payment-statistics', request.query_params.dict(), self._compute_statistics,
+            timeout=caching.STATISTICS_TIMEOUT
+        )
+        return Response(data)
+    
+    def _compute_statistics(self):
+        # استعلام تجميعي واحد بدلاً من استعلام لكل رقم
+        queryset = self.filter_by_params(Payment.objects.order_by())
         
-        total_payments = queryset.count()
-        total_amount = queryset.aggregate(total=Sum('amount'))['total'] or 0
+        completed = Q(status=Payment.PaymentStatus.COMPLETED)
+        pending = Q(status=Payment.PaymentStatus.PENDING)
         
-        completed_payments = queryset.filter(status=Payment.PaymentStatus.COMPLETED)
-        completed_amount = completed_payments.aggregate(total=Sum('amount'))['total'] or 0
+        totals = queryset.aggregate(
+            total_payments=Count('id'),
+            total_amount=Sum('amount'),
+            completed_payments=Count('id', filter=completed),
+            completed_amount=Sum('amount', filter=completed),
+            pending_payments=Count('id', filter=pending),
+            pending_amount=Sum('amount', filter=pending),
+        )
         
-        pending_payments = queryset.filter(status=Payment.PaymentStatus.PENDING)
-        pending_amount = pending_payments.aggregate(total=Sum('amount'))['total'] or 0
+        return {
+            'total_payments': totals['total_payments'],
+            'total_amount': float(totals['total_amount'] or 0),
+            'completed_payments': totals['completed_payments'],
+            'completed_amount': float(totals['completed_amount'] or 0),
+            'pending_payments': totals['pending_payments'],
+            'pending_amount': float(totals['pending_amount'] or 0),
+        }
+
+
+class InvoiceBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet لمتابعة دفعات الفواتير الجماعية
+    """
+    serializer_class = InvoiceBatchSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_team_member():
+            return InvoiceBatch.objects.all()
+        return InvoiceBatch.objects.filter(created_by=user)
+
+
+class ClientStatementViewSet(viewsets.ViewSet):
+    """
+    ViewSet لكشف حساب العميل (الفواتير والمدفوعات مع الرصيد التراكمي)
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def retrieve(self, request, pk=None):
+        client = Client.objects.filter(pk=pk).values('pk', 'company_name', 'user_id').first()
+        if client is None:
+            raise Http404
+        
+        # العميل يرى كشف حسابه فقط
+        if not request.user.is_team_member() and client['user_id'] != request.user.pk:
+            return Response({
+                'error': 'ليس لديك صلاحية لعرض كشف الحساب هذا'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        query = ClientStatementQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        
+        page = ledger.client_ledger(
+            client['pk'],
+            cursor=params.get('cursor'),
+            limit=params['limit'],
+            date_from=params.get('date_from'),
+            date_to=params.get('date_to'),
+        )
+        
+        next_url = None
+        if page['next_cursor']:
+            next_query = request.query_params.copy()
+            next_query['cursor'] = page['next_cursor']
+            next_url = request.build_absolute_uri(f"{request.path}?{next_query.urlencode()}")
         
         return Response({
-            'total_payments': total_payments,
-            'total_amount': float(total_amount),
-            'completed_payments': completed_payments.count(),
-            'completed_amount': float(completed_amount),
-            'pending_payments': pending_payments.count(),
-            'pending_amount': float(pending_amount),
+            'client': client['pk'],
+            'client_name': client['company_name'],
+            'opening_balance': float(page['opening_balance']),
+            'closing_balance': float(page['closing_balance']),
+            'next': next_url,
+            'results': [
+                {
+                    'type': entry['type'],
+                    'id': entry['source_id'],
+                    'date': entry['date'],
+                    'reference': entry['reference'],
+                    'debit': float(entry['debit']),
+                    'credit': float(entry['credit']),
+                    'balance': float(entry['balance']),
+                }
+                for entry in page['entries']
+            ],
         })
-
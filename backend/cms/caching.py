@@ -0,0 +1,16 @@
+"""
+التخزين المؤقت لواجهة المحتوى العامة
+
+يزداد إصدار بيانات المحتوى عند النشر أو الأرشفة أو أي تعديل على المحتوى
+وتعليقاته وتصنيفاته وعلاماته، فتصبح الاستجابات القديمة غير قابلة للوصول فوراً
+(انظر idea_platform.caching). الإصدار نفسه جزء من ETag.
+"""
+
+from idea_platform.caching import VersionedCache, params_digest  # noqa: F401
+
+_cache = VersionedCache('cms:public')
+
+data_version = _cache.data_version
+bump = _cache.bump
+cache_key = _cache.cache_key
+get_or_compute = _cache.get_or_compute
@@ -0,0 +1,88 @@
+"""
+الطلبات الشرطية وترويسات التخزين المؤقت للمحتوى
+
+تُحسب ETag من updated_at للمحتوى وآخر تعديل على تعليقاته باستعلام تجميعي صغير
+قبل بناء الاستجابة، مع إصدار بيانات المحتوى (cms.caching) الذي يزداد عند تعديل
+التصنيفات والعلامات وأسماء الكتّاب الظاهرة في الاستجابة أيضاً. إذا طابقت ترويسة
+If-None-Match تُرجع 304 دون جلب المحتوى أو تحويله. لا تُرسل Last-Modified لأن
+تعديل تلك الصفوف المرتبطة لا يظهر في أي تاريخ تعديل للمحتوى.
+المحتوى المنشور يُعلَّم public ليخزنه nginx أو شبكة التوزيع.
+"""
+
+import hashlib
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from . import caching
+from .models import Comment, Content
+
+# يُرفع عند تغيير شكل الاستجابة حتى لا تُعتبر النسخ المخزنة صالحة
+REPRESENTATION_VERSION = 1
+
+
+@dataclass
+class Validators:
+    etag: str
+    public: bool
+    # معرف المحتوى في محددات العرض التفصيلي
+    pk: int | None = None
+    # None تعني CMS_CACHE_MAX_AGE؛ صفر يُلزم المخازن بإعادة التحقق في كل طلب
+    max_age: int | None = None
+
+
+def _etag(*parts):
+    # إصدار البيانات يغطي الحقول المأخوذة من صفوف مرتبطة (العلامات وأعدادها،
+    # اسم التصنيف، اسم الكاتب)
+    parts = (REPRESENTATION_VERSION, caching.data_version(), *parts)
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+
+def collection_validators(queryset, path):
+    """محددات صلاحية قائمة: آخر تعديل وعدد العناصر في المحتوى وتعليقاته"""
+    ids = queryset.order_by().values('pk')
+    contents = Content.objects.filter(pk__in=ids).aggregate(last=Max('updated_at'), total=Count('pk'))
+    comments = Comment.objects.filter(content__in=ids).aggregate(last=Max('updated_at'), total=Count('pk'))
+    return Validators(
+        etag=_etag(path, contents['last'], contents['total'], comments['last'], comments['total']),
+        public=True,
+    )
+
+
+def detail_validators(queryset):
+    """محددات صلاحية محتوى واحد، أو None إذا لم يوجد"""
+    row = (
+        queryset.order_by()
+        .values('pk', 'status', 'updated_at')
+        .annotate(comments_last=Max('comments__updated_at'), comments_total=Count('comments'))
+        .first()
+    )
+    if row is None:
+        return None
+    return Validators(
+        etag=_etag(row['pk'], row['updated_at'], row['comments_last'], row['comments_total']),
+        public=row['status'] == Content.Status.PUBLISHED,
+        pk=row['pk'],
+    )
+
+
+def apply_headers(response, validators):
+    """إضافة ETag و Cache-Control إلى الاستجابة"""
+    response['ETag'] = validators.etag
+    if validators.public:
+        max_age = settings.CMS_CACHE_MAX_AGE if validators.max_age is None else validators.max_age
+        patch_cache_control(response, public=True, max_age=max_age)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def not_modified(request, validators):
+    """استجابة 304 إذا كانت نسخة العميل ما زالت صالحة، وإلا None"""
+    response = get_conditional_response(request, etag=validators.etag)
+    if response is None:
+        return None
+    return apply_headers(response, validators)
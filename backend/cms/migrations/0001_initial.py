@@ -0,0 +1,107 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Category',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='اسم التصنيف')),
+                ('slug', models.SlugField(blank=True, max_length=100, unique=True, verbose_name='الرابط')),
+                ('description', models.TextField(blank=True, verbose_name='الوصف')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+            ],
+            options={
+                'verbose_name': 'تصنيف',
+                'verbose_name_plural': 'التصنيفات',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='اسم العلامة')),
+                ('slug', models.SlugField(blank=True, unique=True, verbose_name='الرابط')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+            ],
+            options={
+                'verbose_name': 'علامة',
+                'verbose_name_plural': 'العلامات',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Content',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='العنوان')),
+                ('slug', models.SlugField(blank=True, max_length=200, unique=True, verbose_name='الرابط')),
+                ('content_type', models.CharField(choices=[('article', 'مقالة'), ('page', 'صفحة'), ('news', 'خبر'), ('blog', 'مدونة')], max_length=20, verbose_name='نوع المحتوى')),
+                ('excerpt', models.TextField(blank=True, max_length=500, verbose_name='المقتطف')),
+                ('body', models.TextField(verbose_name='المحتوى')),
+                ('featured_image', models.URLField(blank=True, verbose_name='الصورة المميزة')),
+                ('status', models.CharField(choices=[('draft', 'مسودة'), ('published', 'منشور'), ('archived', 'مؤرشف')], default='draft', max_length=20, verbose_name='الحالة')),
+                ('views_count', models.IntegerField(default=0, verbose_name='عدد المشاهدات')),
+                ('published_at', models.DateTimeField(blank=True, null=True, verbose_name='تاريخ النشر')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+                ('meta_title', models.CharField(blank=True, max_length=200, verbose_name='عنوان SEO')),
+                ('meta_description', models.TextField(blank=True, max_length=300, verbose_name='وصف SEO')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contents', to=settings.AUTH_USER_MODEL, verbose_name='الكاتب')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contents', to='cms.category', verbose_name='التصنيف')),
+                ('tags', models.ManyToManyField(blank=True, related_name='contents', to='cms.tag', verbose_name='العلامات')),
+            ],
+            options={
+                'verbose_name': 'محتوى',
+                'verbose_name_plural': 'المحتويات',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Comment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('body', models.TextField(verbose_name='التعليق')),
+                ('is_approved', models.BooleanField(default=False, verbose_name='موافق عليه')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to=settings.AUTH_USER_MODEL, verbose_name='الكاتب')),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='cms.content', verbose_name='المحتوى')),
+            ],
+            options={
+                'verbose_name': 'تعليق',
+                'verbose_name_plural': 'التعليقات',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Media',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='العنوان')),
+                ('file_url', models.URLField(verbose_name='رابط الملف')),
+                ('media_type', models.CharField(choices=[('image', 'صورة'), ('video', 'فيديو'), ('document', 'مستند'), ('audio', 'صوت')], max_length=20, verbose_name='نوع الوسائط')),
+                ('file_size', models.IntegerField(default=0, verbose_name='حجم الملف (بايت)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الرفع')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media_files', to=settings.AUTH_USER_MODEL, verbose_name='رفع بواسطة')),
+            ],
+            options={
+                'verbose_name': 'وسائط',
+                'verbose_name_plural': 'الوسائط',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-18 03:27
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+from django.db.models import F, Func, TextField, Value
+
+INDEX_NAME = 'content_search_vector_idx'
+
+
+def search_vector():
+    # نسخة ثابتة من cms.search.search_vector حتى لا تتغير الهجرة بتغيّر الكود
+    def normalized(field):
+        folded = Func(F(field), Value('أإآٱىة'), Value('اااايه'), function='translate', output_field=TextField())
+        return Func(
+            folded, Value('[\u064b-\u0652\u0670\u0640]'), Value(''), Value('g'),
+            function='regexp_replace', output_field=TextField()
+        )
+
+    config = settings.CMS_SEARCH_CONFIG
+    return (
+        django.contrib.postgres.search.SearchVector(normalized('title'), weight='A', config=config)
+        + django.contrib.postgres.search.SearchVector(normalized('excerpt'), weight='B', config=config)
+        + django.contrib.postgres.search.SearchVector(normalized('body'), weight='C', config=config)
+    )
+
+
+def create_search_index(apps, schema_editor):
+    # فهرس GIN وتعبئة المتجهات على PostgreSQL فقط (SQLite لا يدعمهما)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Content = apps.get_model('cms', 'Content')
+    schema_editor.add_index(
+        Content, django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name=INDEX_NAME)
+    )
+    Content.objects.update(search_vector=search_vector())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Content = apps.get_model('cms', 'Content')
+    schema_editor.remove_index(
+        Content, django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name=INDEX_NAME)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='متجه البحث'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(
+                    model_name='content',
+                    index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name=INDEX_NAME),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(create_search_index, drop_search_index),
+            ],
+        ),
+    ]
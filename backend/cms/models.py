@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 
@@ -78,11 +80,16 @@ class Content(models.Model):
     updated_at = models.DateTimeField('تاريخ التحديث', auto_now=True)
     meta_title = models.CharField('عنوان SEO', max_length=200, blank=True)
     meta_description = models.TextField('وصف SEO', max_length=300, blank=True)
+    # متجه البحث النصي (PostgreSQL)، يُحدَّث تلقائياً بعد الحفظ
+    search_vector = SearchVectorField('متجه البحث', null=True, editable=False)
     
     class Meta:
         verbose_name = 'محتوى'
         verbose_name_plural = 'المحتويات'
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='content_search_vector_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -0,0 +1,105 @@
+"""
+البحث النصي الكامل في المحتوى
+
+على PostgreSQL يُحفظ متجه البحث (search_vector) لكل محتوى بعد توحيد الكتابة
+العربية (الألف والياء والتاء المربوطة وحذف التشكيل والتطويل)، ويُبحث فيه عبر
+فهرس GIN مع ترتيب النتائج حسب الصلة ومقتطف مميز لمواضع التطابق.
+على SQLite (بيئة التطوير) يُستخدم بحث SearchFilter المعتاد.
+"""
+
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Func, TextField, Value
+from rest_framework import filters
+
+# توحيد الحروف: أ إ آ ٱ -> ا، ى -> ي، ة -> ه
+FOLD_FROM = 'أإآٱىة'
+FOLD_TO = 'اااايه'
+
+# التشكيل (من الفتحتين إلى السكون والألف الخنجرية) والتطويل
+DIACRITICS = '[\u064b-\u0652\u0670\u0640]'
+
+_FOLD_TABLE = str.maketrans(FOLD_FROM, FOLD_TO)
+_DIACRITICS_RE = re.compile(DIACRITICS)
+
+# أوزان الحقول في ترتيب النتائج
+WEIGHTS = (('title', 'A'), ('excerpt', 'B'), ('body', 'C'))
+
+HEADLINE_OPTIONS = {
+    'start_sel': '<mark>',
+    'stop_sel': '</mark>',
+    'max_words': 35,
+    'min_words': 15,
+    'max_fragments': 2,
+}
+
+
+def normalize_arabic(text):
+    """توحيد النص العربي في بايثون (نص البحث)"""
+    return _DIACRITICS_RE.sub('', (text or '').translate(_FOLD_TABLE))
+
+
+def normalized(expression):
+    """التوحيد نفسه داخل قاعدة البيانات (نص المحتوى)"""
+    if isinstance(expression, str):
+        expression = F(expression)
+    folded = Func(expression, Value(FOLD_FROM), Value(FOLD_TO), function='translate', output_field=TextField())
+    return Func(
+        folded, Value(DIACRITICS), Value(''), Value('g'), function='regexp_replace', output_field=TextField()
+    )
+
+
+def search_config():
+    return settings.CMS_SEARCH_CONFIG
+
+
+def search_vector():
+    """متجه البحث الموزون للمحتوى"""
+    config = search_config()
+    vector = None
+    for field, weight in WEIGHTS:
+        part = SearchVector(normalized(field), weight=weight, config=config)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vector(queryset):
+    """إعادة حساب متجه البحث لمجموعة من المحتويات بتحديث واحد"""
+    if is_supported():
+        queryset.update(search_vector=search_vector())
+
+
+def search(queryset, terms):
+    """المحتوى المطابق مرتباً حسب الصلة مع مقتطف مميز"""
+    query = SearchQuery(normalize_arabic(terms), config=search_config(), search_type='websearch')
+    return (
+        queryset.filter(search_vector=query)
+        .annotate(
+            search_rank=SearchRank(F('search_vector'), query),
+            # المقتطف من النص الموحد نفسه الذي بُني منه المتجه، وإلا فلن تُميَّز
+            # الكلمات التي يختلف شكلها الأصلي عن الموحد (مدرسة/مدرسه، التشكيل)
+            search_headline=SearchHeadline(
+                normalized('body'), query, config=search_config(), **HEADLINE_OPTIONS
+            ),
+        )
+        .order_by('-search_rank', '-published_at', '-pk')
+    )
+
+
+class ContentSearchFilter(filters.SearchFilter):
+    """
+    بحث نصي كامل على PostgreSQL، و SearchFilter المعتاد على غيرها
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms or not is_supported():
+            return super().filter_queryset(request, queryset, view)
+        return search(queryset, terms)
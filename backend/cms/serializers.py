@@ -13,6 +13,9 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'slug', 'created_at']
     
     def get_contents_count(self, obj):
+        # العدد محسوب مسبقاً في استعلامات القوائم
+        if hasattr(obj, 'contents_total'):
+            return obj.contents_total
         return obj.contents.count()
 
 
@@ -27,6 +30,9 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'slug', 'created_at']
     
     def get_contents_count(self, obj):
+        # العدد محسوب مسبقاً في استعلامات القوائم
+        if hasattr(obj, 'contents_total'):
+            return obj.contents_total
         return obj.contents.count()
 
 
@@ -52,6 +58,9 @@ class ContentListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
     tags_list = TagSerializer(source='tags', many=True, read_only=True)
     comments_count = serializers.SerializerMethodField()
+    # يظهران في نتائج البحث النصي فقط
+    search_rank = serializers.FloatField(read_only=True)
+    search_headline = serializers.CharField(read_only=True)
     
     class Meta:
         model = Content
@@ -59,11 +68,15 @@ class ContentListSerializer(serializers.ModelSerializer):
             'id', 'title', 'slug', 'content_type', 'excerpt', 
             'featured_image', 'status', 'author', 'author_name',
             'category', 'category_name', 'tags_list', 'views_count',
-            'comments_count', 'published_at', 'created_at', 'updated_at'
+            'comments_count', 'published_at', 'created_at', 'updated_at',
+            'search_rank', 'search_headline'
         ]
         read_only_fields = ['id', 'slug', 'author', 'views_count', 'created_at', 'updated_at']
     
     def get_comments_count(self, obj):
+        # العدد محسوب مسبقاً في استعلامات القوائم
+        if hasattr(obj, 'approved_comments_total'):
+            return obj.approved_comments_total
         return obj.comments.filter(is_approved=True).count()
 
 
@@ -119,3 +132,48 @@ class MediaSerializer(serializers.ModelSerializer):
         validated_data['uploaded_by'] = self.context['request'].user
         return super().create(validated_data)
 
+
+
+class PublicTagSerializer(serializers.ModelSerializer):
+    """Serializer للعلامات في الواجهة العامة"""
+    
+    class Meta:
+        model = Tag
+        fields = ['name', 'slug']
+
+
+class PublicCommentSerializer(serializers.ModelSerializer):
+    """Serializer للتعليقات الموافق عليها في الواجهة العامة"""
+    
+    author_name = serializers.CharField(source='author.get_full_name', read_only=True)
+    
+    class Meta:
+        model = Comment
+        fields = ['id', 'author_name', 'body', 'created_at']
+
+
+class PublicContentListSerializer(serializers.ModelSerializer):
+    """Serializer لقائمة المحتوى المنشور في الواجهة العامة"""
+    
+    author_name = serializers.CharField(source='author.get_full_name', read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True, allow_null=True)
+    category_slug = serializers.CharField(source='category.slug', read_only=True, allow_null=True)
+    tags = PublicTagSerializer(many=True, read_only=True)
+    
+    class Meta:
+        model = Content
+        fields = [
+            'title', 'slug', 'content_type', 'excerpt', 'featured_image',
+            'author_name', 'category_name', 'category_slug', 'tags', 'published_at'
+        ]
+
+
+class PublicContentDetailSerializer(PublicContentListSerializer):
+    """Serializer لتفاصيل المحتوى المنشور في الواجهة العامة"""
+    
+    comments = PublicCommentSerializer(source='approved_comments', many=True, read_only=True)
+    
+    class Meta(PublicContentListSerializer.Meta):
+        fields = PublicContentListSerializer.Meta.fields + [
+            'body', 'meta_title', 'meta_description', 'updated_at', 'comments'
+        ]
@@ -0,0 +1,48 @@
+"""
+تحديث متجه البحث عند حفظ المحتوى، وإبطال التخزين المؤقت للواجهة العامة
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Comment, Content, Tag
+from .search import WEIGHTS, update_search_vector
+from . import caching
+
+SEARCH_FIELDS = {field for field, _ in WEIGHTS}
+
+
+@receiver(post_save, sender=Content)
+def refresh_search_vector(sender, instance, update_fields=None, **kwargs):
+    # الحفظ الجزئي الذي لا يمس الحقول النصية لا يغير المتجه
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    update_search_vector(Content.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+@receiver(m2m_changed, sender=Content.tags.through)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_public_cache(sender, **kwargs):
+    # بعد الالتزام حتى لا تُخزَّن استجابة محسوبة من بيانات لم تُلتزم بعد
+    transaction.on_commit(caching.bump)
+
+
+# أسماء الكتّاب تظهر في استجابات المحتوى والتعليقات
+AUTHOR_NAME_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_author_names(sender, update_fields=None, **kwargs):
+    # تسجيل الدخول يحفظ last_login فقط فلا يبطل شيئاً
+    if update_fields is not None and not AUTHOR_NAME_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(caching.bump)
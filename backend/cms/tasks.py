@@ -0,0 +1,9 @@
+from celery import shared_task
+
+
+@shared_task
+def flush_content_views():
+    """نقل مشاهدات المحتوى المجمعة في المخزن المؤقت إلى قاعدة البيانات"""
+    from .view_counter import flush
+
+    return {'flushed_views': flush()}
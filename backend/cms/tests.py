@@ -1,3 +1,364 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import search, view_counter
+from .models import Category, Tag, Content, Comment
+
+User = get_user_model()
+
+LOCAL_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ListQueryCountTests(TestCase):
+    """عدد استعلامات قوائم المحتوى ثابت مهما زاد عدد العناصر في الصفحة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='editor', email='editor@example.com', password='pass',
+            first_name='محرر', last_name='المحتوى', role='admin'
+        )
+        cls.categories = [Category.objects.create(name=f'تصنيف {i}') for i in range(5)]
+        cls.tags = [Tag.objects.create(name=f'علامة {i}') for i in range(5)]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_contents(self, count):
+        for i in range(Content.objects.count(), Content.objects.count() + count):
+            content = Content.objects.create(
+                title=f'محتوى {i}', slug=f'content-{i}', content_type=Content.ContentType.ARTICLE,
+                body='نص', status=Content.Status.PUBLISHED, author=self.user,
+                category=self.categories[i % len(self.categories)]
+            )
+            content.tags.set(self.tags[:i % len(self.tags) + 1])
+            Comment.objects.create(content=content, author=self.user, body='تعليق', is_approved=True)
+            Comment.objects.create(content=content, author=self.user, body='تعليق', is_approved=False)
+
+    def assert_constant_queries(self, url, expected):
+        self.create_contents(2)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.create_contents(18)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_content_list(self):
+        # العد للترقيم + المحتوى مع الكاتب والتصنيف وعدد التعليقات + العلامات مع أعدادها
+        response = self.assert_constant_queries('/api/cms/contents/', 3)
+        self.assertEqual(len(response.data['results']), 20)
+        item = response.data['results'][0]
+        content = Content.objects.get(pk=item['id'])
+        self.assertEqual(item['comments_count'], 1)
+        self.assertEqual(item['author_name'], 'محرر المحتوى')
+        self.assertEqual(item['category_name'], content.category.name)
+        self.assertEqual(
+            {tag['id']: tag['contents_count'] for tag in item['tags_list']},
+            {tag.id: tag.contents.count() for tag in content.tags.all()}
+        )
+
+    def test_published_list(self):
+        # استعلاما ETag + عرض تفصيلي: التعليقات مع كتّابها في استعلام إضافي واحد
+        self.assert_constant_queries('/api/cms/contents/published/', 6)
+
+    def test_category_list(self):
+        response = self.assert_constant_queries('/api/cms/categories/', 2)
+        counts = {item['id']: item['contents_count'] for item in response.data['results']}
+        self.assertEqual(counts, {category.id: 4 for category in self.categories})
+
+    def test_tag_list(self):
+        response = self.assert_constant_queries('/api/cms/tags/', 2)
+        counts = {item['id']: item['contents_count'] for item in response.data['results']}
+        self.assertEqual(counts, {tag.id: tag.contents.count() for tag in self.tags})
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class ConditionalGetTests(TestCase):
+    """استجابة 304 للمحتوى الذي لم يتغير منذ آخر طلب"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass',
+            first_name='قارئ', last_name='المحتوى', role='admin'
+        )
+        cls.content = Content.objects.create(
+            title='مقالة', slug='article', content_type=Content.ContentType.ARTICLE,
+            body='نص', status=Content.Status.PUBLISHED, author=cls.user
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_detail_not_modified_until_changed(self):
+        response = self.client.get('/api/cms/contents/article/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('public', response['Cache-Control'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cms/contents/article/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Comment.objects.create(content=self.content, author=self.user, body='تعليق')
+        response = self.client.get('/api/cms/contents/article/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_related_rows_change_the_etag(self):
+        category = Category.objects.create(name='أخبار')
+        tag = Tag.objects.create(name='تقنية')
+        Content.objects.filter(pk=self.content.pk).update(category=category)
+        self.content.tags.add(tag)
+
+        def rename(instance, field, suffix):
+            setattr(instance, field, getattr(instance, field) + suffix)
+            instance.save(update_fields=[field])
+
+        for url in ('/api/cms/contents/article/', '/api/cms/contents/published/'):
+            for instance, field in ((tag, 'name'), (category, 'name'), (self.user, 'first_name')):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    rename(instance, field, url[-3:])
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+        # تسجيل الدخول لا يغير ما يُعرض
+        etag = self.client.get('/api/cms/contents/article/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.get(pk=self.user.pk).save(update_fields=['last_login'])
+        response = self.client.get('/api/cms/contents/article/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_published_list_not_modified_until_changed(self):
+        etag = self.client.get('/api/cms/contents/published/')['ETag']
+        response = self.client.get('/api/cms/contents/published/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.content.title = 'مقالة معدلة'
+        self.content.save()
+        response = self.client.get('/api/cms/contents/published/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_draft_is_not_publicly_cacheable(self):
+        Content.objects.filter(pk=self.content.pk).update(status=Content.Status.DRAFT)
+        response = self.client.get('/api/cms/contents/article/')
+        self.assertIn('private', response['Cache-Control'])
+
+
+@override_settings(CACHES=LOCAL_CACHE)
+class PublicContentTests(TestCase):
+    """الواجهة العامة: بدون مصادقة، المنشور فقط، ومخزنة حتى النشر أو الأرشفة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass',
+            first_name='كاتب', last_name='المحتوى', role='admin'
+        )
+        cls.category = Category.objects.create(name='أخبار', slug='news')
+        cls.tag = Tag.objects.create(name='تقنية', slug='tech')
+        cls.published = Content.objects.create(
+            title='منشور', slug='published', content_type=Content.ContentType.NEWS,
+            body='نص', status=Content.Status.PUBLISHED, author=cls.user, category=cls.category
+        )
+        cls.published.tags.add(cls.tag)
+        cls.draft = Content.objects.create(
+            title='مسودة', slug='draft', content_type=Content.ContentType.NEWS,
+            body='نص', author=cls.user, category=cls.category
+        )
+        Comment.objects.create(content=cls.published, author=cls.user, body='موافق', is_approved=True)
+        Comment.objects.create(content=cls.published, author=cls.user, body='معلق')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.editor = APIClient()
+        self.editor.force_authenticate(self.user)
+
+    def slugs(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [item['slug'] for item in response.data['results']]
+
+    def test_anonymous_reads_published_only(self):
+        self.assertEqual(self.slugs('/api/cms/public/contents/'), ['published'])
+        self.assertEqual(self.slugs('/api/cms/public/contents/category/news/'), ['published'])
+        self.assertEqual(self.slugs('/api/cms/public/contents/tag/tech/'), ['published'])
+        self.assertEqual(self.client.get('/api/cms/public/contents/draft/').status_code, 404)
+        self.assertEqual(self.client.get('/api/cms/public/contents/category/missing/').status_code, 404)
+
+        response = self.client.get('/api/cms/public/contents/published/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([comment['body'] for comment in response.data['comments']], ['موافق'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_detail_revalidates_so_every_view_is_counted(self):
+        url = '/api/cms/public/contents/published/'
+        response = self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+        # إعادة التحقق بـ 304 تصل إلى Django فتُسجَّل المشاهدة أيضاً
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(view_counter.pending_views(self.published.pk), 2)
+
+    def test_read_only(self):
+        response = self.client.post('/api/cms/public/contents/', {'title': 'x'})
+        self.assertEqual(response.status_code, 405)
+
+    def test_served_from_cache_until_publish_or_archive(self):
+        url = '/api/cms/public/contents/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editor.post('/api/cms/contents/draft/publish/')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(sorted(self.slugs(url)), ['draft', 'published'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.editor.post('/api/cms/contents/published/archive/')
+        self.assertEqual(self.slugs(url), ['draft'])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'البحث النصي الكامل يتطلب PostgreSQL')
+class ContentSearchTests(TestCase):
+    """البحث بعد توحيد الكتابة العربية مع الترتيب حسب الصلة وتمييز مواضع التطابق"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='editor', email='editor@example.com', password='pass',
+            first_name='محرر', last_name='المحتوى', role='admin'
+        )
+        cls.in_title = Content.objects.create(
+            title='مدرسة جديدة', slug='in-title', content_type=Content.ContentType.ARTICLE,
+            body='افتتاح مبنى جديد', status=Content.Status.PUBLISHED, author=cls.user
+        )
+        cls.in_body = Content.objects.create(
+            title='أخبار الحي', slug='in-body', content_type=Content.ContentType.ARTICLE,
+            body='زار الوزير مَدْرَسَة الحي صباحاً', status=Content.Status.PUBLISHED, author=cls.user
+        )
+        Content.objects.create(
+            title='إعلان', slug='unrelated', content_type=Content.ContentType.ARTICLE,
+            body='لا علاقة', status=Content.Status.PUBLISHED, author=cls.user
+        )
+
+    def test_folded_terms_match_rank_and_highlight(self):
+        # التاء المربوطة والتشكيل يُوحدان في المحتوى ونص البحث
+        results = list(search.search(Content.objects.all(), 'مدرسه'))
+        self.assertEqual([content.slug for content in results], ['in-title', 'in-body'])
+        self.assertGreater(results[0].search_rank, results[1].search_rank)
+        self.assertIn('<mark>مدرسه</mark>', results[1].search_headline)
+
+    def test_api_uses_full_text_search(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/cms/contents/', {'search': 'أخبار'})
+        self.assertEqual([item['slug'] for item in response.data['results']], ['in-body'])
+
+
+@override_settings(CACHES=LOCAL_CACHE, CMS_VIEW_DEDUPE_SECONDS=0)
+class ViewCounterTests(TestCase):
+    """المشاهدات تُجمع في المخزن المؤقت وتُنقل إلى views_count على دفعات"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='author', email='author@example.com', password='pass',
+            first_name='كاتب', last_name='المحتوى', role='admin'
+        )
+        cls.first, cls.second, cls.third = [
+            Content.objects.create(
+                title=f'محتوى {i}', slug=f'content-{i}', content_type=Content.ContentType.ARTICLE,
+                body='نص', status=Content.Status.PUBLISHED, author=cls.user
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def views(self):
+        return dict(Content.objects.values_list('pk', 'views_count'))
+
+    def record(self, content, times=1):
+        for _ in range(times):
+            view_counter.record_view(content.pk)
+
+    def test_flush_moves_previous_generation_in_grouped_updates(self):
+        self.record(self.first, 3)
+        self.record(self.second, 3)
+        self.record(self.third)
+
+        # التفريغ الأول يبدأ جيلاً جديداً فقط؛ مشاهدات الجيل السابق تُنقل في التالي
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.pending_views(self.first.pk), 3)
+        with self.assertNumQueries(2):
+            self.assertEqual(view_counter.flush(), 7)
+        self.assertEqual(self.views(), {self.first.pk: 3, self.second.pk: 3, self.third.pk: 1})
+        self.assertEqual(view_counter.pending_views(self.first.pk), 0)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(self.views()[self.first.pk], 3)
+
+    def test_views_recorded_during_flush_are_kept(self):
+        self.record(self.first, 2)
+        view_counter.flush()
+        # تصل بعد بدء الجيل الجديد وقبل تفريغ السابق
+        self.record(self.first, 5)
+        self.assertEqual(view_counter.pending_views(self.first.pk), 7)
+
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(self.views()[self.first.pk], 2)
+        self.assertEqual(view_counter.pending_views(self.first.pk), 5)
+        self.assertEqual(view_counter.flush(), 5)
+        self.assertEqual(self.views()[self.first.pk], 7)
+
+    def test_concurrent_flush_is_skipped(self):
+        self.record(self.first)
+        cache.add(view_counter.FLUSH_LOCK_KEY, True)
+        self.assertEqual(view_counter.flush(), 0)
+        self.assertEqual(view_counter.pending_views(self.first.pk), 1)
+
+    @override_settings(CMS_VIEW_DEDUPE_SECONDS=60)
+    def test_repeat_views_within_window_are_counted_once(self):
+        first_visit = self.factory.get('/', REMOTE_ADDR='10.0.0.1')
+        repeat_visit = self.factory.get('/', REMOTE_ADDR='10.0.0.1')
+        other_viewer = self.factory.get('/', REMOTE_ADDR='10.0.0.2')
+        for request in (first_visit, repeat_visit, other_viewer):
+            request.user = AnonymousUser()
+
+        self.assertTrue(view_counter.record_view(self.first.pk, first_visit))
+        self.assertFalse(view_counter.record_view(self.first.pk, repeat_visit))
+        self.assertTrue(view_counter.record_view(self.first.pk, other_viewer))
+        # المشاهد نفسه لمحتوى آخر يُحتسب
+        self.assertTrue(view_counter.record_view(self.second.pk, repeat_visit))
+
+        view_counter.flush()
+        view_counter.flush()
+        self.assertEqual(self.views(), {self.first.pk: 2, self.second.pk: 1, self.third.pk: 0})
+
+    def test_viewer_ip_ignores_client_supplied_forwarded_entries(self):
+        spoofed = self.factory.get('/', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.7', REMOTE_ADDR='172.18.0.2')
+        spoofed.user = AnonymousUser()
+        self.assertEqual(view_counter.viewer_id(spoofed), 'ip:10.0.0.7')
+
+        direct = self.factory.get('/', REMOTE_ADDR='10.0.0.8')
+        direct.user = AnonymousUser()
+        self.assertEqual(view_counter.viewer_id(direct), 'ip:10.0.0.8')
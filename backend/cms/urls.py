@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CategoryViewSet, TagViewSet, ContentViewSet, CommentViewSet, MediaViewSet
+from .views import (
+    CategoryViewSet, TagViewSet, ContentViewSet, CommentViewSet, MediaViewSet, PublicContentViewSet
+)
 
 router = DefaultRouter()
 router.register(r'categories', CategoryViewSet, basename='category')
@@ -8,6 +10,7 @@ router.register(r'tags', TagViewSet, basename='tag')
 router.register(r'contents', ContentViewSet, basename='content')
 router.register(r'comments', CommentViewSet, basename='comment')
 router.register(r'media', MediaViewSet, basename='media')
+router.register(r'public/contents', PublicContentViewSet, basename='public-content')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -0,0 +1,135 @@
+"""
+عداد مشاهدات المحتوى
+
+تُجمع المشاهدات في التخزين المؤقت المشترك (Redis) بزيادات ذرية، وتُنقل إلى
+views_count على دفعات عبر مهمة دورية بتحديثات F('views_count') + n، بدلاً من
+حفظ صف المحتوى كاملاً في كل مشاهدة.
+
+تُقسم المشاهدات إلى أجيال: كل تفريغ يبدأ جيلاً جديداً ويفرّغ الجيل الذي قبله،
+فتبقى للزيادات المتأخرة على الجيل السابق مهلة دورة كاملة قبل قراءته.
+"""
+
+import hashlib
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import Content
+
+GENERATION_KEY = 'cms:views:generation'
+FLUSH_LOCK_KEY = 'cms:views:flush-lock'
+
+# مدة بقاء مفاتيح الجيل إذا لم يُفرغ (احتياطاً لتوقف المهمة الدورية)
+KEY_TIMEOUT = 24 * 60 * 60
+FLUSH_LOCK_TIMEOUT = 5 * 60
+
+CHUNK_SIZE = 1000
+
+
+def _count_key(generation, content_id):
+    return f"cms:views:{generation}:count:{content_id}"
+
+
+def _sequence_key(generation):
+    return f"cms:views:{generation}:seq"
+
+
+def _slot_key(generation, number):
+    return f"cms:views:{generation}:slot:{number}"
+
+
+def _increment(key):
+    """زيادة ذرية مع إنشاء المفتاح إن لم يوجد"""
+    cache.add(key, 0, KEY_TIMEOUT)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # انتهت صلاحية المفتاح بين الإنشاء والزيادة
+        cache.set(key, 1, KEY_TIMEOUT)
+        return 1
+
+
+def current_generation():
+    cache.add(GENERATION_KEY, 1, None)
+    return cache.get(GENERATION_KEY) or 1
+
+
+def viewer_id(request):
+    """معرف المشاهد لمنع التكرار: الجلسة ثم المستخدم ثم عنوان IP"""
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        return f"session:{session.session_key}"
+    if request.user and request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    # أول عناوين X-Forwarded-For يرسله العميل نفسه فيمكن تزويره؛ آخرها يضيفه
+    # nginx من عنوان الاتصال الفعلي
+    x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+    if x_forwarded_for:
+        ip = x_forwarded_for.split(',')[-1].strip()
+    else:
+        ip = request.META.get('REMOTE_ADDR', '')
+    return f"ip:{ip}"
+
+
+def record_view(content_id, request=None):
+    """تسجيل مشاهدة في المخزن المؤقت؛ يُرجع False إذا أُهملت كمشاهدة مكررة"""
+    dedupe_seconds = settings.CMS_VIEW_DEDUPE_SECONDS
+    if dedupe_seconds and request is not None:
+        viewer = hashlib.sha1(viewer_id(request).encode('utf-8')).hexdigest()
+        if not cache.add(f"cms:viewed:{content_id}:{viewer}", True, dedupe_seconds):
+            return False
+
+    generation = current_generation()
+    if cache.add(_count_key(generation, content_id), 1, KEY_TIMEOUT):
+        # أول مشاهدة للمحتوى في هذا الجيل: تسجيله في قائمة الجيل
+        number = _increment(_sequence_key(generation))
+        cache.set(_slot_key(generation, number), content_id, KEY_TIMEOUT)
+    else:
+        _increment(_count_key(generation, content_id))
+    return True
+
+
+def pending_views(content_id):
+    """المشاهدات المسجلة التي لم تُنقل بعد إلى قاعدة البيانات"""
+    generation = current_generation()
+    counts = cache.get_many([_count_key(generation, content_id), _count_key(generation - 1, content_id)])
+    return sum(counts.values())
+
+
+def _flush_generation(generation):
+    total = cache.get(_sequence_key(generation)) or 0
+    flushed = 0
+    for start in range(1, total + 1, CHUNK_SIZE):
+        numbers = range(start, min(start + CHUNK_SIZE, total + 1))
+        slot_keys = [_slot_key(generation, number) for number in numbers]
+        content_ids = list(cache.get_many(slot_keys).values())
+        count_keys = {_count_key(generation, content_id): content_id for content_id in content_ids}
+        counts = cache.get_many(list(count_keys))
+
+        # تحديث واحد لكل قيمة زيادة مختلفة بدلاً من تحديث لكل محتوى
+        by_increment = defaultdict(list)
+        for key, count in counts.items():
+            if count:
+                by_increment[count].append(count_keys[key])
+        for increment, ids in by_increment.items():
+            Content.objects.filter(pk__in=ids).update(views_count=F('views_count') + increment)
+            flushed += increment * len(ids)
+
+        cache.delete_many(slot_keys + list(count_keys))
+    cache.delete(_sequence_key(generation))
+    return flushed
+
+
+def flush():
+    """نقل المشاهدات المجمعة إلى قاعدة البيانات؛ يُرجع عدد المشاهدات المنقولة"""
+    if not cache.add(FLUSH_LOCK_KEY, True, FLUSH_LOCK_TIMEOUT):
+        return 0
+    try:
+        generation = current_generation()
+        cache.incr(GENERATION_KEY)
+        return _flush_generation(generation - 1)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
@@ -2,19 +2,51 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
 from .models import Category, Tag, Content, Comment, Media
+from . import caching, http_cache, view_counter
+from .search import ContentSearchFilter
 from .serializers import (
     CategorySerializer, TagSerializer, ContentListSerializer,
-    ContentDetailSerializer, CommentSerializer, MediaSerializer
+    ContentDetailSerializer, CommentSerializer, MediaSerializer,
+    PublicContentListSerializer, PublicContentDetailSerializer
 )
 
 
+def tags_with_counts():
+    """العلامات مع عدد محتوياتها في استعلام واحد"""
+    # استعلام فرعي وليس Count('contents'): داخل prefetch_related يقتصر الربط على المحتويات المجلوبة
+    tagged = (
+        Content.tags.through.objects.filter(tag=OuterRef('pk'))
+        .order_by()
+        .values('tag')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Tag.objects.annotate(contents_total=Coalesce(Subquery(tagged, output_field=IntegerField()), Value(0)))
+
+
+def approved_comments_total():
+    """عدد التعليقات الموافق عليها لكل محتوى كاستعلام فرعي (بدون GROUP BY على المحتوى)"""
+    approved = (
+        Comment.objects.filter(content=OuterRef('pk'), is_approved=True)
+        .order_by()
+        .values('content')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(approved, output_field=IntegerField()), Value(0))
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة التصنيفات"""
     
-    queryset = Category.objects.all()
+    queryset = Category.objects.annotate(contents_total=Count('contents')).order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'slug'
@@ -25,7 +57,7 @@ class CategoryViewSet(viewsets.ModelViewSet):
 class TagViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة العلامات"""
     
-    queryset = Tag.objects.all()
+    queryset = tags_with_counts()
     serializer_class = TagSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'slug'
@@ -39,7 +71,7 @@ class ContentViewSet(viewsets.ModelViewSet):
     queryset = Content.objects.all()
     permission_classes = [IsAuthenticated]
     lookup_field = 'slug'
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [ContentSearchFilter, filters.OrderingFilter]
     search_fields = ['title', 'excerpt', 'body']
     ordering_fields = ['created_at', 'published_at', 'views_count']
     
@@ -50,7 +82,18 @@ class ContentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """تخصيص الاستعلام حسب المعاملات"""
-        queryset = Content.objects.all()
+        # متجه البحث يُستخدم داخل قاعدة البيانات فقط ولا داعي لنقله
+        queryset = (
+            Content.objects.defer('search_vector')
+            .select_related('author', 'category')
+            .prefetch_related(Prefetch('tags', queryset=tags_with_counts()))
+        )
+        if self.action == 'list':
+            queryset = queryset.annotate(approved_comments_total=approved_comments_total())
+        else:
+            queryset = queryset.prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.select_related('author'))
+            )
         
         # فلترة حسب نوع المحتوى
         content_type = self.request.query_params.get('type', None)
@@ -76,11 +119,26 @@ class ContentViewSet(viewsets.ModelViewSet):
     
     def retrieve(self, request, *args, **kwargs):
         """زيادة عدد المشاهدات عند عرض المحتوى"""
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        validators = http_cache.detail_validators(
+            self.get_queryset().prefetch_related(None).filter(**lookup)
+        )
+        if validators is None:
+            raise Http404
+        # كل مشاهدة تصل إلى هنا لتُسجَّل، ولو انتهت بـ 304
+        validators.max_age = 0
+        
+        # تُجمع المشاهدات في المخزن المؤقت وتُنقل إلى قاعدة البيانات دورياً
+        view_counter.record_view(validators.pk, request)
+        
+        not_modified = http_cache.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+        
         instance = self.get_object()
-        instance.views_count += 1
-        instance.save()
+        instance.views_count += view_counter.pending_views(instance.pk)
         serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return http_cache.apply_headers(Response(serializer.data), validators)
     
     @action(detail=True, methods=['post'])
     def publish(self, request, slug=None):
@@ -105,18 +163,122 @@ class ContentViewSet(viewsets.ModelViewSet):
     def published(self, request):
         """الحصول على المحتوى المنشور فقط"""
         queryset = self.get_queryset().filter(status=Content.Status.PUBLISHED)
+        
+        validators = http_cache.collection_validators(queryset, request.get_full_path())
+        not_modified = http_cache.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+        
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return http_cache.apply_headers(self.get_paginated_response(serializer.data), validators)
         serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return http_cache.apply_headers(Response(serializer.data), validators)
+
+
+class PublicContentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    واجهة عامة للقراءة فقط للمحتوى المنشور (بدون مصادقة)
+    
+    الاستجابات لا تختلف باختلاف المستخدم، وتُخزَّن مؤقتاً حسب إصدار بيانات المحتوى،
+    وتُرسل مع Cache-Control: public و ETag فيمكن وضعها خلف proxy_cache في nginx،
+    عدا صفحة المحتوى الواحد التي يجب أن تصل إلى Django لتسجيل المشاهدة.
+    """
+    
+    permission_classes = [AllowAny]
+    # بدون مصادقة: ترويسة Authorization أو الكوكيز لا تغير الاستجابة
+    authentication_classes = []
+    lookup_field = 'slug'
+    
+    # معاملات الطلب المعتبرة؛ غيرها لا يؤثر على الاستجابة ولا على مفتاح التخزين
+    cache_params = ('page', 'type')
+    
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return PublicContentDetailSerializer
+        return PublicContentListSerializer
+    
+    def get_queryset(self):
+        queryset = (
+            Content.objects.filter(status=Content.Status.PUBLISHED)
+            .defer('search_vector')
+            .select_related('author', 'category')
+            .prefetch_related('tags')
+            .order_by('-published_at', '-pk')
+        )
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch(
+                'comments',
+                queryset=Comment.objects.filter(is_approved=True).select_related('author'),
+                to_attr='approved_comments'
+            ))
+        
+        content_type = self.request.query_params.get('type', None)
+        if content_type:
+            queryset = queryset.filter(content_type=content_type)
+        return queryset
+    
+    def cached_response(self, request, name, compute, max_age=None, **params):
+        """الاستجابة من التخزين المؤقت، أو 304 إذا طابق ETag الإصدار الحالي"""
+        params.update({key: request.query_params.get(key) for key in self.cache_params})
+        params['host'] = request.get_host()
+        version = caching.data_version()
+        validators = http_cache.Validators(
+            etag=f'"{version}-{caching.params_digest([name, params])}"',
+            public=True,
+            max_age=max_age,
+        )
+        not_modified = http_cache.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+        
+        data = caching.get_or_compute(name, params, compute, version=version)
+        return http_cache.apply_headers(Response(data), validators)
+    
+    def paginated_data(self, queryset):
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data).data
+        return self.get_serializer(queryset, many=True).data
+    
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, 'list', lambda: self.paginated_data(self.get_queryset()))
+    
+    def retrieve(self, request, *args, **kwargs):
+        slug = kwargs[self.lookup_field]
+        content_id = caching.get_or_compute('content-id', {'slug': slug}, lambda: (
+            Content.objects.filter(status=Content.Status.PUBLISHED, slug=slug)
+            .values_list('pk', flat=True).first()
+        ))
+        if content_id is not None:
+            view_counter.record_view(content_id, request)
+        # max-age=0 حتى تعيد المخازن التحقق فتصل كل مشاهدة إلى Django
+        return self.cached_response(
+            request, 'detail', lambda: self.get_serializer(self.get_object()).data, max_age=0, slug=slug
+        )
+    
+    @action(detail=False, url_path=r'category/(?P<category_slug>[^/.]+)')
+    def by_category(self, request, category_slug=None):
+        """المحتوى المنشور في تصنيف"""
+        def compute():
+            category = get_object_or_404(Category, slug=category_slug)
+            return self.paginated_data(self.get_queryset().filter(category=category))
+        return self.cached_response(request, 'category', compute, category=category_slug)
+    
+    @action(detail=False, url_path=r'tag/(?P<tag_slug>[^/.]+)')
+    def by_tag(self, request, tag_slug=None):
+        """المحتوى المنشور بعلامة"""
+        def compute():
+            tag = get_object_or_404(Tag, slug=tag_slug)
+            return self.paginated_data(self.get_queryset().filter(tags=tag))
+        return self.cached_response(request, 'tag', compute, tag=tag_slug)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة التعليقات"""
     
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.select_related('author')
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.OrderingFilter]
@@ -124,7 +286,7 @@ class CommentViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """تخصيص الاستعلام حسب المحتوى"""
-        queryset = Comment.objects.all()
+        queryset = Comment.objects.select_related('author')
         content_slug = self.request.query_params.get('content', None)
         if content_slug:
             queryset = queryset.filter(content__slug=content_slug)
@@ -152,7 +314,7 @@ class CommentViewSet(viewsets.ModelViewSet):
 class MediaViewSet(viewsets.ModelViewSet):
     """ViewSet لإدارة الوسائط"""
     
-    queryset = Media.objects.all()
+    queryset = Media.objects.select_related('uploaded_by')
     serializer_class = MediaSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
@@ -161,7 +323,7 @@ class MediaViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """تخصيص الاستعلام حسب نوع الوسائط"""
-        queryset = Media.objects.all()
+        queryset = Media.objects.select_related('uploaded_by')
         media_type = self.request.query_params.get('type', None)
         if media_type:
             queryset = queryset.filter(media_type=media_type)
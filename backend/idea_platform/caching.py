@@ -0,0 +1,64 @@
+"""
+تخزين مؤقت مرتبط بإصدار البيانات
+
+تُخزَّن النتائج تحت مفتاح يتضمن إصدار بيانات نطاق معين (مثل billing)، ويزداد
+الإصدار عند أي تعديل على بيانات النطاق، فتصبح النتائج القديمة غير قابلة للوصول
+فوراً دون حذفها واحدة واحدة.
+"""
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+# مدة احتياطية فقط؛ الإبطال الفعلي يتم بتغيير الإصدار
+DEFAULT_TIMEOUT = 60 * 60 * 24
+
+
+def _initial_version():
+    # قيمة مبنية على الوقت حتى لا يتكرر إصدار قديم إذا حُذف المفتاح من الذاكرة
+    return int(time.time() * 1000)
+
+
+def params_digest(params):
+    """بصمة ثابتة لمعاملات النتيجة"""
+    encoded = json.dumps(params or {}, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.md5(encoded).hexdigest()
+
+
+class VersionedCache:
+    """نتائج مخزنة لنطاق واحد تُبطل كلها بزيادة إصداره"""
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.version_key = f"{namespace}:data-version"
+
+    def data_version(self):
+        """الإصدار الحالي لبيانات النطاق"""
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, _initial_version(), timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        """إبطال جميع النتائج المخزنة بزيادة الإصدار"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, _initial_version(), timeout=None)
+
+    def cache_key(self, name, params=None, version=None):
+        """مفتاح نتيجة مرتبط بالإصدار والمعاملات"""
+        version = self.data_version() if version is None else version
+        return f"{self.namespace}:{name}:{version}:{params_digest(params)}"
+
+    def get_or_compute(self, name, params, compute, version=None, timeout=DEFAULT_TIMEOUT):
+        """إرجاع النتيجة المخزنة أو حسابها وتخزينها"""
+        key = self.cache_key(name, params, version)
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            cache.set(key, result, timeout)
+        return result
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 import os
 
@@ -228,6 +229,68 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+
+# مهلة مهمة توليد التقرير بالثواني؛ المهام المعلقة أقدم منها تُعتبر فاشلة (توقف العامل)
+REPORT_JOB_TIMEOUT = config('REPORT_JOB_TIMEOUT', default=1800, cast=int)
+CELERY_BEAT_SCHEDULE = {
+    'reconcile-dashboard-counters': {
+        'task': 'reports.tasks.reconcile_dashboard_counters',
+        'schedule': timedelta(hours=1),
+    },
+    'refresh-revenue-rollups': {
+        'task': 'reports.tasks.refresh_revenue_rollups',
+        'schedule': timedelta(minutes=10),
+    },
+    'rebuild-revenue-rollups': {
+        'task': 'reports.tasks.rebuild_revenue_rollups',
+        'schedule': timedelta(days=1),
+    },
+    'mark-overdue-invoices': {
+        'task': 'billing.tasks.mark_overdue_invoices',
+        'schedule': timedelta(hours=1),
+    },
+    'flush-content-views': {
+        'task': 'cms.tasks.flush_content_views',
+        'schedule': timedelta(minutes=1),
+    },
+}
+
+# رسم ملفات PDF في مجموعة عمال مستقلة حتى لا تؤخر المهام الأخرى
+CELERY_TASK_ROUTES = {
+    'billing.tasks.render_invoice_pdf': {'queue': 'pdf'},
+}
+
+# Cache Configuration
+# Redis مشترك بين العمليات حتى يصل إبطال التخزين المؤقت إلى الجميع (مطلوب في الإنتاج عبر CACHE_URL)؛
+# في التطوير المحلي بدون Redis تُستخدم ذاكرة العملية
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+            'KEY_PREFIX': 'idea_platform',
+        }
+    }
+elif DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_PREFIX': 'idea_platform',
+        }
+    }
+else:
+    raise ImproperlyConfigured('CACHE_URL مطلوب في الإنتاج (Redis مشترك بين العمليات)')
+
+# عداد مشاهدات المحتوى: مدة تجاهل المشاهدات المكررة من الزائر نفسه بالثواني (0 لتعطيله)
+CMS_VIEW_DEDUPE_SECONDS = config('CMS_VIEW_DEDUPE_SECONDS', default=0, cast=int)
+
+# إعداد البحث النصي في PostgreSQL ('simple' مع توحيد الحروف العربية، أو 'arabic' للتجذيع)
+CMS_SEARCH_CONFIG = config('CMS_SEARCH_CONFIG', default='simple')
+
+# مدة تخزين المحتوى المنشور في nginx وشبكات التوزيع (Cache-Control: max-age) بالثواني
+CMS_CACHE_MAX_AGE = config('CMS_CACHE_MAX_AGE', default=60, cast=int)
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = config('MAX_UPLOAD_SIZE', default=10485760, cast=int)  # 10MB
@@ -239,6 +302,9 @@ COMPANY_EMAIL = config('COMPANY_EMAIL', default='info@ideateam.com')
 COMPANY_PHONE = config('COMPANY_PHONE', default='+966123456789')
 COMPANY_ADDRESS = config('COMPANY_ADDRESS', default='الرياض، المملكة العربية السعودية')
 
+# خط ملفات PDF للفواتير (يجب أن يدعم الحروف العربية)
+INVOICE_PDF_FONT = config('INVOICE_PDF_FONT', default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 # Frontend URLs
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:3000')
 DASHBOARD_URL = config('DASHBOARD_URL', default='http://localhost:3000/dashboard')
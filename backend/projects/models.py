@@ -74,6 +74,9 @@ class Project(models.Model):
         verbose_name = _('مشروع')
         verbose_name_plural = _('المشاريع')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='project_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.client.get_full_name()}"
@@ -174,6 +177,9 @@ class Task(models.Model):
         verbose_name = _('مهمة')
         verbose_name_plural = _('المهام')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='task_updated_at_idx'),
+        ]
     
     def __str__(self):
         return f"{self.title} - {self.project.title}"
@@ -0,0 +1,135 @@
+"""
+عدادات لوحة التحكم
+
+تُحدَّث العدادات بفروقات صغيرة عند كل حفظ أو حذف للمشاريع والعملاء،
+وتُقرأ لوحة التحكم منها مباشرة بدلاً من تجميع الجداول كاملة في كل طلب.
+"""
+
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import DashboardCounter
+
+PROJECTS_TOTAL = 'projects.total'
+PROJECTS_REVENUE = 'projects.revenue'
+PROJECTS_STATUS_PREFIX = 'projects.status.'
+PROJECTS_STARTED_PREFIX = 'projects.started.'
+CLIENTS_TOTAL = 'clients.total'
+# يُكتب مع كل إعادة بناء؛ غيابه يعني أن العدادات لم تُبنَ بعد حتى لو أنشأت
+# الإشارات بعضها بفروقاتها
+BUILT_MARKER = 'counters.built'
+
+# الحقول التي تؤثر على عدادات المشاريع
+PROJECT_TRACKED_FIELDS = ('status', 'budget', 'start_date')
+
+
+def _month_key(start_date):
+    """مفتاح شهر البداية بالصيغة YYYY-MM (يقبل التاريخ أو النص)"""
+    return f"{PROJECTS_STARTED_PREFIX}{str(start_date)[:7]}"
+
+
+def project_contributions(values):
+    """مساهمة مشروع واحد في العدادات"""
+    contributions = {
+        PROJECTS_TOTAL: Decimal('1'),
+        PROJECTS_REVENUE: Decimal(values.get('budget') or 0),
+        f"{PROJECTS_STATUS_PREFIX}{values.get('status')}": Decimal('1'),
+    }
+    if values.get('start_date'):
+        contributions[_month_key(values['start_date'])] = Decimal('1')
+    return contributions
+
+
+def diff_contributions(old, new):
+    """الفرق بين مساهمتين (الجديدة ناقص القديمة)"""
+    deltas = dict(new)
+    for key, value in old.items():
+        deltas[key] = deltas.get(key, Decimal('0')) - value
+    return {key: value for key, value in deltas.items() if value}
+
+
+def apply_deltas(deltas):
+    """تطبيق الفروقات على العدادات بزيادات ذرية F()"""
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        updated = DashboardCounter.objects.filter(key=key).update(value=F('value') + delta)
+        if not updated:
+            counter, created = DashboardCounter.objects.get_or_create(key=key, defaults={'value': delta})
+            if not created:
+                DashboardCounter.objects.filter(key=key).update(value=F('value') + delta)
+
+
+def rebuild():
+    """إعادة بناء جميع العدادات من الجداول الأصلية"""
+    from projects.models import Project
+    from crm.models import Client
+
+    totals = Project.objects.aggregate(total=Count('id'), revenue=Sum('budget'))
+    counters = {
+        BUILT_MARKER: 1,
+        PROJECTS_TOTAL: totals['total'] or 0,
+        PROJECTS_REVENUE: totals['revenue'] or 0,
+        CLIENTS_TOTAL: Client.objects.count(),
+    }
+
+    for row in Project.objects.order_by().values('status').annotate(total=Count('id')):
+        counters[f"{PROJECTS_STATUS_PREFIX}{row['status']}"] = row['total']
+
+    started = (
+        Project.objects.order_by()
+        .filter(start_date__isnull=False)
+        .values_list('start_date', flat=True)
+    )
+    for start_date in started.iterator(chunk_size=2000):
+        key = _month_key(start_date)
+        counters[key] = counters.get(key, 0) + 1
+
+    # كتابة فوق القيم الحالية (upsert) بدلاً من الحذف ثم الإنشاء، حتى لا يصطدم
+    # apply_deltas المتزامن بمفتاح أُعيد إنشاؤه بينهما
+    with transaction.atomic():
+        DashboardCounter.objects.bulk_create(
+            [DashboardCounter(key=key, value=value) for key, value in counters.items()],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['key'],
+            update_fields=['value', 'updated_at'],
+        )
+        DashboardCounter.objects.exclude(key__in=list(counters)).delete()
+    return counters
+
+
+def get_dashboard_stats(month_start):
+    """قراءة إحصائيات لوحة التحكم من العدادات في استعلام واحد"""
+    from projects.models import Project
+
+    active_key = f"{PROJECTS_STATUS_PREFIX}{Project.ProjectStatus.ACTIVE}"
+    completed_key = f"{PROJECTS_STATUS_PREFIX}{Project.ProjectStatus.COMPLETED}"
+    month_from = _month_key(month_start)
+
+    rows = DashboardCounter.objects.filter(
+        Q(key__in=[BUILT_MARKER, PROJECTS_TOTAL, PROJECTS_REVENUE, CLIENTS_TOTAL, active_key, completed_key]) |
+        Q(key__startswith=PROJECTS_STARTED_PREFIX, key__gte=month_from)
+    ).values_list('key', 'value')
+    counters = dict(rows)
+
+    # لم تُبنَ العدادات بعد (أول تشغيل): بناؤها مرة واحدة
+    if BUILT_MARKER not in counters:
+        rebuild()
+        counters = dict(rows.all())
+
+    monthly_projects = sum(
+        value for key, value in counters.items()
+        if key.startswith(PROJECTS_STARTED_PREFIX)
+    )
+
+    return {
+        'total_projects': int(counters.get(PROJECTS_TOTAL, 0)),
+        'active_projects': int(counters.get(active_key, 0)),
+        'completed_projects': int(counters.get(completed_key, 0)),
+        'total_clients': int(counters.get(CLIENTS_TOTAL, 0)),
+        'total_revenue': counters.get(PROJECTS_REVENUE, 0),
+        'monthly_projects': int(monthly_projects),
+    }
@@ -0,0 +1,217 @@
+"""
+منشئ التقارير المخصصة
+
+تُترجم مواصفات التقرير (المصدر، التجميع، التقسيم الزمني، المرشحات، الدوال
+التجميعية) إلى استعلام ORM واحد من نوع values().annotate() ضمن قوائم حقول
+مسموح بها، مع حد أقصى للصفوف ومهلة للاستعلام.
+"""
+
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+
+from billing.models import Invoice, Payment
+from crm.models import Client, Lead
+from projects.models import Project, Task
+from . import report_cache
+
+MAX_ROWS = 1000
+QUERY_TIMEOUT_MS = 5000
+
+# المصادر المسموح بها: الحقول القابلة للتجميع والتصفية، الحقول الرقمية، حقول التاريخ
+SOURCES = {
+    'project': {
+        'model': Project,
+        'group_fields': ['status', 'project_type', 'priority', 'client__company_name', 'project_manager__email'],
+        'numeric_fields': ['budget', 'cost'],
+        'date_fields': ['start_date', 'end_date', 'deadline', 'created_at'],
+        'version': report_cache.PROJECTS,
+    },
+    'task': {
+        'model': Task,
+        'group_fields': ['status', 'priority', 'project__title', 'assigned_to__email'],
+        'numeric_fields': ['estimated_hours', 'actual_hours'],
+        'date_fields': ['due_date', 'completed_at', 'created_at'],
+        'version': report_cache.PROJECTS,
+    },
+    'invoice': {
+        'model': Invoice,
+        'group_fields': ['status', 'client__company_name', 'project__title'],
+        'numeric_fields': ['subtotal', 'tax_amount', 'discount_amount', 'total_amount'],
+        'date_fields': ['issue_date', 'due_date', 'paid_at', 'created_at'],
+        'version': report_cache.INVOICES,
+    },
+    'payment': {
+        'model': Payment,
+        'group_fields': ['status', 'payment_method', 'client__company_name'],
+        'numeric_fields': ['amount'],
+        'date_fields': ['payment_date', 'processed_at', 'created_at'],
+        'version': report_cache.PAYMENTS,
+    },
+    'lead': {
+        'model': Lead,
+        'group_fields': ['status', 'source', 'industry', 'company_size', 'assigned_to__email'],
+        'numeric_fields': [],
+        'date_fields': ['last_contact_date', 'next_follow_up', 'created_at'],
+        'version': None,
+    },
+    'client': {
+        'model': Client,
+        'group_fields': ['status', 'city', 'country', 'industry', 'account_manager__email'],
+        'numeric_fields': ['credit_limit'],
+        'date_fields': ['client_since', 'created_at'],
+        'version': report_cache.CLIENTS,
+    },
+}
+
+AGGREGATES = {
+    'count': lambda field: Count(field),
+    'count_distinct': lambda field: Count(field, distinct=True),
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+}
+
+DATE_BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+
+FILTER_OPERATORS = {
+    'eq': 'exact',
+    'in': 'in',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte',
+    'isnull': 'isnull',
+}
+
+
+class CustomReportTimeout(Exception):
+    """تجاوز الاستعلام المهلة المسموح بها"""
+
+
+def filter_fields(source):
+    config = SOURCES[source]
+    return config['group_fields'] + config['numeric_fields'] + config['date_fields']
+
+
+def aggregate_fields(source, func):
+    config = SOURCES[source]
+    if func in ('count', 'count_distinct'):
+        return ['id'] + config['group_fields']
+    return config['numeric_fields']
+
+
+def aggregate_alias(item):
+    """اسم عمود الدالة التجميعية في النتيجة"""
+    return item.get('alias') or f"{item['func']}_{item['field']}"
+
+
+def _resolve_field(model, path):
+    """الحقل النهائي لمسار بحث مثل client__company_name"""
+    field = None
+    for part in path.split('__'):
+        field = model._meta.get_field(part)
+        model = field.related_model or model
+    return field
+
+
+def coerce_filter_value(model, path, operator, value):
+    """تحويل قيمة المرشح إلى نوع الحقل (يرفع ValueError عند عدم الصلاحية)"""
+    if operator == 'isnull':
+        return bool(value)
+    field = _resolve_field(model, path)
+    try:
+        if operator == 'in':
+            return [field.to_python(item) for item in value]
+        return field.to_python(value)
+    except DjangoValidationError as exc:
+        raise ValueError(f"قيمة غير صالحة للحقل {path}") from exc
+
+
+def build_queryset(spec):
+    """ترجمة المواصفات (بعد التحقق منها) إلى استعلام واحد
+
+    تُرجع (الاستعلام، الدوال التجميعية للصف الإجمالي أو None، أسماء الأعمدة).
+    """
+    config = SOURCES[spec['source']]
+    model = config['model']
+    queryset = model.objects.order_by()
+
+    for item in spec.get('filters', []):
+        lookup = f"{item['field']}__{FILTER_OPERATORS[item['op']]}"
+        queryset = queryset.filter(**{lookup: coerce_filter_value(model, item['field'], item['op'], item.get('value'))})
+
+    group_by = list(spec.get('group_by', []))
+    bucket = spec.get('date_bucket')
+    if bucket:
+        queryset = queryset.annotate(period=DATE_BUCKETS[bucket['unit']](bucket['field']))
+        group_by.insert(0, 'period')
+
+    annotations = {
+        aggregate_alias(item): AGGREGATES[item['func']](item['field'])
+        for item in spec['aggregates']
+    }
+
+    if not group_by:
+        # بدون تجميع: صف إجمالي واحد
+        return queryset, annotations, list(annotations)
+
+    queryset = queryset.values(*group_by).annotate(**annotations)
+    ordering = spec.get('order_by') or group_by
+    return queryset.order_by(*ordering), None, group_by + list(annotations)
+
+
+@contextmanager
+def _statement_timeout(milliseconds):
+    """مهلة على مستوى قاعدة البيانات (PostgreSQL فقط)"""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [milliseconds])
+        yield
+
+
+def _serialize(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def run_spec(spec, max_rows=MAX_ROWS, timeout_ms=QUERY_TIMEOUT_MS):
+    """تنفيذ المواصفات وإرجاع أعمدة وصفوف مختصرة"""
+    queryset, totals, columns = build_queryset(spec)
+    limit = min(spec.get('limit') or max_rows, max_rows)
+
+    try:
+        with _statement_timeout(timeout_ms):
+            if totals is not None:
+                row = queryset.aggregate(**totals)
+                rows = [[row[column] for column in columns]]
+            else:
+                # صف إضافي واحد لمعرفة ما إذا كانت النتيجة مقتطعة
+                rows = list(queryset.values_list(*columns)[:limit + 1])
+    except OperationalError as exc:
+        if 'statement timeout' in str(exc) or 'canceling statement' in str(exc):
+            raise CustomReportTimeout() from exc
+        raise
+
+    truncated = len(rows) > limit
+    return {
+        'columns': columns,
+        'rows': [[_serialize(value) for value in row] for row in rows[:limit]],
+        'truncated': truncated,
+    }
@@ -0,0 +1,192 @@
+"""
+تصدير مقاييس التقارير
+
+تُقرأ الصفوف على دفعات عبر QuerySet.iterator وتُكتب مباشرة إلى الاستجابة،
+فيبقى استهلاك الذاكرة ثابتاً مهما كان عدد الصفوف.
+"""
+
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+from .models import Report, ProjectPerformanceMetric, SalesMetric, ClientMetric
+
+EXPORT_CHUNK_SIZE = 2000
+
+# عرض العلاقات بقيمة مقروءة بدلاً من المعرف
+RELATED_LOOKUPS = {
+    'project': 'project__title',
+    'client': 'client__company_name',
+}
+
+EXCLUDED_FIELDS = {'id', 'report'}
+
+_ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def export_columns(model):
+    """أعمدة التصدير وعناوينها العربية من verbose_name"""
+    columns = []
+    for field in model._meta.concrete_fields:
+        if field.name in EXCLUDED_FIELDS:
+            continue
+        lookup = RELATED_LOOKUPS.get(field.name, field.name) if field.is_relation else field.name
+        columns.append((lookup, str(field.verbose_name)))
+    return columns
+
+
+def export_rows(queryset, columns):
+    """صفوف التصدير على دفعات ثابتة الحجم"""
+    lookups = [lookup for lookup, _ in columns]
+    return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'نعم' if value else 'لا'
+    if isinstance(value, datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M')
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    """كائن كتابة يعيد القيمة بدلاً من تخزينها"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(headers, rows):
+    """توليد ملف CSV سطراً بسطر"""
+    writer = csv.writer(_Echo())
+    # BOM ليتعرف Excel على الترميز العربي
+    yield '\ufeff' + writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow([_format_value(value) for value in row])
+
+
+class _StreamBuffer:
+    """مخزن مؤقت غير قابل للتنقل يُفرَّغ بعد كل دفعة"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="1"><font><sz val="11"/><name val="Arial"/></font></fonts>'
+        '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="1"><xf xfId="0"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_XLSX_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView rightToLeft="1" workbookViewId="0"/></sheetViews>'
+    '<sheetData>'
+)
+
+_XLSX_SHEET_FOOTER = '</sheetData></worksheet>'
+
+
+def _xlsx_cell(value):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = _ILLEGAL_XML_CHARS.sub('', _format_value(value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def stream_xlsx(headers, rows, sheet_name='Sheet1'):
+    """توليد ملف XLSX كتدفق zip دون تحميل الصفوف في الذاكرة"""
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        archive.writestr('xl/workbook.xml', _XLSX_WORKBOOK.format(name=escape(sheet_name[:31])))
+        yield buffer.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', mode='w') as sheet:
+            sheet.write((_XLSX_SHEET_HEADER + _xlsx_row(headers)).encode('utf-8'))
+            for index, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                if index % EXPORT_CHUNK_SIZE == 0:
+                    data = buffer.pop()
+                    if data:
+                        yield data
+            sheet.write(_XLSX_SHEET_FOOTER.encode('utf-8'))
+    yield buffer.pop()
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'xlsx': (stream_xlsx, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+# نموذج المقاييس لكل نوع تقرير
+REPORT_METRIC_MODELS = {
+    Report.ReportType.PROJECT_PERFORMANCE: ProjectPerformanceMetric,
+    Report.ReportType.SALES: SalesMetric,
+    Report.ReportType.CLIENT: ClientMetric,
+}
@@ -0,0 +1,333 @@
+"""
+مولدات التقارير
+
+كل مولد يملأ تقريراً موجوداً بمقاييسه، ويُستدعى إما مباشرة داخل الطلب
+(للتقارير الصغيرة) أو من مهمة Celery (للتقارير الكبيرة).
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum, Count, Q, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Report, ProjectPerformanceMetric, SalesMetric, ClientMetric
+from . import custom, rollups
+from projects.models import Project, Task
+from crm.models import Client
+from billing.models import Invoice, Payment
+
+# عدد المشاريع بين كل تحديثين لنسبة التقدم
+PROGRESS_STEP = 500
+
+# حقول مقياس الأداء التي يعيد التحديث التدريجي حسابها
+REFRESH_METRIC_FIELDS = [
+    'completion_percentage', 'budget_used', 'tasks_completed',
+    'tasks_total', 'days_remaining', 'is_on_track',
+]
+
+
+def _noop_progress(percent):
+    pass
+
+
+def _filter_projects(report):
+    """المشاريع ضمن فترة التقرير"""
+    projects = Project.objects.all()
+    if report.start_date:
+        projects = projects.filter(start_date__gte=report.start_date)
+    if report.end_date:
+        projects = projects.filter(start_date__lte=report.end_date)
+    return projects
+
+
+def _project_task_stats(projects):
+    """إحصائيات المهام لكل مشروع في استعلام مجمّع واحد مع قائمة المشاريع"""
+    return projects.order_by().annotate(
+        task_total=Count('tasks'),
+        task_completed=Count('tasks', filter=Q(tasks__status=Task.TaskStatus.COMPLETED)),
+        task_estimated_hours=Sum('tasks__estimated_hours'),
+        task_actual_hours=Sum('tasks__actual_hours'),
+    )
+
+
+def _project_metric_values(project, current_date):
+    """حساب قيم مقياس الأداء لمشروع مُعلَّم بإحصائيات مهامه"""
+    # حساب الأيام المتبقية
+    if project.end_date:
+        days_remaining = (project.end_date - current_date).days
+    else:
+        days_remaining = 0
+
+    # نسبة الإنجاز من المهام الفعلية
+    if project.task_total:
+        completion = (Decimal(project.task_completed * 100) / project.task_total).quantize(Decimal('0.01'))
+    else:
+        completion = Decimal('0')
+
+    # الميزانية المستخدمة: التكلفة الفعلية إن وجدت، وإلا نسبة الساعات الفعلية إلى المقدرة
+    budget = project.budget or Decimal('0')
+    if project.cost is not None:
+        budget_used = project.cost
+    elif project.task_estimated_hours:
+        budget_used = budget * (project.task_actual_hours or 0) / project.task_estimated_hours
+    else:
+        budget_used = budget * completion / 100
+
+    return {
+        'completion_percentage': completion,
+        'budget_used': Decimal(budget_used).quantize(Decimal('0.01')),
+        'tasks_completed': project.task_completed,
+        'tasks_total': project.task_total,
+        'days_remaining': days_remaining,
+        'is_on_track': completion == 100 or days_remaining > 0,
+    }
+
+
+def generate_project_performance(report, progress=_noop_progress):
+    """توليد مقاييس أداء المشاريع بعدد ثابت من الاستعلامات"""
+    projects = _filter_projects(report)
+    total = projects.count()
+
+    # إنشاء مقاييس لكل مشروع باستخدام bulk_create لتحسين الأداء
+    metrics_to_create = []
+    current_date = timezone.now().date()
+
+    projects = _project_task_stats(projects).iterator(chunk_size=PROGRESS_STEP)
+    for index, project in enumerate(projects, start=1):
+        metrics_to_create.append(
+            ProjectPerformanceMetric(
+                project=project,
+                report=report,
+                **_project_metric_values(project, current_date)
+            )
+        )
+
+        if index % PROGRESS_STEP == 0:
+            progress(int(index * 90 / total))
+
+    # إنشاء جميع المقاييس دفعة واحدة
+    ProjectPerformanceMetric.objects.bulk_create(metrics_to_create, batch_size=100)
+
+
+def refresh_project_performance(report, since, progress=_noop_progress):
+    """إعادة حساب مقاييس المشاريع التي تغيرت هي أو مهامها بعد آخر حساب فقط"""
+    changed = Q(updated_at__gt=since) | Q(
+        pk__in=Task.objects.filter(updated_at__gt=since).values('project_id')
+    )
+
+    # المقاييس الحالية للمشاريع المتغيرة فقط
+    metrics = {
+        metric.project_id: metric
+        for metric in report.project_metrics.filter(project__in=Project.objects.filter(changed))
+    }
+    current_date = timezone.now().date()
+    to_create, to_update = [], []
+
+    projects = _project_task_stats(_filter_projects(report).filter(changed))
+    for project in projects.iterator(chunk_size=PROGRESS_STEP):
+        values = _project_metric_values(project, current_date)
+        metric = metrics.pop(project.pk, None)
+        if metric is None:
+            to_create.append(ProjectPerformanceMetric(project=project, report=report, **values))
+            continue
+        for field, value in values.items():
+            setattr(metric, field, value)
+        to_update.append(metric)
+
+    ProjectPerformanceMetric.objects.bulk_create(to_create, batch_size=100)
+    ProjectPerformanceMetric.objects.bulk_update(to_update, REFRESH_METRIC_FIELDS, batch_size=100)
+
+    # مشاريع تغيرت وخرجت من فترة التقرير
+    if metrics:
+        ProjectPerformanceMetric.objects.filter(pk__in=[metric.pk for metric in metrics.values()]).delete()
+
+    return {'created': len(to_create), 'updated': len(to_update), 'removed': len(metrics)}
+
+
+def generate_sales_report(report, progress=_noop_progress):
+    """توليد مقاييس المبيعات من جداول تجميع الإيرادات"""
+    # الجداول تُحدَّث دورياً بمهمة refresh_revenue_rollups وليس داخل الطلب
+    stats = rollups.sales_totals(report.start_date, report.end_date)
+
+    SalesMetric.objects.create(
+        report=report,
+        total_revenue=stats['total_revenue'] or 0,
+        total_projects=stats['total_projects'] or 0,
+        completed_projects=stats['completed_projects'] or 0,
+        active_projects=stats['active_projects'] or 0,
+        average_project_value=stats['avg_project_value'] or 0,
+        period_start=report.start_date or timezone.now().date(),
+        period_end=report.end_date or timezone.now().date()
+    )
+
+
+def generate_client_report(report, progress=_noop_progress):
+    """توليد مقاييس العملاء"""
+    # مشاريع العميل مرتبطة بحساب المستخدم الخاص به
+    clients = Client.objects.annotate(
+        total_projects=Count('user__client_projects', distinct=True),
+        active_projects=Count(
+            'user__client_projects',
+            filter=Q(user__client_projects__status=Project.ProjectStatus.ACTIVE),
+            distinct=True
+        ),
+        completed_projects=Count(
+            'user__client_projects',
+            filter=Q(user__client_projects__status=Project.ProjectStatus.COMPLETED),
+            distinct=True
+        ),
+        total_spent=Sum('user__client_projects__budget'),
+        last_project_date=Max('user__client_projects__start_date')
+    )
+
+    # إنشاء مقاييس العملاء باستخدام البيانات المجمعة
+    metrics_to_create = []
+    for client in clients.iterator(chunk_size=PROGRESS_STEP):
+        metrics_to_create.append(
+            ClientMetric(
+                report=report,
+                client=client,
+                total_projects=client.total_projects or 0,
+                active_projects=client.active_projects or 0,
+                completed_projects=client.completed_projects or 0,
+                total_spent=client.total_spent or 0,
+                satisfaction_score=8.0,  # يمكن تحسينها لاحقًا
+                last_project_date=client.last_project_date
+            )
+        )
+
+    # إنشاء جميع المقاييس دفعة واحدة لتحسين الأداء
+    ClientMetric.objects.bulk_create(metrics_to_create, batch_size=100)
+
+
+def _money(value):
+    return str((value or Decimal('0')).quantize(Decimal('0.01')))
+
+
+def _month_label(value):
+    return value.strftime('%Y-%m') if value else None
+
+
+def generate_financial_report(report, progress=_noop_progress):
+    """توليد التقرير المالي من الفواتير والمدفوعات بعدد ثابت من الاستعلامات المجمّعة"""
+    invoices = Invoice.objects.order_by().exclude(
+        status__in=[Invoice.InvoiceStatus.DRAFT, Invoice.InvoiceStatus.CANCELLED]
+    )
+    payments = Payment.objects.order_by().filter(status=Payment.PaymentStatus.COMPLETED)
+    if report.start_date:
+        invoices = invoices.filter(issue_date__gte=report.start_date)
+        payments = payments.filter(payment_date__gte=report.start_date)
+    if report.end_date:
+        invoices = invoices.filter(issue_date__lte=report.end_date)
+        payments = payments.filter(payment_date__lte=report.end_date)
+
+    # المدفوعات على فواتير الفترة (لحساب المبالغ المستحقة) بغض النظر عن تاريخ الدفع
+    applied = Payment.objects.order_by().filter(
+        status=Payment.PaymentStatus.COMPLETED, invoice__in=invoices
+    )
+
+    invoice_sums = {
+        'invoices': Count('id'),
+        'invoiced': Sum('total_amount'),
+        'tax': Sum('tax_amount'),
+        'discount': Sum('discount_amount'),
+    }
+
+    # 1-3: التجميع الشهري
+    months = defaultdict(dict)
+    for row in invoices.annotate(month=TruncMonth('issue_date')).values('month').annotate(**invoice_sums):
+        months[_month_label(row['month'])].update(row)
+    for row in payments.annotate(month=TruncMonth('payment_date')).values('month').annotate(collected=Sum('amount')):
+        months[_month_label(row['month'])]['collected'] = row['collected']
+    for row in applied.annotate(month=TruncMonth('invoice__issue_date')).values('month').annotate(applied=Sum('amount')):
+        months[_month_label(row['month'])]['applied'] = row['applied']
+    progress(50)
+
+    # 4-6: التجميع حسب العميل
+    clients = defaultdict(dict)
+    for row in invoices.values('client_id', 'client__company_name').annotate(**invoice_sums):
+        clients[row['client_id']].update(row)
+    for row in payments.values('client_id', 'client__company_name').annotate(collected=Sum('amount')):
+        clients[row['client_id']].update(row)
+    for row in applied.values('client_id', 'client__company_name').annotate(applied=Sum('amount')):
+        clients[row['client_id']].update(row)
+    progress(90)
+
+    def values_row(values):
+        invoiced = values.get('invoiced') or Decimal('0')
+        return [
+            values.get('invoices') or 0,
+            _money(invoiced),
+            _money(values.get('tax')),
+            _money(values.get('discount')),
+            _money(values.get('collected')),
+            _money(invoiced - (values.get('applied') or Decimal('0'))),
+        ]
+
+    value_columns = ['invoices', 'invoiced', 'tax', 'discount', 'collected', 'outstanding']
+    totals = {column: Decimal('0') for column in value_columns}
+    for values in months.values():
+        for column, value in zip(value_columns, values_row(values)):
+            totals[column] += Decimal(value)
+
+    # تخزين مختصر: أعمدة ثم صفوف
+    report.data = {
+        'totals': {column: (int(value) if column == 'invoices' else _money(value)) for column, value in totals.items()},
+        'months': {
+            'columns': ['month'] + value_columns,
+            'rows': [[month] + values_row(values) for month, values in sorted(months.items(), key=lambda item: item[0] or '')],
+        },
+        'clients': {
+            'columns': ['client', 'client_name'] + value_columns,
+            'rows': [
+                [client_id, values.get('client__company_name')] + values_row(values)
+                for client_id, values in sorted(clients.items())
+            ],
+        },
+    }
+
+
+def generate_custom_report(report, progress=_noop_progress):
+    """توليد تقرير مخصص من المواصفات المخزنة في بيانات التقرير"""
+    spec = report.data['spec']
+    report.data = {'spec': spec, **custom.run_spec(spec)}
+
+
+GENERATORS = {
+    Report.ReportType.PROJECT_PERFORMANCE: generate_project_performance,
+    Report.ReportType.SALES: generate_sales_report,
+    Report.ReportType.CLIENT: generate_client_report,
+    Report.ReportType.FINANCIAL: generate_financial_report,
+    Report.ReportType.CUSTOM: generate_custom_report,
+}
+
+
+def run_report(report, generator=None):
+    """تشغيل مولد التقرير مع تسجيل الحالة والتقدم والتوقيت على صف التقرير"""
+    generator = generator or GENERATORS[report.report_type]
+
+    def progress(percent):
+        Report.objects.filter(pk=report.pk).update(progress=percent)
+
+    report.job_status = Report.JobStatus.RUNNING
+    report.started_at = timezone.now()
+    report.progress = 0
+    report.error_message = ''
+    report.save(update_fields=['job_status', 'started_at', 'progress', 'error_message'])
+
+    try:
+        result = generator(report, progress=progress)
+    except Exception as exc:
+        report.job_status = Report.JobStatus.FAILED
+        report.error_message = str(exc)
+        report.finished_at = timezone.now()
+        report.save(update_fields=['job_status', 'error_message', 'finished_at'])
+        raise
+
+    report.job_status = Report.JobStatus.COMPLETED
+    report.progress = 100
+    report.finished_at = timezone.now()
+    report.save(update_fields=['job_status', 'progress', 'finished_at', 'data', 'updated_at'])
+    return result
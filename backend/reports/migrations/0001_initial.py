@@ -0,0 +1,116 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('crm', '0002_initial'),
+        ('projects', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='المفتاح')),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='القيمة')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+            ],
+            options={
+                'verbose_name': 'عداد لوحة التحكم',
+                'verbose_name_plural': 'عدادات لوحة التحكم',
+                'ordering': ['key'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Report',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, verbose_name='عنوان التقرير')),
+                ('report_type', models.CharField(choices=[('project_performance', 'تقرير أداء المشاريع'), ('sales', 'تقرير المبيعات'), ('client', 'تقرير العملاء'), ('financial', 'تقرير مالي'), ('custom', 'تقرير مخصص')], max_length=30, verbose_name='نوع التقرير')),
+                ('description', models.TextField(blank=True, verbose_name='وصف التقرير')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ الإنشاء')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='تاريخ التحديث')),
+                ('start_date', models.DateField(blank=True, null=True, verbose_name='تاريخ البداية')),
+                ('end_date', models.DateField(blank=True, null=True, verbose_name='تاريخ النهاية')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='بيانات التقرير')),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to=settings.AUTH_USER_MODEL, verbose_name='منشئ التقرير')),
+            ],
+            options={
+                'verbose_name': 'تقرير',
+                'verbose_name_plural': 'التقارير',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectPerformanceMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('completion_percentage', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='نسبة الإنجاز')),
+                ('budget_used', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='الميزانية المستخدمة')),
+                ('tasks_completed', models.IntegerField(default=0, verbose_name='المهام المكتملة')),
+                ('tasks_total', models.IntegerField(default=0, verbose_name='إجمالي المهام')),
+                ('days_remaining', models.IntegerField(default=0, verbose_name='الأيام المتبقية')),
+                ('is_on_track', models.BooleanField(default=True, verbose_name='على المسار الصحيح')),
+                ('notes', models.TextField(blank=True, verbose_name='ملاحظات')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ التسجيل')),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performance_metrics', to='projects.project', verbose_name='المشروع')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_metrics', to='reports.report', verbose_name='التقرير')),
+            ],
+            options={
+                'verbose_name': 'مقياس أداء المشروع',
+                'verbose_name_plural': 'مقاييس أداء المشاريع',
+                'ordering': ['-recorded_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ClientMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_projects', models.IntegerField(default=0, verbose_name='إجمالي المشاريع')),
+                ('active_projects', models.IntegerField(default=0, verbose_name='المشاريع النشطة')),
+                ('completed_projects', models.IntegerField(default=0, verbose_name='المشاريع المكتملة')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='إجمالي الإنفاق')),
+                ('satisfaction_score', models.DecimalField(decimal_places=1, default=0, help_text='من 0 إلى 10', max_digits=3, verbose_name='درجة الرضا')),
+                ('last_project_date', models.DateField(blank=True, null=True, verbose_name='تاريخ آخر مشروع')),
+                ('notes', models.TextField(blank=True, verbose_name='ملاحظات')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ التسجيل')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_metrics', to='crm.client', verbose_name='العميل')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_metrics', to='reports.report', verbose_name='التقرير')),
+            ],
+            options={
+                'verbose_name': 'مقياس العميل',
+                'verbose_name_plural': 'مقاييس العملاء',
+                'ordering': ['-recorded_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesMetric',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='إجمالي الإيرادات')),
+                ('total_projects', models.IntegerField(default=0, verbose_name='إجمالي المشاريع')),
+                ('completed_projects', models.IntegerField(default=0, verbose_name='المشاريع المكتملة')),
+                ('active_projects', models.IntegerField(default=0, verbose_name='المشاريع النشطة')),
+                ('average_project_value', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='متوسط قيمة المشروع')),
+                ('period_start', models.DateField(verbose_name='بداية الفترة')),
+                ('period_end', models.DateField(verbose_name='نهاية الفترة')),
+                ('recorded_at', models.DateTimeField(auto_now_add=True, verbose_name='تاريخ التسجيل')),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_metrics', to='crm.client', verbose_name='العميل')),
+                ('report', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_metrics', to='reports.report', verbose_name='التقرير')),
+            ],
+            options={
+                'verbose_name': 'مقياس المبيعات',
+                'verbose_name_plural': 'مقاييس المبيعات',
+                'ordering': ['-recorded_at'],
+            },
+        ),
+    ]
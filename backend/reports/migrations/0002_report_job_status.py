@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='error_message',
+            field=models.TextField(blank=True, verbose_name='رسالة الخطأ'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='نهاية التوليد'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='job_status',
+            field=models.CharField(choices=[('pending', 'في الانتظار'), ('running', 'قيد التوليد'), ('completed', 'مكتمل'), ('failed', 'فشل')], default='completed', max_length=20, verbose_name='حالة التوليد'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='نسبة التقدم'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='بداية التوليد'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=255, verbose_name='معرف المهمة'),
+        ),
+    ]
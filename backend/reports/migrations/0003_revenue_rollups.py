@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_report_job_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectRevenueEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('project_id', models.BigIntegerField(unique=True, verbose_name='المشروع')),
+                ('bucket', models.DateField(blank=True, null=True, verbose_name='تاريخ البداية')),
+                ('status', models.CharField(max_length=20, verbose_name='حالة المشروع')),
+                ('project_type', models.CharField(max_length=50, verbose_name='نوع المشروع')),
+                ('budget', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='الميزانية')),
+            ],
+            options={
+                'verbose_name': 'مساهمة مشروع في التجميع',
+                'verbose_name_plural': 'مساهمات المشاريع في التجميع',
+            },
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='الاسم')),
+                ('value', models.DateTimeField(blank=True, null=True, verbose_name='آخر تحديث')),
+            ],
+            options={
+                'verbose_name': 'علامة التجميع',
+                'verbose_name_plural': 'علامات التجميع',
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueRollupDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20, verbose_name='حالة المشروع')),
+                ('project_type', models.CharField(max_length=50, verbose_name='نوع المشروع')),
+                ('project_count', models.IntegerField(default=0, verbose_name='عدد المشاريع')),
+                ('budgeted_count', models.IntegerField(default=0, verbose_name='عدد المشاريع ذات الميزانية')),
+                ('total_budget', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='إجمالي الميزانيات')),
+                ('bucket', models.DateField(blank=True, null=True, verbose_name='اليوم')),
+            ],
+            options={
+                'verbose_name': 'تجميع إيرادات يومي',
+                'verbose_name_plural': 'تجميعات الإيرادات اليومية',
+                'ordering': ['bucket'],
+                'unique_together': {('bucket', 'status', 'project_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RevenueRollupMonthly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20, verbose_name='حالة المشروع')),
+                ('project_type', models.CharField(max_length=50, verbose_name='نوع المشروع')),
+                ('project_count', models.IntegerField(default=0, verbose_name='عدد المشاريع')),
+                ('budgeted_count', models.IntegerField(default=0, verbose_name='عدد المشاريع ذات الميزانية')),
+                ('total_budget', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='إجمالي الميزانيات')),
+                ('bucket', models.DateField(blank=True, help_text='أول يوم في الشهر', null=True, verbose_name='الشهر')),
+            ],
+            options={
+                'verbose_name': 'تجميع إيرادات شهري',
+                'verbose_name_plural': 'تجميعات الإيرادات الشهرية',
+                'ordering': ['bucket'],
+                'unique_together': {('bucket', 'status', 'project_type')},
+            },
+        ),
+    ]
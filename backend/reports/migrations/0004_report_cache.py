@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_revenue_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataSourceVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, unique=True, verbose_name='المصدر')),
+                ('version', models.BigIntegerField(default=0, verbose_name='الإصدار')),
+            ],
+            options={
+                'verbose_name': 'إصدار مصدر بيانات',
+                'verbose_name_plural': 'إصدارات مصادر البيانات',
+            },
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, verbose_name='مفتاح التخزين المؤقت'),
+        ),
+    ]
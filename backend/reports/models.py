@@ -16,6 +16,12 @@ class Report(models.Model):
         FINANCIAL = 'financial', 'تقرير مالي'
         CUSTOM = 'custom', 'تقرير مخصص'
     
+    class JobStatus(models.TextChoices):
+        PENDING = 'pending', 'في الانتظار'
+        RUNNING = 'running', 'قيد التوليد'
+        COMPLETED = 'completed', 'مكتمل'
+        FAILED = 'failed', 'فشل'
+    
     title = models.CharField('عنوان التقرير', max_length=200)
     report_type = models.CharField('نوع التقرير', max_length=30, choices=ReportType.choices)
     description = models.TextField('وصف التقرير', blank=True)
@@ -26,6 +32,17 @@ class Report(models.Model):
     end_date = models.DateField('تاريخ النهاية', null=True, blank=True)
     data = models.JSONField('بيانات التقرير', default=dict, blank=True)
     
+    # حالة مهمة التوليد
+    job_status = models.CharField('حالة التوليد', max_length=20, choices=JobStatus.choices, default=JobStatus.COMPLETED)
+    progress = models.PositiveSmallIntegerField('نسبة التقدم', default=0)
+    task_id = models.CharField('معرف المهمة', max_length=255, blank=True)
+    started_at = models.DateTimeField('بداية التوليد', null=True, blank=True)
+    finished_at = models.DateTimeField('نهاية التوليد', null=True, blank=True)
+    error_message = models.TextField('رسالة الخطأ', blank=True)
+    
+    # مفتاح التخزين المؤقت: النوع والفترة ونطاق الصلاحية وإصدارات البيانات
+    cache_key = models.CharField('مفتاح التخزين المؤقت', max_length=64, blank=True, db_index=True)
+    
     class Meta:
         verbose_name = 'تقرير'
         verbose_name_plural = 'التقارير'
@@ -33,6 +50,26 @@ class Report(models.Model):
     
     def __str__(self):
         return f"{self.title} - {self.get_report_type_display()}"
+    
+    def get_duration_seconds(self):
+        """مدة التوليد بالثواني"""
+        if self.started_at and self.finished_at:
+            return round((self.finished_at - self.started_at).total_seconds(), 3)
+        return None
+
+
+class DataSourceVersion(models.Model):
+    """إصدار مصدر بيانات يزداد عند كل تعديل على صفوفه"""
+    
+    source = models.CharField('المصدر', max_length=50, unique=True)
+    version = models.BigIntegerField('الإصدار', default=0)
+    
+    class Meta:
+        verbose_name = 'إصدار مصدر بيانات'
+        verbose_name_plural = 'إصدارات مصادر البيانات'
+    
+    def __str__(self):
+        return f"{self.source} v{self.version}"
 
 
 class ProjectPerformanceMetric(models.Model):
@@ -103,3 +140,84 @@ class ClientMetric(models.Model):
     def __str__(self):
         return f"{self.client.company_name} - {self.total_projects} مشاريع"
 
+
+
+class DashboardCounter(models.Model):
+    """عدادات لوحة التحكم المحدثة تدريجياً عبر الإشارات"""
+    
+    key = models.CharField('المفتاح', max_length=100, unique=True)
+    value = models.DecimalField('القيمة', max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField('تاريخ التحديث', auto_now=True)
+    
+    class Meta:
+        verbose_name = 'عداد لوحة التحكم'
+        verbose_name_plural = 'عدادات لوحة التحكم'
+        ordering = ['key']
+    
+    def __str__(self):
+        return f"{self.key} = {self.value}"
+
+
+class RevenueRollup(models.Model):
+    """أساس جداول تجميع الإيرادات حسب الفترة والحالة ونوع المشروع"""
+    
+    status = models.CharField('حالة المشروع', max_length=20)
+    project_type = models.CharField('نوع المشروع', max_length=50)
+    project_count = models.IntegerField('عدد المشاريع', default=0)
+    budgeted_count = models.IntegerField('عدد المشاريع ذات الميزانية', default=0)
+    total_budget = models.DecimalField('إجمالي الميزانيات', max_digits=16, decimal_places=2, default=0)
+    
+    class Meta:
+        abstract = True
+
+
+class RevenueRollupDaily(RevenueRollup):
+    """تجميع يومي للإيرادات حسب تاريخ بداية المشروع"""
+    
+    bucket = models.DateField('اليوم', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'تجميع إيرادات يومي'
+        verbose_name_plural = 'تجميعات الإيرادات اليومية'
+        ordering = ['bucket']
+        unique_together = ['bucket', 'status', 'project_type']
+
+
+class RevenueRollupMonthly(RevenueRollup):
+    """تجميع شهري للإيرادات حسب شهر بداية المشروع"""
+    
+    bucket = models.DateField('الشهر', null=True, blank=True, help_text='أول يوم في الشهر')
+    
+    class Meta:
+        verbose_name = 'تجميع إيرادات شهري'
+        verbose_name_plural = 'تجميعات الإيرادات الشهرية'
+        ordering = ['bucket']
+        unique_together = ['bucket', 'status', 'project_type']
+
+
+class ProjectRevenueEntry(models.Model):
+    """آخر مساهمة مُجمَّعة لكل مشروع، لحساب الفروقات عند التحديث التدريجي"""
+    
+    project_id = models.BigIntegerField('المشروع', unique=True)
+    bucket = models.DateField('تاريخ البداية', null=True, blank=True)
+    status = models.CharField('حالة المشروع', max_length=20)
+    project_type = models.CharField('نوع المشروع', max_length=50)
+    budget = models.DecimalField('الميزانية', max_digits=12, decimal_places=2, null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'مساهمة مشروع في التجميع'
+        verbose_name_plural = 'مساهمات المشاريع في التجميع'
+
+
+class RollupWatermark(models.Model):
+    """علامة آخر تحديث تدريجي لجداول التجميع"""
+    
+    name = models.CharField('الاسم', max_length=100, unique=True)
+    value = models.DateTimeField('آخر تحديث', null=True, blank=True)
+    
+    class Meta:
+        verbose_name = 'علامة التجميع'
+        verbose_name_plural = 'علامات التجميع'
+    
+    def __str__(self):
+        return f"{self.name} - {self.value}"
@@ -0,0 +1,107 @@
+"""
+التخزين المؤقت لنتائج التقارير
+
+يُعاد استخدام تقرير سابق عندما يتطابق النوع والفترة ونطاق الصلاحية وإصدارات
+مصادر البيانات التي يعتمد عليها. تزداد الإصدارات عبر الإشارات عند أي تعديل.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataSourceVersion, Report
+
+PROJECTS = 'projects'
+CLIENTS = 'clients'
+INVOICES = 'invoices'
+PAYMENTS = 'payments'
+# جداول تجميع الإيرادات: تتغير عند تحديثها دورياً لا عند تعديل المشاريع
+REVENUE_ROLLUPS = 'revenue_rollups'
+
+# مصادر البيانات التي يعتمد عليها كل نوع تقرير
+REPORT_SOURCES = {
+    Report.ReportType.PROJECT_PERFORMANCE: (PROJECTS,),
+    Report.ReportType.SALES: (REVENUE_ROLLUPS,),
+    Report.ReportType.CLIENT: (PROJECTS, CLIENTS),
+    Report.ReportType.FINANCIAL: (INVOICES, PAYMENTS, CLIENTS),
+}
+
+# الأدوار التي ترى جميع التقارير (مطابقة لـ ReportViewSet.get_queryset)
+STAFF_ROLES = ('admin', 'employee')
+
+
+def bump(source):
+    """زيادة إصدار مصدر البيانات بعد التزام المعاملة الحالية"""
+    # خارج معاملة الكاتب: صف الإصدار مشترك بين جميع عمليات الكتابة، وتحديثه داخل
+    # المعاملة يجعلها تنتظر قفله حتى تنتهي
+    transaction.on_commit(lambda: _increment(source))
+
+
+def _increment(source):
+    if not DataSourceVersion.objects.filter(source=source).update(version=F('version') + 1):
+        version, created = DataSourceVersion.objects.get_or_create(source=source, defaults={'version': 1})
+        if not created:
+            DataSourceVersion.objects.filter(source=source).update(version=F('version') + 1)
+
+
+def current_versions(sources):
+    """الإصدارات الحالية لمجموعة مصادر في استعلام واحد"""
+    versions = dict(
+        DataSourceVersion.objects.filter(source__in=sources).values_list('source', 'version')
+    )
+    return {source: versions.get(source, 0) for source in sources}
+
+
+def role_scope(user):
+    """نطاق رؤية التقارير للمستخدم"""
+    return 'staff' if user.role in STAFF_ROLES else f'user:{user.pk}'
+
+
+def build_cache_key(report_type, start_date, end_date, user, params=None, sources=None):
+    """مفتاح التقرير؛ يتغير عند تغير أي مصدر بيانات يعتمد عليه"""
+    if sources is None:
+        sources = REPORT_SOURCES.get(report_type, ())
+    payload = {
+        'type': report_type,
+        'start': str(start_date or ''),
+        'end': str(end_date or ''),
+        'scope': role_scope(user),
+        # بعض المقاييس (مثل الأيام المتبقية) تعتمد على تاريخ اليوم
+        'as_of': timezone.now().date().isoformat(),
+        'versions': current_versions(sources),
+        'params': params or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def is_stale(report):
+    """مهمة معلقة أو قيد التوليد تجاوزت المهلة (توقف العامل أو فُقدت المهمة)"""
+    if report.job_status not in (Report.JobStatus.PENDING, Report.JobStatus.RUNNING):
+        return False
+    started = report.started_at or report.created_at
+    return started < timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+
+
+def find_cached(cache_key):
+    """أحدث تقرير مكتمل أو قيد التوليد بنفس المفتاح"""
+    report = (
+        Report.objects.filter(cache_key=cache_key)
+        .exclude(job_status=Report.JobStatus.FAILED)
+        .order_by('-created_at')
+        .first()
+    )
+    if report is not None and is_stale(report):
+        # تعليمها فاشلة حتى يُعاد التوليد بدلاً من إرجاع 202 لمهمة لن تكتمل
+        Report.objects.filter(pk=report.pk, job_status=report.job_status).update(
+            job_status=Report.JobStatus.FAILED,
+            error_message='انتهت مهلة توليد التقرير',
+            finished_at=timezone.now(),
+        )
+        return None
+    return report
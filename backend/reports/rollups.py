@@ -0,0 +1,317 @@
+"""
+جداول تجميع الإيرادات
+
+تُجمَّع ميزانيات المشاريع في جداول يومية وشهرية حسب (الفترة، الحالة، نوع المشروع).
+يقرأ التحديث التدريجي المشاريع التي تغيرت بعد آخر علامة updated_at فقط، ويطبق
+الفرق بين مساهمتها السابقة والحالية، فتقرأ تقارير المبيعات بضع مئات من الصفوف
+بدلاً من جدول المشاريع كاملاً.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils.dateparse import parse_date
+
+from . import report_cache
+from .models import (
+    RevenueRollupDaily, RevenueRollupMonthly, ProjectRevenueEntry, RollupWatermark
+)
+
+WATERMARK_NAME = 'revenue_rollups'
+
+# هامش لالتقاط المشاريع التي حُفظت في معاملات طويلة قبل العلامة بقليل
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+REFRESH_CHUNK_SIZE = 2000
+
+
+def _as_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    parsed = parse_date(str(value))
+    if parsed is None:
+        raise ValueError(f"تاريخ غير صالح: {value}")
+    return parsed
+
+
+def _month_start(day):
+    return day.replace(day=1) if day else None
+
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _add_contribution(daily, monthly, bucket, status, project_type, budget, sign):
+    """إضافة (أو طرح) مساهمة مشروع إلى فروقات الجداول"""
+    delta = (
+        sign,
+        sign if budget is not None else 0,
+        sign * Decimal(budget or 0),
+    )
+    for deltas, key in (
+        (daily, (bucket, status, project_type)),
+        (monthly, (_month_start(bucket), status, project_type)),
+    ):
+        current = deltas[key]
+        deltas[key] = (current[0] + delta[0], current[1] + delta[1], current[2] + delta[2])
+
+
+def _apply_deltas(model, deltas):
+    """تطبيق الفروقات على جدول تجميع بزيادات ذرية F()"""
+    for (bucket, status, project_type), (count, budgeted, total) in deltas.items():
+        if not (count or budgeted or total):
+            continue
+        lookup = {'bucket': bucket, 'status': status, 'project_type': project_type}
+        updates = {
+            'project_count': F('project_count') + count,
+            'budgeted_count': F('budgeted_count') + budgeted,
+            'total_budget': F('total_budget') + total,
+        }
+        if not model.objects.filter(**lookup).update(**updates):
+            model.objects.create(
+                project_count=count, budgeted_count=budgeted, total_budget=total, **lookup
+            )
+
+
+def _new_deltas():
+    return defaultdict(lambda: (0, 0, Decimal('0')))
+
+
+def rebuild():
+    """إعادة بناء جداول التجميع بالكامل من جدول المشاريع"""
+    from projects.models import Project
+
+    projects = Project.objects.order_by()
+    aggregates = {
+        'project_count': Count('id'),
+        'budgeted_count': Count('budget'),
+        'total_budget': Sum('budget'),
+    }
+
+    with transaction.atomic():
+        state, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        watermark = projects.aggregate(latest=Max('updated_at'))['latest']
+
+        RevenueRollupDaily.objects.all().delete()
+        RevenueRollupMonthly.objects.all().delete()
+        ProjectRevenueEntry.objects.all().delete()
+
+        daily = projects.values('start_date', 'status', 'project_type').annotate(**aggregates)
+        RevenueRollupDaily.objects.bulk_create([
+            RevenueRollupDaily(
+                bucket=row['start_date'], status=row['status'], project_type=row['project_type'],
+                project_count=row['project_count'], budgeted_count=row['budgeted_count'],
+                total_budget=row['total_budget'] or 0
+            )
+            for row in daily
+        ], batch_size=500)
+
+        monthly = (
+            projects.annotate(month=TruncMonth('start_date'))
+            .values('month', 'status', 'project_type')
+            .annotate(**aggregates)
+        )
+        RevenueRollupMonthly.objects.bulk_create([
+            RevenueRollupMonthly(
+                bucket=row['month'], status=row['status'], project_type=row['project_type'],
+                project_count=row['project_count'], budgeted_count=row['budgeted_count'],
+                total_budget=row['total_budget'] or 0
+            )
+            for row in monthly
+        ], batch_size=500)
+
+        rows = projects.values_list('id', 'start_date', 'status', 'project_type', 'budget')
+        rows = rows.iterator(chunk_size=REFRESH_CHUNK_SIZE)
+        while True:
+            chunk = list(islice(rows, REFRESH_CHUNK_SIZE))
+            if not chunk:
+                break
+            ProjectRevenueEntry.objects.bulk_create([
+                ProjectRevenueEntry(
+                    project_id=project_id, bucket=start_date, status=status,
+                    project_type=project_type, budget=budget
+                )
+                for project_id, start_date, status, project_type, budget in chunk
+            ])
+
+        state.value = watermark
+        state.save(update_fields=['value'])
+        report_cache.bump(report_cache.REVENUE_ROLLUPS)
+
+
+def refresh():
+    """تحديث تدريجي للمشاريع التي تغيرت بعد آخر علامة"""
+    from projects.models import Project
+
+    with transaction.atomic():
+        state, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        if state.value is None:
+            if not ProjectRevenueEntry.objects.exists():
+                rebuild()
+                return
+            since = None
+        else:
+            since = state.value - WATERMARK_OVERLAP
+
+        changed = Project.objects.order_by()
+        if since is not None:
+            changed = changed.filter(updated_at__gt=since)
+        rows = changed.values_list(
+            'id', 'start_date', 'status', 'project_type', 'budget', 'updated_at'
+        ).iterator(chunk_size=REFRESH_CHUNK_SIZE)
+
+        daily, monthly = _new_deltas(), _new_deltas()
+        latest = state.value
+        changed_entries = 0
+
+        while True:
+            chunk = list(islice(rows, REFRESH_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            entries = {
+                entry.project_id: entry
+                for entry in ProjectRevenueEntry.objects.filter(project_id__in=[row[0] for row in chunk])
+            }
+            to_create, to_update = [], []
+
+            for project_id, start_date, status, project_type, budget, updated_at in chunk:
+                latest = max(latest, updated_at) if latest else updated_at
+                entry = entries.get(project_id)
+                if entry is not None:
+                    if (entry.bucket, entry.status, entry.project_type, entry.budget) == (
+                        start_date, status, project_type, budget
+                    ):
+                        continue
+                    _add_contribution(
+                        daily, monthly, entry.bucket, entry.status, entry.project_type, entry.budget, -1
+                    )
+                    entry.bucket, entry.status = start_date, status
+                    entry.project_type, entry.budget = project_type, budget
+                    to_update.append(entry)
+                else:
+                    to_create.append(ProjectRevenueEntry(
+                        project_id=project_id, bucket=start_date, status=status,
+                        project_type=project_type, budget=budget
+                    ))
+                _add_contribution(daily, monthly, start_date, status, project_type, budget, 1)
+
+            ProjectRevenueEntry.objects.bulk_create(to_create)
+            ProjectRevenueEntry.objects.bulk_update(
+                to_update, ['bucket', 'status', 'project_type', 'budget']
+            )
+            changed_entries += len(to_create) + len(to_update)
+
+        _apply_deltas(RevenueRollupDaily, daily)
+        _apply_deltas(RevenueRollupMonthly, monthly)
+
+        state.value = latest
+        state.save(update_fields=['value'])
+        # تقارير المبيعات المخزنة تُبطل عند تغير الجداول التي تقرأ منها فقط
+        if changed_entries:
+            report_cache.bump(report_cache.REVENUE_ROLLUPS)
+
+
+def remove_project(project_id):
+    """حذف مساهمة مشروع محذوف من جداول التجميع"""
+    with transaction.atomic():
+        # قفل العلامة نفسها التي يقفلها refresh حتى لا يُعيد تحديث جارٍ إضافة المشروع
+        RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+        entry = ProjectRevenueEntry.objects.select_for_update().filter(project_id=project_id).first()
+        if entry is None:
+            return
+        daily, monthly = _new_deltas(), _new_deltas()
+        _add_contribution(daily, monthly, entry.bucket, entry.status, entry.project_type, entry.budget, -1)
+        _apply_deltas(RevenueRollupDaily, daily)
+        _apply_deltas(RevenueRollupMonthly, monthly)
+        entry.delete()
+        report_cache.bump(report_cache.REVENUE_ROLLUPS)
+
+
+def _range_parts(start, end):
+    """تقسيم الفترة إلى أشهر كاملة من الجدول الشهري وأطراف من الجدول اليومي"""
+    if start is None and end is None:
+        return [(RevenueRollupMonthly, Q())]
+
+    first_full = start if start is None or start.day == 1 else _next_month(start)
+    last_excl = _month_start(end + timedelta(days=1)) if end is not None else None
+
+    if first_full is not None and last_excl is not None and first_full >= last_excl:
+        return [(RevenueRollupDaily, Q(bucket__gte=start, bucket__lte=end))]
+
+    parts = []
+    months = Q(bucket__isnull=False)
+    if first_full is not None:
+        months &= Q(bucket__gte=first_full)
+    if last_excl is not None:
+        months &= Q(bucket__lt=last_excl)
+    parts.append((RevenueRollupMonthly, months))
+
+    if start is not None and start < first_full:
+        parts.append((RevenueRollupDaily, Q(bucket__gte=start, bucket__lt=first_full)))
+    if end is not None and last_excl <= end:
+        parts.append((RevenueRollupDaily, Q(bucket__gte=last_excl, bucket__lte=end)))
+    return parts
+
+
+def sales_totals(start=None, end=None):
+    """إجماليات المبيعات لفترة ما من جداول التجميع"""
+    from projects.models import Project
+
+    start, end = _as_date(start), _as_date(end)
+    by_status = defaultdict(lambda: [0, 0, Decimal('0')])
+
+    for model, condition in _range_parts(start, end):
+        rows = model.objects.filter(condition).values('status').annotate(
+            count=Sum('project_count'), budgeted=Sum('budgeted_count'), revenue=Sum('total_budget')
+        ).order_by()
+        for row in rows:
+            totals = by_status[row['status']]
+            totals[0] += row['count'] or 0
+            totals[1] += row['budgeted'] or 0
+            totals[2] += row['revenue'] or 0
+
+    total_projects = sum(totals[0] for totals in by_status.values())
+    budgeted = sum(totals[1] for totals in by_status.values())
+    revenue = sum((totals[2] for totals in by_status.values()), Decimal('0'))
+
+    return {
+        'total_revenue': revenue,
+        'total_projects': total_projects,
+        'completed_projects': by_status[Project.ProjectStatus.COMPLETED][0],
+        'active_projects': by_status[Project.ProjectStatus.ACTIVE][0],
+        'avg_project_value': (revenue / budgeted) if budgeted else Decimal('0'),
+    }
+
+
+def revenue_trend(granularity='month', start=None, end=None, status=None, project_type=None):
+    """سلسلة الإيرادات عبر الزمن للرسوم البيانية"""
+    model = RevenueRollupDaily if granularity == 'day' else RevenueRollupMonthly
+    start, end = _as_date(start), _as_date(end)
+
+    rows = model.objects.filter(bucket__isnull=False)
+    if start is not None:
+        rows = rows.filter(bucket__gte=start if model is RevenueRollupDaily else _month_start(start))
+    if end is not None:
+        rows = rows.filter(bucket__lte=end)
+    if status:
+        rows = rows.filter(status=status)
+    if project_type:
+        rows = rows.filter(project_type=project_type)
+
+    return [
+        {
+            'bucket': row['bucket'],
+            'total_projects': row['count'] or 0,
+            'total_revenue': row['revenue'] or 0,
+        }
+        for row in rows.values('bucket').annotate(
+            count=Sum('project_count'), revenue=Sum('total_budget')
+        ).order_by('bucket')
+    ]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Report, ProjectPerformanceMetric, SalesMetric, ClientMetric
+from . import custom
 
 
 class ProjectPerformanceMetricSerializer(serializers.ModelSerializer):
@@ -54,6 +55,7 @@ class ReportSerializer(serializers.ModelSerializer):
     project_metrics = ProjectPerformanceMetricSerializer(many=True, read_only=True)
     sales_metrics = SalesMetricSerializer(many=True, read_only=True)
     client_metrics = ClientMetricSerializer(many=True, read_only=True)
+    duration_seconds = serializers.FloatField(source='get_duration_seconds', read_only=True, allow_null=True)
     
     class Meta:
         model = Report
@@ -61,11 +63,114 @@ class ReportSerializer(serializers.ModelSerializer):
             'id', 'title', 'report_type', 'description', 
             'created_by', 'created_by_name', 'created_at', 'updated_at',
             'start_date', 'end_date', 'data',
+            'job_status', 'progress', 'started_at', 'finished_at', 'duration_seconds', 'error_message',
             'project_metrics', 'sales_metrics', 'client_metrics'
         ]
-        read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
+        read_only_fields = [
+            'id', 'created_by', 'created_at', 'updated_at',
+            'job_status', 'progress', 'started_at', 'finished_at', 'error_message'
+        ]
     
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
+
+
+class RevenueTrendQuerySerializer(serializers.Serializer):
+    """معاملات اتجاه الإيرادات"""
+    
+    granularity = serializers.ChoiceField(choices=['day', 'month'], default='month', error_messages={
+        'invalid_choice': 'الدقة الزمنية يجب أن تكون day أو month'
+    })
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    status = serializers.CharField(required=False)
+    project_type = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        if data.get('start_date') and data.get('end_date') and data['start_date'] > data['end_date']:
+            raise serializers.ValidationError('تاريخ البداية يجب أن يكون قبل تاريخ النهاية')
+        return data
+
+
+class CustomReportFilterSerializer(serializers.Serializer):
+    """مرشح في مواصفات التقرير المخصص"""
+    
+    field = serializers.CharField()
+    op = serializers.ChoiceField(choices=list(custom.FILTER_OPERATORS))
+    value = serializers.JSONField(required=False, allow_null=True)
+
+
+class CustomReportAggregateSerializer(serializers.Serializer):
+    """دالة تجميعية في مواصفات التقرير المخصص"""
+    
+    func = serializers.ChoiceField(choices=list(custom.AGGREGATES))
+    field = serializers.CharField(default='id')
+    alias = serializers.RegexField(r'^[a-z][a-z0-9_]{0,39}$', required=False)
+
+
+class CustomReportDateBucketSerializer(serializers.Serializer):
+    """التقسيم الزمني في مواصفات التقرير المخصص"""
+    
+    field = serializers.CharField()
+    unit = serializers.ChoiceField(choices=list(custom.DATE_BUCKETS))
+
+
+class CustomReportSpecSerializer(serializers.Serializer):
+    """التحقق من مواصفات التقرير المخصص مقابل الحقول المسموح بها"""
+    
+    source = serializers.ChoiceField(choices=list(custom.SOURCES))
+    group_by = serializers.ListField(child=serializers.CharField(), required=False, max_length=5)
+    date_bucket = CustomReportDateBucketSerializer(required=False)
+    filters = CustomReportFilterSerializer(many=True, required=False, max_length=20)
+    aggregates = CustomReportAggregateSerializer(many=True, allow_empty=False, max_length=10)
+    order_by = serializers.ListField(child=serializers.CharField(), required=False, max_length=5)
+    limit = serializers.IntegerField(required=False, min_value=1, max_value=custom.MAX_ROWS)
+    
+    def validate(self, attrs):
+        source = attrs['source']
+        config = custom.SOURCES[source]
+        errors = {}
+        
+        invalid = [field for field in attrs.get('group_by', []) if field not in config['group_fields']]
+        if invalid:
+            errors['group_by'] = f"حقول تجميع غير مسموح بها: {', '.join(invalid)}"
+        
+        bucket = attrs.get('date_bucket')
+        if bucket and bucket['field'] not in config['date_fields']:
+            errors['date_bucket'] = f"حقل تاريخ غير مسموح به: {bucket['field']}"
+        
+        allowed_filters = custom.filter_fields(source)
+        for item in attrs.get('filters', []):
+            if item['field'] not in allowed_filters:
+                errors['filters'] = f"حقل تصفية غير مسموح به: {item['field']}"
+                break
+            if item['op'] == 'in' and not isinstance(item.get('value'), list):
+                errors['filters'] = f"القيمة يجب أن تكون قائمة للحقل {item['field']}"
+                break
+            try:
+                custom.coerce_filter_value(config['model'], item['field'], item['op'], item.get('value'))
+            except ValueError as exc:
+                errors['filters'] = str(exc)
+                break
+        
+        aliases = []
+        for item in attrs['aggregates']:
+            if item['field'] not in custom.aggregate_fields(source, item['func']):
+                errors['aggregates'] = f"لا يمكن تطبيق {item['func']} على الحقل {item['field']}"
+                break
+            aliases.append(custom.aggregate_alias(item))
+        
+        columns = (['period'] if bucket else []) + attrs.get('group_by', []) + aliases
+        model_fields = {field.name for field in config['model']._meta.get_fields()}
+        if len(set(columns)) != len(columns) or model_fields.intersection(aliases):
+            errors['aggregates'] = 'أسماء الأعمدة مكررة أو تتعارض مع حقول النموذج'
+        
+        invalid = [field for field in attrs.get('order_by', []) if field.lstrip('-') not in columns]
+        if invalid:
+            errors['order_by'] = f"حقول ترتيب غير موجودة في النتيجة: {', '.join(invalid)}"
+        
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from projects.models import Project, Task
+from crm.models import Client
+from billing.models import Invoice, Payment
+from billing.signals import billing_data_changed
+from . import counters, report_cache, rollups
+
+
+@receiver(pre_save, sender=Project)
+def capture_project_counters(sender, instance, update_fields=None, **kwargs):
+    """حفظ القيم السابقة للمشروع لحساب فروقات العدادات"""
+    instance._dashboard_previous = None
+    if not instance.pk:
+        return
+    if update_fields is not None and not set(update_fields) & set(counters.PROJECT_TRACKED_FIELDS):
+        return
+    instance._dashboard_previous = (
+        Project.objects.filter(pk=instance.pk)
+        .values(*counters.PROJECT_TRACKED_FIELDS)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Project)
+def update_project_counters(sender, instance, created, update_fields=None, **kwargs):
+    """تحديث العدادات بعد حفظ المشروع"""
+    if not created and update_fields is not None and not set(update_fields) & set(counters.PROJECT_TRACKED_FIELDS):
+        return
+    current = {field: getattr(instance, field) for field in counters.PROJECT_TRACKED_FIELDS}
+    previous = getattr(instance, '_dashboard_previous', None)
+    new = counters.project_contributions(current)
+    old = counters.project_contributions(previous) if previous else {}
+    counters.apply_deltas(counters.diff_contributions(old, new))
+
+
+@receiver(post_delete, sender=Project)
+def remove_project_counters(sender, instance, **kwargs):
+    """إنقاص العدادات بعد حذف المشروع"""
+    current = {field: getattr(instance, field) for field in counters.PROJECT_TRACKED_FIELDS}
+    counters.apply_deltas(counters.diff_contributions(counters.project_contributions(current), {}))
+    project_id = instance.pk
+    transaction.on_commit(lambda: rollups.remove_project(project_id))
+
+
+@receiver(post_save, sender=Client)
+def add_client_counter(sender, instance, created, **kwargs):
+    """زيادة عداد العملاء عند الإنشاء"""
+    if created:
+        counters.apply_deltas({counters.CLIENTS_TOTAL: 1})
+
+
+@receiver(post_delete, sender=Client)
+def remove_client_counter(sender, instance, **kwargs):
+    """إنقاص عداد العملاء بعد الحذف"""
+    counters.apply_deltas({counters.CLIENTS_TOTAL: -1})
+
+
+@receiver([post_save, post_delete], sender=Project)
+@receiver([post_save, post_delete], sender=Task)
+def bump_projects_version(sender, **kwargs):
+    """تغيير إصدار بيانات المشاريع لإبطال التقارير المخزنة"""
+    report_cache.bump(report_cache.PROJECTS)
+
+
+@receiver(post_delete, sender=Task)
+def touch_task_project(sender, instance, **kwargs):
+    """تحديث updated_at للمشروع عند حذف مهمة حتى يلتقطه التحديث التدريجي للتقارير"""
+    Project.objects.filter(pk=instance.project_id).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Client)
+def bump_clients_version(sender, **kwargs):
+    """تغيير إصدار بيانات العملاء"""
+    report_cache.bump(report_cache.CLIENTS)
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+def bump_invoices_version(sender, **kwargs):
+    """تغيير إصدار بيانات الفواتير"""
+    report_cache.bump(report_cache.INVOICES)
+
+
+@receiver([post_save, post_delete], sender=Payment)
+def bump_payments_version(sender, **kwargs):
+    """تغيير إصدار بيانات المدفوعات"""
+    report_cache.bump(report_cache.PAYMENTS)
+
+
+@receiver(billing_data_changed)
+def bump_billing_versions(sender, models, **kwargs):
+    """تغيير الإصدارات بعد التعديلات الجماعية على الفوترة"""
+    if Invoice in models:
+        report_cache.bump(report_cache.INVOICES)
+    if Payment in models:
+        report_cache.bump(report_cache.PAYMENTS)
@@ -0,0 +1,33 @@
+from celery import shared_task
+
+from . import counters, rollups
+
+
+@shared_task
+def reconcile_dashboard_counters():
+    """مطابقة دورية لعدادات لوحة التحكم مع الجداول الأصلية"""
+    rebuilt = counters.rebuild()
+    return {key: str(value) for key, value in rebuilt.items()}
+
+
+@shared_task(bind=True)
+def generate_report(self, report_id):
+    """توليد تقرير في الخلفية وتسجيل تقدمه على صف التقرير"""
+    from .generators import run_report
+    from .models import Report
+
+    report = Report.objects.get(pk=report_id)
+    run_report(report)
+    return {'report_id': report.id, 'duration_seconds': report.get_duration_seconds()}
+
+
+@shared_task
+def refresh_revenue_rollups():
+    """تحديث تدريجي لجداول تجميع الإيرادات"""
+    rollups.refresh()
+
+
+@shared_task
+def rebuild_revenue_rollups():
+    """إعادة بناء جداول تجميع الإيرادات بالكامل (تلتقط التعديلات التي لا تحدّث updated_at)"""
+    rollups.rebuild()
@@ -1,3 +1,519 @@
+import csv
+import io
+import zipfile
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from billing.models import Invoice, Payment
+from crm.models import Client
+from projects.models import Project, Task
+from . import counters, exports, generators, report_cache, rollups
+from .generators import run_report
+from .models import ClientMetric, DashboardCounter, DataSourceVersion, Report, RollupWatermark
+
+User = get_user_model()
+
+
+def create_project(client, **fields):
+    values = {
+        'title': 'مشروع', 'description': 'وصف', 'project_type': Project.ProjectType.OTHER,
+        'client': client,
+    }
+    values.update(fields)
+    return Project.objects.create(**values)
+
+
+class DashboardCounterTests(TestCase):
+    """فروقات العدادات المطبقة عبر الإشارات تطابق إعادة البناء من الجداول"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='client', email='client@example.com', password='pass',
+            first_name='عميل', last_name='المنصة', role='client'
+        )
+
+    def stored_counters(self):
+        return {
+            key: value
+            for key, value in DashboardCounter.objects.exclude(key=counters.BUILT_MARKER).values_list('key', 'value')
+            if value
+        }
+
+    def test_deltas_match_rebuild(self):
+        first = create_project(self.user, budget=Decimal('1000'), start_date=date(2024, 1, 10))
+        second = create_project(
+            self.user, budget=Decimal('250.50'), start_date=date(2024, 2, 5),
+            status=Project.ProjectStatus.ACTIVE
+        )
+        create_project(self.user)
+        Client.objects.create(first_name='أ', last_name='ب', email='a@example.com', company_name='شركة')
+
+        first.status = Project.ProjectStatus.COMPLETED
+        first.budget = Decimal('1500')
+        first.save()
+        second.start_date = date(2024, 3, 1)
+        second.save(update_fields=['start_date'])
+        # حفظ حقول لا تؤثر على العدادات
+        second.title = 'مشروع معدل'
+        second.save(update_fields=['title'])
+        second.delete()
+
+        incremental = self.stored_counters()
+        self.assertEqual(incremental[counters.PROJECTS_TOTAL], 2)
+        self.assertEqual(incremental[counters.PROJECTS_REVENUE], Decimal('1500'))
+        self.assertEqual(incremental[counters.CLIENTS_TOTAL], 1)
+
+        counters.rebuild()
+        self.assertEqual(self.stored_counters(), incremental)
+
+    def test_rebuild_overwrites_drifted_counters(self):
+        create_project(self.user, budget=Decimal('100'), start_date=date(2024, 5, 1))
+        DashboardCounter.objects.filter(key=counters.PROJECTS_TOTAL).update(value=7)
+        DashboardCounter.objects.create(key=f'{counters.PROJECTS_STARTED_PREFIX}1999-01', value=3)
+
+        counters.rebuild()
+
+        stored = self.stored_counters()
+        self.assertEqual(stored[counters.PROJECTS_TOTAL], 1)
+        self.assertNotIn(f'{counters.PROJECTS_STARTED_PREFIX}1999-01', stored)
+        self.assertEqual(stored[f'{counters.PROJECTS_STARTED_PREFIX}2024-05'], 1)
+
+
+    def test_first_read_rebuilds_counters_created_by_signals(self):
+        # مشاريع سابقة للعدادات، ثم مشروع جديد تنشئ إشارته عداد الإجمالي بفرق 1
+        create_project(self.user, budget=Decimal('100'), status=Project.ProjectStatus.ACTIVE)
+        create_project(self.user, budget=Decimal('200'), status=Project.ProjectStatus.ACTIVE)
+        DashboardCounter.objects.all().delete()
+        create_project(self.user, budget=Decimal('300'))
+        self.assertEqual(DashboardCounter.objects.get(key=counters.PROJECTS_TOTAL).value, 1)
+
+        stats = counters.get_dashboard_stats(date(2024, 1, 1))
+        self.assertEqual(stats['total_projects'], 3)
+        self.assertEqual(stats['active_projects'], 2)
+        self.assertEqual(stats['total_revenue'], Decimal('600'))
+        self.assertTrue(DashboardCounter.objects.filter(key=counters.BUILT_MARKER).exists())
+
+class ReportJobTests(TestCase):
+    """انتقالات حالة مهمة التوليد: في الانتظار ثم قيد التوليد ثم مكتمل أو فاشل"""
+
+    url = '/api/reports/reports/generate_client_report/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='مدير', last_name='المنصة', role='admin'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_report(self):
+        return Report.objects.create(
+            title='تقرير', report_type=Report.ReportType.CLIENT, created_by=self.user,
+            job_status=Report.JobStatus.PENDING
+        )
+
+    def test_run_report_completes(self):
+        report = self.create_report()
+        run_report(report)
+        report.refresh_from_db()
+        self.assertEqual(report.job_status, Report.JobStatus.COMPLETED)
+        self.assertEqual(report.progress, 100)
+        self.assertIsNotNone(report.started_at)
+        self.assertGreaterEqual(report.finished_at, report.started_at)
+
+    def test_run_report_records_failure(self):
+        report = self.create_report()
+
+        def failing(report, progress):
+            progress(40)
+            raise ValueError('تعذر التوليد')
+
+        with self.assertRaises(ValueError):
+            run_report(report, generator=failing)
+        report.refresh_from_db()
+        self.assertEqual(report.job_status, Report.JobStatus.FAILED)
+        self.assertEqual(report.progress, 40)
+        self.assertEqual(report.error_message, 'تعذر التوليد')
+        self.assertIsNotNone(report.finished_at)
+
+    @mock.patch('reports.views.generate_report')
+    def test_async_request_is_queued_and_reused(self, task):
+        task.delay.return_value.id = 'task-1'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'async': 'true'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['job_status'], Report.JobStatus.PENDING)
+        report = Report.objects.get(pk=response.data['job_id'])
+        task.delay.assert_called_once_with(report.pk)
+        self.assertEqual(report.task_id, 'task-1')
+
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual(status.data['job_status'], Report.JobStatus.PENDING)
+        self.assertIsNone(status.data['result_url'])
+
+        # طلب مطابق أثناء التوليد يعيد المهمة نفسها
+        response = self.client.post(self.url, {'async': 'true'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['X-Report-Cache'], 'HIT')
+        self.assertEqual(response.data['job_id'], report.pk)
+
+        run_report(report)
+        status = self.client.get(response.data['status_url'])
+        self.assertEqual(status.data['job_status'], Report.JobStatus.COMPLETED)
+        self.assertIsNotNone(status.data['result_url'])
+
+    @mock.patch('reports.views.generate_report')
+    def test_stale_job_is_failed_and_regenerated(self, task):
+        task.delay.return_value.id = 'task-1'
+        with self.captureOnCommitCallbacks(execute=True):
+            job_id = self.client.post(self.url, {'async': 'true'}).data['job_id']
+        Report.objects.filter(pk=job_id).update(created_at=timezone.now() - timedelta(days=1))
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['id'], job_id)
+        stale = Report.objects.get(pk=job_id)
+        self.assertEqual(stale.job_status, Report.JobStatus.FAILED)
+        self.assertEqual(stale.error_message, 'انتهت مهلة توليد التقرير')
+
+    def test_cached_report_is_reused_until_data_changes(self):
+        first = self.client.post(self.url)
+        self.assertEqual(first.status_code, 201)
+        response = self.client.post(self.url)
+        self.assertEqual(response['X-Report-Cache'], 'HIT')
+        self.assertEqual(response.data['id'], first.data['id'])
+
+        # الإصدار يتغير بعد الالتزام فقط، خارج معاملة الكاتب
+        with self.captureOnCommitCallbacks(execute=True):
+            Client.objects.create(first_name='أ', last_name='ب', email='a@example.com', company_name='شركة')
+            self.assertFalse(DataSourceVersion.objects.filter(source=report_cache.CLIENTS).exists())
+        self.assertEqual(DataSourceVersion.objects.get(source=report_cache.CLIENTS).version, 1)
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['id'], first.data['id'])
+
+
+    def test_sales_report_follows_rollup_refresh(self):
+        url = '/api/reports/reports/generate_sales_report/'
+        project = create_project(self.user, budget=Decimal('100'), start_date=date(2024, 1, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups.refresh()
+        first = self.client.post(url)
+        self.assertEqual(first.status_code, 201)
+
+        # تعديل المشروع لا يغير التقرير قبل تحديث الجداول التي يقرأ منها
+        project.budget = Decimal('300')
+        with self.captureOnCommitCallbacks(execute=True):
+            project.save()
+        self.assertEqual(self.client.post(url)['X-Report-Cache'], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            rollups.refresh()
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(response.data['id'], first.data['id'])
+        metric = Report.objects.get(pk=response.data['id']).sales_metrics.get()
+        self.assertEqual(metric.total_revenue, Decimal('300'))
+
+class RevenueRollupTests(TestCase):
+    """التحديث التدريجي لجداول التجميع بعد العلامة يطابق إعادة البناء الكاملة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='client', email='client@example.com', password='pass',
+            first_name='عميل', last_name='المنصة', role='client'
+        )
+
+    def daily_trend(self):
+        # التحديث التدريجي يترك صفوفاً صفرية للفترات التي خرجت منها المشاريع
+        return [row for row in rollups.revenue_trend(granularity='day') if row['total_projects']]
+
+    def assert_matches_rebuild(self):
+        incremental = rollups.sales_totals()
+        trend = self.daily_trend()
+        rollups.rebuild()
+        self.assertEqual(rollups.sales_totals(), incremental)
+        self.assertEqual(self.daily_trend(), trend)
+        return incremental
+
+    def test_refresh_applies_changes_since_watermark(self):
+        first = create_project(self.user, budget=Decimal('1000'), start_date=date(2024, 1, 10))
+        second = create_project(
+            self.user, budget=Decimal('500'), start_date=date(2024, 1, 20),
+            status=Project.ProjectStatus.ACTIVE
+        )
+        rollups.refresh()
+        watermark = RollupWatermark.objects.get(name=rollups.WATERMARK_NAME).value
+        self.assertEqual(watermark, Project.objects.latest('updated_at').updated_at)
+
+        first.status = Project.ProjectStatus.COMPLETED
+        first.start_date = date(2024, 2, 15)
+        first.save()
+        create_project(self.user, budget=Decimal('250'), start_date=date(2024, 2, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        rollups.refresh()
+
+        self.assertGreater(RollupWatermark.objects.get(name=rollups.WATERMARK_NAME).value, watermark)
+        totals = self.assert_matches_rebuild()
+        self.assertEqual(totals['total_projects'], 2)
+        self.assertEqual(totals['total_revenue'], Decimal('1250'))
+        self.assertEqual(totals['completed_projects'], 1)
+        self.assertEqual(totals['active_projects'], 0)
+
+    def test_partial_months_read_daily_rollups(self):
+        create_project(self.user, budget=Decimal('100'), start_date=date(2024, 1, 31))
+        create_project(self.user, budget=Decimal('200'), start_date=date(2024, 2, 10))
+        create_project(self.user, budget=Decimal('400'), start_date=date(2024, 3, 5))
+        rollups.refresh()
+
+        totals = rollups.sales_totals(date(2024, 1, 31), date(2024, 3, 4))
+        self.assertEqual(totals['total_projects'], 2)
+        self.assertEqual(totals['total_revenue'], Decimal('300'))
+
+
+    def test_trend_endpoint_validates_query(self):
+        create_project(self.user, budget=Decimal('100'), start_date=date(2024, 1, 31))
+        create_project(self.user, budget=Decimal('200'), start_date=date(2024, 2, 10))
+        rollups.refresh()
+        api = APIClient()
+        api.force_authenticate(self.user)
+        url = '/api/reports/reports/revenue_trend/'
+
+        response = api.get(url, {'granularity': 'day', 'start_date': '2024-02-01'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['total_projects'] for row in response.data['results']], [1])
+
+        for params in (
+            {'start_date': '2024-13-45'},
+            {'end_date': 'أمس'},
+            {'start_date': '2024-03-01', 'end_date': '2024-02-01'},
+            {'granularity': 'week'},
+        ):
+            self.assertEqual(api.get(url, params).status_code, 400, params)
+        with self.assertRaises(ValueError):
+            rollups.revenue_trend(start='2024-13-45')
+
+class ProjectPerformanceRefreshTests(TestCase):
+    """التحديث التدريجي لتقرير الأداء يلتقط المهام المعدلة والمحذوفة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='مدير', last_name='المنصة', role='admin'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_task(self, project, **fields):
+        return Task.objects.create(title='مهمة', project=project, created_by=self.user, **fields)
+
+    def test_refresh_picks_up_changed_and_deleted_tasks(self):
+        project = create_project(self.user)
+        other = create_project(self.user)
+        done = self.create_task(project, status=Task.TaskStatus.COMPLETED)
+        pending = self.create_task(project)
+        self.create_task(other)
+
+        report_id = self.client.post('/api/reports/reports/generate_project_performance/').data['id']
+        metric = Report.objects.get(pk=report_id).project_metrics.get(project=project)
+        self.assertEqual((metric.tasks_completed, metric.tasks_total), (1, 2))
+
+        pending.delete()
+        response = self.client.post(f'/api/reports/reports/{report_id}/refresh/')
+        self.assertEqual(response.data['changes'], {'created': 0, 'updated': 1, 'removed': 0})
+        metric.refresh_from_db()
+        self.assertEqual((metric.tasks_completed, metric.tasks_total), (1, 1))
+        self.assertEqual(metric.completion_percentage, 100)
+
+        done.status = Task.TaskStatus.TODO
+        done.save()
+        self.client.post(f'/api/reports/reports/{report_id}/refresh/')
+        metric.refresh_from_db()
+        self.assertEqual(metric.tasks_completed, 0)
+
+
+class CustomReportTests(TestCase):
+    """التقارير المخصصة مقصورة على المصادر المسموح بها"""
+
+    url = '/api/reports/reports/generate_custom_report/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='مدير', last_name='المنصة', role='admin'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_groups_allowed_source(self):
+        create_project(self.user, budget=Decimal('100'), status=Project.ProjectStatus.ACTIVE)
+        create_project(self.user, budget=Decimal('250'), status=Project.ProjectStatus.ACTIVE)
+        create_project(self.user, budget=Decimal('50'))
+        spec = {
+            'source': 'project', 'group_by': ['status'],
+            'aggregates': [{'func': 'count'}, {'func': 'sum', 'field': 'budget'}],
+        }
+        response = self.client.post(self.url, {'spec': spec}, format='json')
+        self.assertEqual(response.status_code, 201)
+        rows = {status: (count, Decimal(total)) for status, count, total in response.data['data']['rows']}
+        self.assertEqual(rows, {'active': (2, Decimal('350')), 'draft': (1, Decimal('50'))})
+
+    def test_rejects_source_without_table(self):
+        spec = {'source': 'post', 'aggregates': [{'func': 'count'}]}
+        response = self.client.post(self.url, {'spec': spec}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('source', response.data)
+
+
+class ReportExportTests(TestCase):
+    """ملفات التصدير: العناوين والصفوف وBOM في CSV وصلاحية ملف XLSX"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='مدير', last_name='المنصة', role='admin'
+        )
+        cls.customer = Client.objects.create(
+            first_name='عميل', last_name='أول', email='client@example.com', company_name='شركة "النور", المحدودة'
+        )
+        cls.report = Report.objects.create(
+            title='تقرير العملاء', report_type=Report.ReportType.CLIENT, created_by=cls.user,
+            job_status=Report.JobStatus.COMPLETED
+        )
+        ClientMetric.objects.create(
+            report=cls.report, client=cls.customer, total_projects=3, active_projects=1,
+            completed_projects=2, total_spent=Decimal('1500.50'), satisfaction_score=Decimal('8.5'),
+            last_project_date=date(2024, 2, 1), notes='عميل دائم\x0b'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, file_type):
+        response = self.client.get(f'/api/reports/reports/{self.report.pk}/export/', {'file_type': file_type})
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_has_bom_headers_and_rows(self):
+        response, content = self.export('csv')
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn(f'report-{self.report.pk}-client.csv', response['Content-Disposition'])
+        self.assertTrue(content.startswith('\ufeff'.encode('utf-8')))
+
+        header, row = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(header[:5], ['العميل', 'إجمالي المشاريع', 'المشاريع النشطة', 'المشاريع المكتملة', 'إجمالي الإنفاق'])
+        self.assertEqual(len(header), len(row))
+        values = dict(zip(header, row))
+        self.assertEqual(values['العميل'], 'شركة "النور", المحدودة')
+        self.assertEqual(values['إجمالي الإنفاق'], '1500.50')
+        self.assertEqual(values['تاريخ آخر مشروع'], '2024-02-01')
+
+    def test_xlsx_is_a_valid_workbook(self):
+        response, content = self.export('xlsx')
+        self.assertEqual(response['Content-Type'], exports.EXPORT_FORMATS['xlsx'][1])
+
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('[Content_Types].xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [
+            [cell.findtext('s:is/s:t', namespaces=namespace) or cell.findtext('s:v', namespaces=namespace)
+             for cell in row.findall('s:c', namespace)]
+            for row in sheet.findall('s:sheetData/s:row', namespace)
+        ]
+        self.assertEqual(len(rows), 2)
+        header, row = rows
+        self.assertEqual(header[0], 'العميل')
+        values = dict(zip(header, row))
+        self.assertEqual(values['العميل'], 'شركة "النور", المحدودة')
+        self.assertEqual(values['إجمالي المشاريع'], '3')
+        # محارف التحكم غير الصالحة في XML تُحذف
+        self.assertEqual(values['ملاحظات'], 'عميل دائم')
+
+    def test_unsupported_format_is_rejected(self):
+        response = self.client.get(f'/api/reports/reports/{self.report.pk}/export/', {'file_type': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FinancialReportTests(TestCase):
+    """إجماليات التقرير المالي حسب الشهر والعميل مع استبعاد المسودات والملغاة"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@example.com', password='pass',
+            first_name='مدير', last_name='المنصة', role='admin'
+        )
+        cls.first = Client.objects.create(first_name='أ', last_name='أ', email='a@example.com', company_name='شركة أ')
+        cls.second = Client.objects.create(first_name='ب', last_name='ب', email='b@example.com', company_name='شركة ب')
+
+    def create_invoice(self, number, client, status, issue_date, total, tax, discount='0'):
+        return Invoice.objects.create(
+            invoice_number=number, client=client, created_by=self.user, status=status,
+            issue_date=issue_date, due_date=issue_date + timedelta(days=30),
+            total_amount=Decimal(total), tax_amount=Decimal(tax), discount_amount=Decimal(discount),
+        )
+
+    def create_payment(self, number, invoice, amount, payment_date, status=Payment.PaymentStatus.COMPLETED):
+        return Payment.objects.create(
+            payment_number=number, invoice=invoice, client=invoice.client, amount=Decimal(amount),
+            payment_method=Payment.PaymentMethod.BANK_TRANSFER, payment_date=payment_date, status=status,
+        )
+
+    def test_totals_by_month_and_client(self):
+        status = Invoice.InvoiceStatus
+        sent = self.create_invoice('INV-A1', self.first, status.SENT, date(2024, 1, 10), '115', '15')
+        paid = self.create_invoice('INV-A2', self.first, status.PAID, date(2024, 2, 5), '230', '30')
+        overdue = self.create_invoice('INV-B1', self.second, status.OVERDUE, date(2024, 1, 20), '100', '10', '5')
+        # المسودات والملغاة وما خارج الفترة لا تدخل في الإجماليات
+        self.create_invoice('INV-A3', self.first, status.DRAFT, date(2024, 1, 15), '999', '99')
+        self.create_invoice('INV-B2', self.second, status.CANCELLED, date(2024, 1, 25), '500', '50')
+        self.create_invoice('INV-B3', self.second, status.SENT, date(2024, 3, 5), '70', '7')
+
+        self.create_payment('PAY-1', paid, '230', date(2024, 2, 10))
+        self.create_payment('PAY-2', sent, '50', date(2024, 1, 12), status=Payment.PaymentStatus.PENDING)
+        # دفعة بعد نهاية الفترة: لا تُحتسب في التحصيل لكنها تخفض المستحق على فاتورتها
+        self.create_payment('PAY-3', overdue, '40', date(2024, 3, 1))
+
+        report = Report.objects.create(
+            title='تقرير مالي', report_type=Report.ReportType.FINANCIAL, created_by=self.user,
+            start_date=date(2024, 1, 1), end_date=date(2024, 2, 29)
+        )
+        generators.generate_financial_report(report)
 
-# Create your tests here.
+        self.assertEqual(report.data['totals'], {
+            'invoices': 3, 'invoiced': '445.00', 'tax': '55.00', 'discount': '5.00',
+            'collected': '230.00', 'outstanding': '175.00',
+        })
+        self.assertEqual(report.data['months']['rows'], [
+            ['2024-01', 2, '215.00', '25.00', '5.00', '0.00', '175.00'],
+            ['2024-02', 1, '230.00', '30.00', '0.00', '230.00', '0.00'],
+        ])
+        self.assertEqual(report.data['clients']['rows'], [
+            [self.first.pk, 'شركة أ', 2, '345.00', '45.00', '0.00', '230.00', '115.00'],
+            [self.second.pk, 'شركة ب', 1, '100.00', '10.00', '5.00', '0.00', '60.00'],
+        ])
@@ -2,17 +2,20 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Sum, Count, Avg, Q, F, Max, Case, When, Value, IntegerField, DecimalField, Prefetch
+from rest_framework.reverse import reverse
+from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from datetime import timedelta
 
 from .models import Report, ProjectPerformanceMetric, SalesMetric, ClientMetric
+from . import counters, custom, exports, report_cache, rollups
+from .generators import run_report, refresh_project_performance
+from .tasks import generate_report
 from .serializers import (
     ReportSerializer, ProjectPerformanceMetricSerializer,
-    SalesMetricSerializer, ClientMetricSerializer
+    SalesMetricSerializer, ClientMetricSerializer, CustomReportSpecSerializer,
+    RevenueTrendQuerySerializer
 )
-from projects.models import Project
-from crm.models import Client
 
 
 class ReportViewSet(viewsets.ModelViewSet):
@@ -29,195 +32,211 @@ class ReportViewSet(viewsets.ModelViewSet):
             return Report.objects.all()
         return Report.objects.filter(created_by=user)
     
-    @action(detail=False, methods=['post'])
-    def generate_project_performance(self, request):
-        """توليد تقرير أداء المشاريع مع تحسين الأداء"""
-        start_date = request.data.get('start_date')
-        end_date = request.data.get('end_date')
+    def _generate(self, request, report_type, title, with_period=True, params=None, sources=None, cacheable=True):
+        """إنشاء التقرير ثم توليده مباشرة أو كمهمة في الخلفية"""
+        start_date = request.data.get('start_date') if with_period else None
+        end_date = request.data.get('end_date') if with_period else None
+        run_async = str(request.data.get('async', '')).lower() in ('true', '1')
+        force = str(request.data.get('force', '')).lower() in ('true', '1')
+        
+        # إعادة التقرير السابق إذا لم تتغير البيانات منذ توليده
+        cache_key = report_cache.build_cache_key(
+            report_type, start_date, end_date, request.user, params=params, sources=sources
+        ) if cacheable else ''
+        cached = None if force or not cacheable else report_cache.find_cached(cache_key)
+        if cached is not None:
+            if cached.job_status == Report.JobStatus.COMPLETED:
+                response = Response(self.get_serializer(cached).data, status=status.HTTP_200_OK)
+            else:
+                response = self._job_accepted(request, cached)
+            response['X-Report-Cache'] = 'HIT'
+            return response
         
-        # إنشاء التقرير
         report = Report.objects.create(
-            title=f"تقرير أداء المشاريع - {timezone.now().strftime('%Y-%m-%d')}",
-            report_type=Report.ReportType.PROJECT_PERFORMANCE,
+            title=f"{title} - {timezone.now().strftime('%Y-%m-%d')}",
+            report_type=report_type,
             created_by=request.user,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            job_status=Report.JobStatus.PENDING,
+            cache_key=cache_key,
+            data={'spec': params} if params else {}
         )
         
-        # جمع بيانات المشاريع مع التصفية الصحيحة
-        projects = Project.objects.all()
-        if start_date:
-            projects = projects.filter(start_date__gte=start_date)
-        if end_date:
-            projects = projects.filter(start_date__lte=end_date)
-        
-        # إنشاء مقاييس لكل مشروع باستخدام bulk_create لتحسين الأداء
-        metrics_to_create = []
-        current_date = timezone.now().date()
-        
-        for project in projects:
-            # حساب الأيام المتبقية
-            if project.end_date:
-                days_remaining = (project.end_date - current_date).days
-            else:
-                days_remaining = 0
-            
-            # حساب نسبة الإنجاز (يمكن تحسينها بناءً على المهام الفعلية)
-            # في المستقبل، يمكن استبدال هذا بمنطق حقيقي
-            completion = 50  # قيمة افتراضية
-            
-            metrics_to_create.append(
-                ProjectPerformanceMetric(
-                    project=project,
-                    report=report,
-                    completion_percentage=completion,
-                    budget_used=project.budget * 0.5,  # قيمة افتراضية
-                    tasks_completed=0,
-                    tasks_total=0,
-                    days_remaining=days_remaining,
-                    is_on_track=days_remaining > 0
-                )
-            )
-        
-        # إنشاء جميع المقاييس دفعة واحدة
-        ProjectPerformanceMetric.objects.bulk_create(metrics_to_create, batch_size=100)
+        # وضع المهمة: التوليد في Celery وإرجاع 202 مع معرف المهمة
+        if run_async:
+            transaction.on_commit(lambda: self._enqueue(report.pk))
+            return self._job_accepted(request, report)
         
+        # الوضع المباشر للتقارير الصغيرة
+        try:
+            run_report(report)
+        except custom.CustomReportTimeout:
+            return Response({
+                'error': 'تجاوز التقرير المهلة المسموح بها، يرجى تضييق المرشحات أو استخدام الوضع غير المتزامن'
+            }, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(report)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    def _job_accepted(self, request, report):
+        return Response({
+            'job_id': report.id,
+            'job_status': report.job_status,
+            'status_url': reverse('report-job-status', args=[report.id], request=request),
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @staticmethod
+    def _enqueue(report_id):
+        result = generate_report.delay(report_id)
+        Report.objects.filter(pk=report_id).update(task_id=result.id or '')
+    
+    @action(detail=False, methods=['post'])
+    def generate_project_performance(self, request):
+        """توليد تقرير أداء المشاريع"""
+        return self._generate(request, Report.ReportType.PROJECT_PERFORMANCE, 'تقرير أداء المشاريع')
+    
     @action(detail=False, methods=['post'])
     def generate_sales_report(self, request):
-        """توليد تقرير المبيعات مع تحسين الأداء"""
-        start_date = request.data.get('start_date')
-        end_date = request.data.get('end_date')
+        """توليد تقرير المبيعات"""
+        return self._generate(request, Report.ReportType.SALES, 'تقرير المبيعات')
+    
+    @action(detail=False, methods=['post'])
+    def generate_client_report(self, request):
+        """توليد تقرير العملاء"""
+        return self._generate(request, Report.ReportType.CLIENT, 'تقرير العملاء', with_period=False)
+    
+    @action(detail=False, methods=['post'])
+    def generate_financial_report(self, request):
+        """توليد التقرير المالي (الفواتير والتحصيل والمستحقات شهرياً وحسب العميل)"""
+        return self._generate(request, Report.ReportType.FINANCIAL, 'التقرير المالي')
+    
+    @action(detail=False, methods=['post'])
+    def generate_custom_report(self, request):
+        """توليد تقرير مخصص من مواصفات مصدر وتجميع ومرشحات ودوال تجميعية"""
+        if not request.user.is_team_member():
+            return Response({
+                'error': 'ليس لديك صلاحية لإنشاء تقارير مخصصة'
+            }, status=status.HTTP_403_FORBIDDEN)
         
-        # إنشاء التقرير
-        report = Report.objects.create(
-            title=f"تقرير المبيعات - {timezone.now().strftime('%Y-%m-%d')}",
-            report_type=Report.ReportType.SALES,
-            created_by=request.user,
-            start_date=start_date,
-            end_date=end_date
-        )
+        serializer = CustomReportSpecSerializer(data=request.data.get('spec') or {})
+        serializer.is_valid(raise_exception=True)
+        spec = serializer.data
         
-        # جمع بيانات المبيعات مع التصفية الصحيحة
-        projects = Project.objects.all()
-        if start_date:
-            projects = projects.filter(start_date__gte=start_date)
-        if end_date:
-            projects = projects.filter(start_date__lte=end_date)
-        
-        # حساب المقاييس الإجمالية باستخدام aggregate واحد
-        stats = projects.aggregate(
-            total_revenue=Sum('budget'),
-            total_projects=Count('id'),
-            completed_projects=Count(
-                'id',
-                filter=Q(status='completed')
-            ),
-            active_projects=Count(
-                'id',
-                filter=Q(status='in_progress')
-            ),
-            avg_project_value=Avg('budget')
+        # المصادر بلا إصدار بيانات (العملاء المحتملون) لا تُخزَّن مؤقتاً
+        version = custom.SOURCES[spec['source']]['version']
+        return self._generate(
+            request, Report.ReportType.CUSTOM, request.data.get('title') or 'تقرير مخصص',
+            with_period=False, params=spec,
+            sources=(version,) if version else (), cacheable=version is not None
         )
+    
+    @action(detail=True, methods=['post'])
+    def refresh(self, request, pk=None):
+        """تحديث تدريجي لتقرير أداء المشاريع: إعادة حساب المشاريع المتغيرة فقط"""
+        report = self.get_object()
+        
+        if report.report_type != Report.ReportType.PROJECT_PERFORMANCE:
+            return Response({
+                'error': 'التحديث التدريجي متاح لتقارير أداء المشاريع فقط'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        SalesMetric.objects.create(
-            report=report,
-            total_revenue=stats['total_revenue'] or 0,
-            total_projects=stats['total_projects'] or 0,
-            completed_projects=stats['completed_projects'] or 0,
-            active_projects=stats['active_projects'] or 0,
-            average_project_value=stats['avg_project_value'] or 0,
-            period_start=start_date or timezone.now().date(),
-            period_end=end_date or timezone.now().date()
+        if report.job_status in [Report.JobStatus.PENDING, Report.JobStatus.RUNNING]:
+            return Response({
+                'error': 'التقرير قيد التوليد حالياً'
+            }, status=status.HTTP_409_CONFLICT)
+        
+        since = report.started_at
+        if since is None or report.job_status == Report.JobStatus.FAILED:
+            # لا يوجد حساب سابق مكتمل: إعادة التوليد بالكامل
+            report.project_metrics.all().delete()
+            changes = run_report(report)
+        else:
+            changes = run_report(
+                report,
+                generator=lambda report, progress: refresh_project_performance(report, since, progress)
+            )
+        
+        report.cache_key = report_cache.build_cache_key(
+            report.report_type, report.start_date, report.end_date, report.created_by
         )
+        report.save(update_fields=['cache_key'])
         
-        serializer = self.get_serializer(report)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        # استجابة مختصرة: إعادة تسلسل جميع المقاييس تلغي فائدة التحديث التدريجي
+        return Response({
+            'id': report.id,
+            'changes': changes,
+            'job_status': report.job_status,
+            'finished_at': report.finished_at,
+            'duration_seconds': report.get_duration_seconds(),
+        })
     
-    @action(detail=False, methods=['post'])
-    def generate_client_report(self, request):
-        """توليد تقرير العملاء مع تحسين الأداء"""
-        # إنشاء التقرير
-        report = Report.objects.create(
-            title=f"تقرير العملاء - {timezone.now().strftime('%Y-%m-%d')}",
-            report_type=Report.ReportType.CLIENT,
-            created_by=request.user
-        )
+    @action(detail=True, methods=['get'])
+    def job_status(self, request, pk=None):
+        """حالة مهمة توليد التقرير وتقدمها وتوقيتها"""
+        report = self.get_object()
+        return Response({
+            'job_id': report.id,
+            'job_status': report.job_status,
+            'progress': report.progress,
+            'started_at': report.started_at,
+            'finished_at': report.finished_at,
+            'duration_seconds': report.get_duration_seconds(),
+            'error_message': report.error_message,
+            'result_url': reverse('report-detail', args=[report.id], request=request)
+            if report.job_status == Report.JobStatus.COMPLETED else None,
+        })
+    
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        """تصدير مقاييس التقرير كملف CSV أو XLSX متدفق"""
+        report = self.get_object()
+        file_type = request.query_params.get('file_type', 'csv')
         
-        # جمع بيانات العملاء باستخدام annotate لتجنب مشكلة N+1
-        clients = Client.objects.annotate(
-            total_projects=Count('project', distinct=True),
-            active_projects=Count(
-                'project',
-                filter=Q(project__status='in_progress'),
-                distinct=True
-            ),
-            completed_projects=Count(
-                'project',
-                filter=Q(project__status='completed'),
-                distinct=True
-            ),
-            total_spent=Sum('project__budget'),
-            last_project_date=Max('project__start_date')
-        )
+        if file_type not in exports.EXPORT_FORMATS:
+            return Response({
+                'error': 'صيغة التصدير غير مدعومة'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # إنشاء مقاييس العملاء باستخدام البيانات المجمعة
-        metrics_to_create = []
-        for client in clients:
-            metrics_to_create.append(
-                ClientMetric(
-                    report=report,
-                    client=client,
-                    total_projects=client.total_projects or 0,
-                    active_projects=client.active_projects or 0,
-                    completed_projects=client.completed_projects or 0,
-                    total_spent=client.total_spent or 0,
-                    satisfaction_score=8.0,  # يمكن تحسينها لاحقًا
-                    last_project_date=client.last_project_date
-                )
-            )
+        model = exports.REPORT_METRIC_MODELS.get(report.report_type)
+        if model is None:
+            return Response({
+                'error': 'لا توجد مقاييس قابلة للتصدير لهذا النوع من التقارير'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # إنشاء جميع المقاييس دفعة واحدة لتحسين الأداء
-        ClientMetric.objects.bulk_create(metrics_to_create, batch_size=100)
+        columns = exports.export_columns(model)
+        headers = [header for _, header in columns]
+        rows = exports.export_rows(model.objects.filter(report=report), columns)
+        writer, content_type = exports.EXPORT_FORMATS[file_type]
         
-        serializer = self.get_serializer(report)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        response = StreamingHttpResponse(writer(headers, rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="report-{report.id}-{report.report_type}.{file_type}"'
+        # تعطيل التخزين المؤقت في nginx لإرسال البيانات فور توليدها
+        response['X-Accel-Buffering'] = 'no'
+        return response
     
     @action(detail=False, methods=['get'])
-    def dashboard_stats(self, request):
-        """إحصائيات لوحة التحكم مع تحسين الأداء"""
-        # إحصائيات مجمعة في استعلام واحد
-        current_month_start = timezone.now().replace(day=1)
-        
-        stats = Project.objects.aggregate(
-            total_projects=Count('id'),
-            active_projects=Count(
-                'id',
-                filter=Q(status='in_progress')
-            ),
-            completed_projects=Count(
-                'id',
-                filter=Q(status='completed')
-            ),
-            total_revenue=Sum('budget'),
-            monthly_projects=Count(
-                'id',
-                filter=Q(start_date__gte=current_month_start)
-            )
-        )
-        
-        total_clients = Client.objects.count()
+    def revenue_trend(self, request):
+        """اتجاه الإيرادات اليومي أو الشهري من جداول التجميع"""
+        query = RevenueTrendQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
         
         return Response({
-            'total_projects': stats['total_projects'] or 0,
-            'active_projects': stats['active_projects'] or 0,
-            'completed_projects': stats['completed_projects'] or 0,
-            'total_clients': total_clients,
-            'total_revenue': stats['total_revenue'] or 0,
-            'monthly_projects': stats['monthly_projects'] or 0
+            'granularity': params['granularity'],
+            'results': rollups.revenue_trend(
+                granularity=params['granularity'],
+                start=params.get('start_date'),
+                end=params.get('end_date'),
+                status=params.get('status'),
+                project_type=params.get('project_type'),
+            )
         })
+    
+    @action(detail=False, methods=['get'])
+    def dashboard_stats(self, request):
+        """إحصائيات لوحة التحكم من العدادات المحدثة تدريجياً"""
+        current_month_start = timezone.now().date().replace(day=1)
+        return Response(counters.get_dashboard_stats(current_month_start))
 
 
 class ProjectPerformanceMetricViewSet(viewsets.ModelViewSet):